@@ -0,0 +1,228 @@
+import asyncio
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterator, List, Optional
+from fastapi import Depends, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from starlette.concurrency import iterate_in_threadpool
+from app.dependencies import get_models
+from ml.config import (
+    ADMISSION_CONTROL, ADMISSION_HIT_CONCURRENCY, ADMISSION_MISS_CONCURRENCY, ADMISSION_HIT_QUEUE,
+    ADMISSION_MISS_QUEUE, ADMISSION_QUEUE_TIMEOUT_S, SERVE_STALE_ON_OVERLOAD, STALE_CACHE_SIZE, STALE_MAX_AGE_S
+)
+from ml.data_ingestion import cache_is_fresh
+
+class Overloaded(Exception):
+    """
+    Raised by admit_request when a lane cannot take a request; turned into a
+    429/503 (or a stale response) by overload_handler.
+    """
+
+    def __init__(self, lane: str, status_code: int, detail: str, retry_after: int, key: str):
+        super().__init__(detail)
+        self.lane = lane
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+        self.key = key
+
+class Lane:
+    """
+    A concurrency limit with a bounded wait queue. Requests beyond max_queue
+    waiters are rejected at once (429); waiters not admitted within timeout
+    seconds are rejected too (503). Only touched from the event loop.
+    """
+
+    def __init__(self, name: str, concurrency: int, max_queue: int, timeout: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.service_time = 0.1 # EWMA of seconds per request, for Retry-After
+
+    def retry_after(self) -> int:
+        # Seconds for the current backlog to drain at the observed service time
+        return max(1, math.ceil((self.active + self.waiting) * self.service_time / max(self.concurrency, 1)))
+
+    async def acquire(self, key: str):
+        if self.semaphore.locked():
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded(self.name, 429, f"Too many queued requests ({self.name} lane).", self.retry_after(), key)
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise Overloaded(self.name, 503, f"Server overloaded ({self.name} lane).", self.retry_after(), key)
+            finally:
+                self.waiting -= 1
+        else:
+            await self.semaphore.acquire()
+        self.active += 1
+        self.admitted += 1
+
+    def release(self, elapsed: float):
+        self.active -= 1
+        self.service_time = 0.8 * self.service_time + 0.2 * elapsed
+        self.semaphore.release()
+
+    def stats(self) -> dict:
+        return {"concurrency": self.concurrency, "max_queue": self.max_queue, "active": self.active,
+                "waiting": self.waiting, "admitted": self.admitted, "rejected": self.rejected,
+                "service_time_s": self.service_time}
+
+class Ticket:
+    """
+    An admitted request. Endpoints pass their payload through remember() so
+    it can be served stale when a later identical request is rejected, and
+    streamed bodies through stream() so the lane slot is held until the
+    last chunk is sent rather than released when the endpoint returns.
+    """
+
+    def __init__(self, controller: "AdmissionController", key: str, lane: Optional[Lane] = None):
+        self.controller = controller
+        self.key = key
+        self.lane = lane
+        self.start = time.perf_counter()
+        self.streaming = False
+
+    def remember(self, payload):
+        self.controller.remember(self.key, payload)
+        return payload
+
+    def stream(self, chunks: Iterator):
+        """
+        Wraps a (blocking) StreamingResponse body; the slot is released once
+        it is exhausted, fails or the client disconnects.
+        """
+        self.streaming = True
+
+        async def body():
+            try:
+                async for chunk in iterate_in_threadpool(chunks):
+                    yield chunk
+            finally:
+                self.release()
+        return body()
+
+    def release(self):
+        # Idempotent: called by admit_request, or by stream() for streamed bodies
+        lane, self.lane = self.lane, None
+        if lane is not None:
+            lane.release(time.perf_counter() - self.start)
+
+class AdmissionController:
+    """
+    Separate lanes for requests served from the fresh CSV cache ("hit") and
+    those that need a network fetch ("miss"), so slow fetches cannot take the
+    threadpool from cheap requests, plus an LRU of the last good response per
+    request for stale serving under overload. Request keys include the
+    serving model version, so responses of an older version are never
+    served; entries older than stale_max_age seconds are not served either.
+    """
+
+    def __init__(self, hit_concurrency: int = ADMISSION_HIT_CONCURRENCY, miss_concurrency: int = ADMISSION_MISS_CONCURRENCY,
+                 hit_queue: int = ADMISSION_HIT_QUEUE, miss_queue: int = ADMISSION_MISS_QUEUE,
+                 timeout: float = ADMISSION_QUEUE_TIMEOUT_S, stale_size: int = STALE_CACHE_SIZE,
+                 stale_max_age: float = STALE_MAX_AGE_S):
+        self.lanes = {
+            "hit": Lane("hit", hit_concurrency, hit_queue, timeout),
+            "miss": Lane("miss", miss_concurrency, miss_queue, timeout),
+        }
+        self.stale_size = stale_size
+        self.stale_max_age = stale_max_age
+        self._stale = OrderedDict()
+        self._lock = threading.Lock() # remember() runs in endpoint threads
+
+    def lane_for(self, tickers: List[str]) -> Lane:
+        hit = bool(tickers) and all(cache_is_fresh(t) for t in tickers)
+        return self.lanes["hit" if hit else "miss"]
+
+    async def admit(self, key: str, tickers: List[str], lane: Optional[str] = None) -> Ticket:
+        lane = self.lanes[lane] if lane is not None else self.lane_for(tickers)
+        await lane.acquire(key)
+        return Ticket(self, key, lane)
+
+    def remember(self, key: str, payload):
+        with self._lock:
+            self._stale[key] = (time.monotonic(), payload)
+            self._stale.move_to_end(key)
+            while len(self._stale) > self.stale_size:
+                self._stale.popitem(last=False)
+
+    def stale_response(self, key: str):
+        with self._lock:
+            entry = self._stale.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.stale_max_age:
+                del self._stale[key]
+                return None
+            return entry[1]
+
+    def stats(self) -> dict:
+        return {name: lane.stats() for name, lane in self.lanes.items()}
+
+controller = AdmissionController()
+
+def _request_tickers(query: dict, body) -> List[str]:
+    # ticker / input_ticker in the query or JSON body, or the keys of a portfolio's holdings
+    tickers = [query[name] for name in ["ticker", "input_ticker"] if name in query]
+    if isinstance(body, dict):
+        if isinstance(body.get("ticker"), str):
+            tickers.append(body["ticker"])
+        if isinstance(body.get("holdings"), dict):
+            tickers.extend(body["holdings"])
+    return tickers
+
+def _admission(lane: Optional[str] = None):
+    async def admit(request: Request, models = Depends(get_models)):
+        """
+        Waits for a slot in the request's lane (or the given one), raising
+        Overloaded when there is none, and frees it once the endpoint returns,
+        or once its body is sent for responses streamed through Ticket.stream.
+        """
+        raw = await request.body()
+        version = models.get("version") if models else None
+        key = f"{version}|{request.url.path}?{sorted(request.query_params.items())}|{raw.decode(errors='replace')}"
+        if not ADMISSION_CONTROL:
+            yield Ticket(controller, key)
+            return
+        try:
+            body = json.loads(raw) if raw else None
+        except ValueError:
+            body = None
+        ticket = await controller.admit(key, _request_tickers(dict(request.query_params), body), lane)
+        try:
+            yield ticket
+        except BaseException:
+            ticket.release()
+            raise
+        else:
+            if not ticket.streaming:
+                ticket.release()
+    return admit
+
+# Dependency for the prediction endpoints: the lane follows the CSV cache state of their tickers
+admit_request = _admission()
+
+# Bulk requests (/export) always take the miss lane, so they cannot crowd out cache hits
+admit_bulk_request = _admission("miss")
+
+async def overload_handler(request: Request, exc: Overloaded):
+    headers = {"Retry-After": str(exc.retry_after)}
+    if SERVE_STALE_ON_OVERLOAD:
+        stale = controller.stale_response(exc.key)
+        if stale is not None:
+            return JSONResponse(jsonable_encoder(stale), headers={**headers, "Warning": '110 - "Response is Stale"'})
+    return JSONResponse({"detail": exc.detail}, status_code=exc.status_code, headers=headers)
@@ -1,4 +1,5 @@
-from ml.models import load_latest_models
+from fastapi import Depends
+from ml.portfolio import EwmaCovariance
 from functools import lru_cache
 
 @lru_cache()
@@ -6,9 +7,42 @@ def get_models():
     """
     Cached model loader.
     """
+    # Imported here: ml.models pulls in the sklearn training stack, which is
+    # only needed once models are actually loaded (see lifespan), not on import
+    from ml.models import load_latest_models
     try:
         return load_latest_models()
     except FileNotFoundError:
         return None
 
+@lru_cache()
+def get_registry():
+    """
+    Process-wide model registry handle; opening one creates the schema.
+    """
+    from ml.registry import ModelRegistry
+    return ModelRegistry()
 
+@lru_cache()
+def get_covariance():
+    """
+    Process-wide EWMA return covariance, updated incrementally by /portfolio_risk.
+    """
+    return EwmaCovariance()
+
+_model_pool = None # (primary models, ModelPool)
+
+def get_model_pool(models = Depends(get_models)):
+    """
+    ModelPool around the primary models (see app/model_pool.py), built once
+    per primary model set together with the configured shadow/canary versions.
+    """
+    global _model_pool
+    if not models:
+        return None
+    if _model_pool is None or _model_pool[0] is not models:
+        from app.model_pool import build_model_pool
+        if _model_pool is not None:
+            _model_pool[1].close()
+        _model_pool = (models, build_model_pool(models))
+    return _model_pool[1]
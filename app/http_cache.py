@@ -0,0 +1,100 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+from fastapi import Depends, Request, Response
+from app.dependencies import get_model_pool, get_registry
+from ml.config import EXPERIMENTS_DIR, HTTP_CACHE_MAX_AGE
+from ml.data_ingestion import cached_last_bar
+from ml.registry import version_created_at
+
+class NotModified(Exception):
+    """
+    Raised by a validator dependency when the client's copy is current;
+    not_modified_handler turns it into an empty 304.
+    """
+
+    def __init__(self, headers: dict):
+        super().__init__("Not Modified")
+        self.headers = headers
+
+async def not_modified_handler(request: Request, exc: NotModified):
+    return Response(status_code=304, headers=exc.headers)
+
+def _as_utc(ts) -> datetime:
+    ts = ts.to_pydatetime() if hasattr(ts, "to_pydatetime") else ts
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
+
+def _version_time(version: Optional[str]) -> Optional[datetime]:
+    if not version or not version.startswith("version_"):
+        return None
+    return _as_utc(datetime.fromisoformat(version_created_at(version)))
+
+def validate(request: Request, response: Response, parts: list, last_modified: Optional[datetime] = None):
+    """
+    Sets ETag (a hash of parts), Last-Modified and Cache-Control on the
+    response and raises NotModified if the request's If-None-Match (or, without
+    it, If-Modified-Since) shows the client already has this representation.
+    """
+    etag = '"' + hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={HTTP_CACHE_MAX_AGE}, must-revalidate"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.replace(microsecond=0), usegmt=True)
+    response.headers.update(headers)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        if etag in tags or "*" in tags:
+            raise NotModified(headers)
+    elif last_modified is not None and request.headers.get("if-modified-since"):
+        try:
+            since = parsedate_to_datetime(request.headers["if-modified-since"])
+        except (TypeError, ValueError):
+            return
+        if last_modified.replace(microsecond=0) <= _as_utc(since):
+            raise NotModified(headers)
+
+async def prediction_validators(request: Request, response: Response, pool = Depends(get_model_pool)):
+    """
+    Validators for per-ticker prediction responses, which only change with a
+    new bar or a new model version: (path, request parameters, last cached bar,
+    serving model version). Runs before admission, features and models. Requests
+    that would fetch new data (no fresh cache) and date-range streams get none.
+    """
+    if pool is None:
+        return
+    raw = await request.body()
+    try:
+        body = json.loads(raw) if raw else {}
+    except ValueError:
+        return
+    params = {**dict(request.query_params), **(body if isinstance(body, dict) else {})}
+    if params.get("start") is not None or params.get("end") is not None:
+        return
+    ticker = params.get("ticker")
+    last_bar = cached_last_bar(ticker) if isinstance(ticker, str) else None
+    if last_bar is None:
+        return
+    version = pool.route(ticker)
+    modified = [t for t in [_as_utc(last_bar), _version_time(version)] if t is not None]
+    validate(request, response, [request.url.path, sorted(params.items()), last_bar.isoformat(), version],
+             max(modified))
+
+def metrics_validators(request: Request, response: Response, registry = Depends(get_registry)):
+    """
+    Validators for /metrics: the latest registered version with a report (the
+    one /metrics serves), or the newest metrics file for experiments that
+    predate the registry. experiments/ is only listed in that fallback.
+    """
+    latest = registry.latest_version(with_report=True)
+    if latest is not None:
+        validate(request, response, ["/metrics", latest["version"], latest["created_at"]],
+                 _as_utc(datetime.fromisoformat(latest["created_at"])))
+        return
+    files = sorted(EXPERIMENTS_DIR.glob("metrics_*.json")) if EXPERIMENTS_DIR.exists() else []
+    if not files:
+        return
+    mtime = files[-1].stat().st_mtime
+    validate(request, response, ["/metrics", files[-1].name, mtime], datetime.fromtimestamp(mtime, timezone.utc))
@@ -2,21 +2,49 @@ from fastapi import FastAPI, HTTPException, Depends
 from app.schemas import (
     RiskPredictionRequest, RiskPredictionResponse,
     ReturnPredictionRequest, ReturnPredictionResponse,
-    RecommendationRequest, RecommendationResponse
+    HorizonPredictionRequest, HorizonPredictionResponse,
+    PortfolioRiskRequest, PortfolioRiskResponse,
+    RecommendationRequest, RecommendationResponse,
+    ProfileRequest, ExportRequest
 )
-from app.dependencies import get_models
+from app.dependencies import get_models, get_covariance, get_model_pool, get_registry
+from app.admission import Overloaded, admit_request, admit_bulk_request, overload_handler, controller as admission
+from app.http_cache import NotModified, not_modified_handler, prediction_validators, metrics_validators
+from app.profiling import profiled, profiler, require_admin, start_session
 from app.services import PredictionService
-from ml.config import EXPERIMENTS_DIR, TICKERS
+from ml.export import FORMATS, coalesce, export_schema, iter_encoded
+from ml.universe import get_tickers
+from ml.config import EXPERIMENTS_DIR, EXPORT_MAX_TICKERS, WARMUP_ON_STARTUP
 import json
 import os
+import time
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
 
 from contextlib import asynccontextmanager
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
+    # Startup: register version directories copied into models/ while the API was down
+    try:
+        get_registry().sync_from_disk()
+    except Exception as e:
+        print(f"Registry sync failed: {e}")
+    if WARMUP_ON_STARTUP:
+        # Load (and cache) models and run one dummy prediction now,
+        # instead of on the first request
+        start = time.perf_counter()
+        models = get_models()
+        if models:
+            try:
+                # Primary plus any shadow/canary versions
+                get_model_pool(models).warm_up()
+            except Exception as e:
+                print(f"Model warm-up failed: {e}")
+            print(f"Models loaded and warmed up in {time.perf_counter() - start:.2f}s")
+        else:
+            print("No trained models found; prediction endpoints return 503.")
+
     print("\n" + "="*50)
     print("🚀  RiskGuard AI is running!")
     print("👉  Access here: http://localhost:8000")
@@ -24,6 +52,9 @@ async def lifespan(app: FastAPI):
     yield
     # Shutdown
     print("Shutting down...")
+    pool = get_model_pool(get_models())
+    if pool is not None:
+        pool.close()
 
 app = FastAPI(
     title="Stock Risk Forecasting API",
@@ -32,6 +63,11 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Over-budget requests get 429/503 with Retry-After, or their last good response
+app.add_exception_handler(Overloaded, overload_handler)
+# Conditional requests whose validators still match get an empty 304
+app.add_exception_handler(NotModified, not_modified_handler)
+
 # Mount Static Files (Frontend)
 # Ensure directory exists to prevent startup error
 os.makedirs("app/static", exist_ok=True)
@@ -41,64 +77,188 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 async def read_root():
     return RedirectResponse(url="/static/index.html")
 
+def _is_range_request(request) -> bool:
+    if request.as_of is not None and (request.start is not None or request.end is not None):
+        raise HTTPException(status_code=400, detail="Use either as_of or start/end, not both.")
+    if request.start is not None and request.end is not None and request.start > request.end:
+        raise HTTPException(status_code=400, detail="start must not be after end.")
+    return request.start is not None or request.end is not None
+
+def _ndjson(chunks):
+    # One write per scored chunk; each record is one JSON line
+    for chunk in chunks:
+        yield "".join(json.dumps(record) + "\n" for record in chunk)
+
 @app.post("/predict_risk", response_model=RiskPredictionResponse)
-def predict_risk(request: RiskPredictionRequest, models = Depends(get_models)):
+@profiled
+def predict_risk(request: RiskPredictionRequest, models = Depends(get_models), pool = Depends(get_model_pool),
+                 cache = Depends(prediction_validators), ticket = Depends(admit_request)):
     if not models:
         raise HTTPException(status_code=503, detail="Models not loaded")
+    is_range = _is_range_request(request)
     
-    service = PredictionService(models)
     try:
-        result = service.predict_risk(request.ticker)
-        return {
+        if is_range:
+            # Ranges are served by the primary version only
+            chunks = pool.service().iter_risk_range(request.ticker, request.start, request.end)
+            # The lane slot is held until the last chunk is sent
+            return StreamingResponse(ticket.stream(_ndjson(chunks)), media_type="application/x-ndjson")
+
+        # Routed to the primary or a canary; shadows score the same features in the background
+        result = pool.predict_risk(request.ticker, as_of=request.as_of)
+        return ticket.remember({
             "ticker": request.ticker,
             "risk_class": result["risk_class"],
             "probabilities": result["probabilities"],
             "volatility": result["volatility"],
             "confidence_score": result["confidence_score"],
-            "recommendation": result["recommendation"]
-        }
+            "recommendation": result["recommendation"],
+            "date": result.get("date")
+        })
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/predict_return", response_model=ReturnPredictionResponse)
-def predict_return(request: ReturnPredictionRequest, models = Depends(get_models)):
+@profiled
+def predict_return(request: ReturnPredictionRequest, models = Depends(get_models), pool = Depends(get_model_pool),
+                   cache = Depends(prediction_validators), ticket = Depends(admit_request)):
     if not models:
         raise HTTPException(status_code=503, detail="Models not loaded")
+    is_range = _is_range_request(request)
         
+    try:
+        if is_range:
+            chunks = pool.service().iter_return_range(request.ticker, request.start, request.end)
+            return StreamingResponse(ticket.stream(_ndjson(chunks)), media_type="application/x-ndjson")
+
+        pred, date = pool.predict_return(request.ticker, as_of=request.as_of)
+        return ticket.remember({
+            "ticker": request.ticker,
+            "predicted_next_day_return": pred,
+            "date": date
+        })
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/predict_horizons", response_model=HorizonPredictionResponse)
+@profiled
+def predict_horizons(request: HorizonPredictionRequest, models = Depends(get_models),
+                     cache = Depends(prediction_validators), ticket = Depends(admit_request)):
+    if not models:
+        raise HTTPException(status_code=503, detail="Models not loaded")
+
     service = PredictionService(models)
     try:
-        pred = service.predict_return(request.ticker)
-        return {
+        return ticket.remember({
             "ticker": request.ticker,
-            "predicted_next_day_return": pred
-        }
+            "horizons": service.predict_horizons(request.ticker)
+        })
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/portfolio_risk", response_model=PortfolioRiskResponse)
+@profiled
+def portfolio_risk(request: PortfolioRiskRequest, models = Depends(get_models), covariance = Depends(get_covariance),
+                   ticket = Depends(admit_request)):
+    if not models:
+        raise HTTPException(status_code=503, detail="Models not loaded")
+
+    service = PredictionService(models)
+    try:
+        return ticket.remember(service.portfolio_risk(request.holdings, covariance))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/recommend_similar") # GET for simpler query
-def recommend_similar(ticker: str, risk_preference: str = None, models = Depends(get_models)):
+@profiled
+def recommend_similar(ticker: str, risk_preference: str = None, k: int = 5, models = Depends(get_models),
+                      cache = Depends(prediction_validators), ticket = Depends(admit_request)):
     if not models:
         raise HTTPException(status_code=503, detail="Models not loaded")
         
     service = PredictionService(models)
     try:
-        recs = service.recommend_similar(ticker, risk_preference)
-        return {
+        recs = service.recommend_similar(ticker, risk_preference, k)
+        return ticket.remember({
             "input_ticker": ticker,
             "recommendations": recs
-        }
+        })
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/export")
+def export(request: ExportRequest, models = Depends(get_models), ticket = Depends(admit_bulk_request)):
+    # Features and predictions for many tickers as one Arrow IPC stream or Parquet file,
+    # encoded batch by batch while the tickers are processed. Admitted through the miss lane,
+    # whose slot is held until the file is sent.
+    if not models:
+        raise HTTPException(status_code=503, detail="Models not loaded")
+    if request.format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {list(FORMATS)}")
+    if request.start is not None and request.end is not None and request.start > request.end:
+        raise HTTPException(status_code=400, detail="start must not be after end.")
+    tickers = request.tickers or get_tickers()
+    if len(tickers) > EXPORT_MAX_TICKERS:
+        raise HTTPException(status_code=400, detail=f"At most {EXPORT_MAX_TICKERS} tickers per export.")
+
+    service = PredictionService(models)
+    try:
+        schema = export_schema(service.export_features, request.predictions)
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    frames = service.iter_export(tickers, request.start, request.end, request.predictions)
+    filename = f"export.{'arrows' if request.format == 'arrow' else 'parquet'}"
+    return StreamingResponse(ticket.stream(iter_encoded(coalesce(frames), schema, request.format)),
+                             media_type=FORMATS[request.format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.get("/model_pool")
+def model_pool(pool = Depends(get_model_pool)):
+    # Served/shadow-scored counts, prediction deltas and latency per loaded version
+    if pool is None:
+        raise HTTPException(status_code=503, detail="Models not loaded")
+    return {"primary": pool.primary_version, "versions": pool.summary()}
+
+@app.get("/admission")
+def admission_stats():
+    # Active/waiting/admitted/rejected counts per lane
+    return admission.stats()
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+def start_profile(request: ProfileRequest):
+    # Profile the next N prediction requests or T seconds; the report is written to experiments/profiles/
+    return start_session(request.mode, request.requests, request.seconds)
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+def profile_status():
+    return profiler.status()
+
+@app.delete("/admin/profile", dependencies=[Depends(require_admin)])
+def stop_profile():
+    # Ends the running session early and returns its report
+    report = profiler.stop()
+    if report is None:
+        raise HTTPException(status_code=404, detail="No profiling session or report")
+    return report
+
 @app.get("/metrics")
-def get_metrics():
-    # Find latest metrics file
+def get_metrics(cache = Depends(metrics_validators), registry = Depends(get_registry)):
+    # Latest metrics come from the registry index
+    metrics = registry.latest_metrics()
+    if metrics is not None:
+        return metrics
+
+    # Fallback for metrics written before the registry existed
     if not EXPERIMENTS_DIR.exists():
          raise HTTPException(status_code=404, detail="No experiments found")
          
@@ -110,7 +270,3 @@ def get_metrics():
     with open(latest, "r") as f:
         data = json.load(f)
     return data
-
-
-
-
@@ -0,0 +1,203 @@
+import json
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+from app.services import PredictionService
+from ml.config import SHADOW_WORKERS, SHADOW_LOG_FILE
+
+def _models(service: PredictionService, rows) -> tuple:
+    # The version's (regressor, classifier) for the request's ticker, segment models included
+    if "ticker" in rows.columns:
+        return service.models_for(rows["ticker"].iloc[0])
+    return service.regressor, service.classifier
+
+def _risk_vector(service: PredictionService, rows) -> np.ndarray:
+    return np.asarray(_models(service, rows)[1].predict_proba(rows[service.features_list]), dtype=np.float64)[0]
+
+def _return_vector(service: PredictionService, rows) -> np.ndarray:
+    return np.asarray(_models(service, rows)[0].predict(rows[service.features_list]), dtype=np.float64)[:1]
+
+# How each endpoint scores an already computed feature row, as a vector comparable across versions
+SCORERS = {"predict_risk": _risk_vector, "predict_return": _return_vector}
+
+class ModelPool:
+    """
+    The primary model version plus any shadow and canary versions, all loaded
+    at once. A request's features are computed once, by the version that
+    serves it; every other version scores the same rows in a background
+    thread after the response is produced, and the per-version prediction
+    delta and scoring latency are appended to log_path and aggregated in stats.
+    Canaries also serve a share of traffic: tickers are hashed into buckets,
+    so a ticker always lands on the same version.
+    shadows: {version: models}; canaries: {version: (models, traffic_fraction)}.
+    """
+
+    def __init__(self, primary: dict, primary_version: str = "primary", shadows: dict = None,
+                 canaries: dict = None, log_path: Path = None, workers: int = SHADOW_WORKERS):
+        shadows, canaries = shadows or {}, canaries or {}
+        self.primary_version = primary_version
+        self.roles = {primary_version: "primary"}
+        self.roles.update({v: "shadow" for v in shadows})
+        self.roles.update({v: "canary" for v in canaries})
+        models = {primary_version: primary, **shadows, **{v: m for v, (m, _) in canaries.items()}}
+        self.services = {v: PredictionService(m) for v, m in models.items()}
+
+        self._routes, bound = [], 0.0
+        for version, (_, fraction) in canaries.items():
+            bound += fraction
+            self._routes.append((bound, version))
+        if bound > 1:
+            raise ValueError(f"Canary traffic fractions add up to {bound:.2f} > 1.")
+
+        self.log_path = Path(log_path) if log_path is not None else SHADOW_LOG_FILE
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="shadow") if len(self.services) > 1 else None
+        self._lock = threading.Lock()
+        self.stats = {
+            v: {"role": role, "served": 0, "shadow_scored": 0, "errors": 0,
+                "delta_sum": 0.0, "delta_max": 0.0, "latency_ms_sum": 0.0}
+            for v, role in self.roles.items()
+        }
+
+    @property
+    def active(self) -> bool:
+        # More than the primary loaded
+        return self._executor is not None
+
+    def route(self, key: str) -> str:
+        """
+        Version that serves a request for key (a ticker).
+        """
+        if self._routes:
+            bucket = zlib.crc32(key.encode()) % 10000 / 10000
+            for bound, version in self._routes:
+                if bucket < bound:
+                    return version
+        return self.primary_version
+
+    def service(self, version: str = None) -> PredictionService:
+        return self.services[version or self.primary_version]
+
+    def warm_up(self):
+        for service in self.services.values():
+            service.warm_up()
+
+    def predict_risk(self, ticker: str, as_of=None) -> dict:
+        version = self.route(ticker)
+        service = self.services[version]
+        start = time.perf_counter()
+        rows = service._get_latest_features(ticker, return_all=True, as_of=as_of)
+        result = service.predict_risk(ticker, as_of=as_of, rows=rows)
+        served = np.fromiter(result["probabilities"].values(), dtype=np.float64)
+        self.observe("predict_risk", ticker, version, rows, served, time.perf_counter() - start)
+        return result
+
+    def predict_return(self, ticker: str, as_of=None):
+        """
+        Returns (prediction, date); date is None for the latest bar.
+        """
+        version = self.route(ticker)
+        service = self.services[version]
+        start = time.perf_counter()
+        rows = service._get_latest_features(ticker, return_all=True, as_of=as_of)
+        if as_of is not None:
+            pred, date = service.predict_return_as_of(ticker, as_of, rows=rows)
+        else:
+            pred, date = service.predict_return(ticker, rows=rows), None
+        self.observe("predict_return", ticker, version, rows, np.array([pred]), time.perf_counter() - start)
+        return pred, date
+
+    def observe(self, endpoint: str, key: str, served_version: str, rows, served_vector: np.ndarray, latency_s: float):
+        """
+        Counts the served request and queues the comparison against every
+        other version; returns the Future (None without other versions).
+        """
+        with self._lock:
+            self.stats[served_version]["served"] += 1
+        if self._executor is None:
+            return None
+        return self._executor.submit(self._compare, endpoint, key, served_version, rows, served_vector, latency_s)
+
+    def _compare(self, endpoint, key, served_version, rows, served_vector, latency_s):
+        records = []
+        for version, service in self.services.items():
+            if version == served_version:
+                continue
+            start = time.perf_counter()
+            try:
+                vector = SCORERS[endpoint](service, rows)
+            except Exception as e:
+                with self._lock:
+                    self.stats[version]["errors"] += 1
+                print(f"Shadow scoring failed for {version}: {e}")
+                continue
+            latency_ms = (time.perf_counter() - start) * 1000
+            delta = float(np.abs(vector - served_vector).max()) if vector.shape == served_vector.shape else None
+            with self._lock:
+                stats = self.stats[version]
+                stats["shadow_scored"] += 1
+                stats["latency_ms_sum"] += latency_ms
+                if delta is not None:
+                    stats["delta_sum"] += delta
+                    stats["delta_max"] = max(stats["delta_max"], delta)
+            records.append({
+                "timestamp": datetime.now().isoformat(), "endpoint": endpoint, "ticker": key,
+                "served_version": served_version, "served_latency_ms": latency_s * 1000,
+                "version": version, "role": self.roles[version], "delta": delta, "latency_ms": latency_ms
+            })
+        if records:
+            with self._lock:
+                self.log_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.log_path, "a") as f:
+                    f.writelines(json.dumps(r) + "\n" for r in records)
+        return records
+
+    def summary(self) -> dict:
+        """
+        Per-version counters with mean delta to the serving version and mean scoring latency.
+        """
+        with self._lock:
+            summary = {}
+            for version, stats in self.stats.items():
+                n = stats["shadow_scored"]
+                summary[version] = {
+                    "role": stats["role"], "served": stats["served"], "shadow_scored": n,
+                    "errors": stats["errors"], "delta_max": stats["delta_max"],
+                    "delta_mean": stats["delta_sum"] / n if n else None,
+                    "latency_ms_mean": stats["latency_ms_sum"] / n if n else None,
+                }
+        return summary
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+def build_model_pool(primary: dict, shadow_versions=None, canary_versions=None, registry=None) -> ModelPool:
+    """
+    Pool around the already loaded primary models, loading the configured
+    shadow (SHADOW_VERSIONS) and canary (CANARY_VERSIONS) versions from the registry.
+    """
+    from ml.config import SHADOW_VERSIONS, CANARY_VERSIONS
+    shadow_versions = SHADOW_VERSIONS if shadow_versions is None else shadow_versions
+    canary_versions = CANARY_VERSIONS if canary_versions is None else canary_versions
+    if not shadow_versions and not canary_versions:
+        return ModelPool(primary, primary.get("version", "primary"))
+
+    from ml.models import load_models
+    from ml.registry import ModelRegistry
+    registry = registry or ModelRegistry()
+    latest = registry.latest_version()
+    primary_version = primary.get("version") or (latest["version"] if latest else "primary")
+
+    def load(version):
+        record = registry.get_version(version)
+        if record is None or record["deleted"] or not record["path"].exists():
+            raise FileNotFoundError(f"Model version {version} not found.")
+        return load_models(record["path"])
+
+    shadows = {v: load(v) for v in shadow_versions if v != primary_version}
+    canaries = {v: (load(v), f) for v, f in canary_versions.items() if v != primary_version}
+    return ModelPool(primary, primary_version, shadows, canaries)
@@ -0,0 +1,189 @@
+import cProfile
+import functools
+import io
+import pstats
+import secrets
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Optional
+from fastapi import Header, HTTPException
+from ml.config import ADMIN_TOKEN, PROFILE_DIR, PROFILE_MAX_REQUESTS, PROFILE_MAX_SECONDS, PROFILE_TOP_N, PROFILE_TRACE_FRAMES
+
+MODES = ["cpu", "memory"]
+
+class ProfileSession:
+    """
+    Profiles the next `requests` requests or `seconds` seconds, whichever ends
+    first. "cpu": each request runs under its own cProfile.Profile (cProfile
+    only sees the thread that enabled it) and the stats are merged as requests
+    finish. "memory": tracemalloc traces every allocation from start() until
+    the session ends, and the report groups them by allocation site.
+    """
+
+    def __init__(self, mode: str, requests: int, seconds: float):
+        self.mode = mode
+        self.max_requests = requests
+        self.seconds = seconds
+        self.id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.started = time.monotonic()
+        self.requests = 0
+        self.stats: Optional[pstats.Stats] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.mode == "memory":
+            tracemalloc.start(PROFILE_TRACE_FRAMES)
+
+    def expired(self) -> bool:
+        return self.requests >= self.max_requests or time.monotonic() - self.started >= self.seconds
+
+    def run(self, func, *args, **kwargs):
+        if self.mode != "cpu":
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.requests += 1
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            with self._lock:
+                self.requests += 1
+                if self.stats is None:
+                    self.stats = pstats.Stats(profile)
+                else:
+                    self.stats.add(profile)
+
+    def finish(self) -> dict:
+        """
+        Writes the report files to PROFILE_DIR and returns a summary with the top entries.
+        """
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        stem = PROFILE_DIR / f"profile_{self.id}_{self.mode}"
+        report = {"id": self.id, "mode": self.mode, "requests": self.requests,
+                  "duration_s": round(time.monotonic() - self.started, 3), "files": []}
+        if self.mode == "cpu":
+            report["top"] = []
+            if self.stats is not None:
+                # Binary pstats (snakeviz, gprof2dot, flameprof) and a readable listing
+                self.stats.dump_stats(f"{stem}.pstats")
+                text = io.StringIO()
+                self.stats.stream = text
+                self.stats.sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+                with open(f"{stem}.txt", "w") as f:
+                    f.write(text.getvalue())
+                report["files"] = [f"{stem}.pstats", f"{stem}.txt"]
+                report["top"] = _top_functions(self.stats)
+        else:
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            ])
+            tracemalloc.stop()
+            # Folded stacks ("outer;...;inner bytes"), the input format of flamegraph.pl / speedscope
+            with open(f"{stem}.folded", "w") as f:
+                for stat in snapshot.statistics("traceback"):
+                    # Traceback frames run from the oldest to the most recent call
+                    f.write(";".join(f"{fr.filename}:{fr.lineno}" for fr in stat.traceback) + f" {stat.size}\n")
+            report["files"] = [f"{stem}.folded"]
+            report["top"] = [
+                {"site": f"{s.traceback[0].filename}:{s.traceback[0].lineno}", "size_kb": round(s.size / 1024, 1), "count": s.count}
+                for s in snapshot.statistics("lineno")[:PROFILE_TOP_N]
+            ]
+        return report
+
+    def status(self) -> dict:
+        return {"id": self.id, "mode": self.mode, "requests": self.requests, "max_requests": self.max_requests,
+                "elapsed_s": round(time.monotonic() - self.started, 3), "seconds": self.seconds}
+
+def _top_functions(stats: pstats.Stats) -> list:
+    # (file, line, function) -> (primitive calls, calls, tottime, cumtime, callers)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP_N]
+    return [{"function": f"{file}:{line}({name})", "ncalls": nc, "tottime": round(tt, 6), "cumtime": round(ct, 6)}
+            for (file, line, name), (_, nc, tt, ct, _) in rows]
+
+class Profiler:
+    """
+    At most one session at a time. Endpoints wrapped with profiled() check
+    `session` and call straight through while it is None.
+    """
+
+    def __init__(self):
+        self.session: Optional[ProfileSession] = None
+        self.last_report: Optional[dict] = None
+        self._lock = threading.Lock()
+
+    def start(self, mode: str, requests: int, seconds: float) -> dict:
+        with self._lock:
+            self._expire()
+            if self.session is not None:
+                raise HTTPException(status_code=409, detail="A profiling session is already running.")
+            session = ProfileSession(mode, requests, seconds)
+            session.start()
+            self.session = session
+            return session.status()
+
+    def stop(self) -> Optional[dict]:
+        with self._lock:
+            session, self.session = self.session, None
+            if session is not None:
+                self.last_report = session.finish()
+            return self.last_report
+
+    def status(self) -> dict:
+        with self._lock:
+            self._expire()
+            return {"active": self.session.status() if self.session else None, "last_report": self.last_report}
+
+    def _expire(self):
+        # Time-limited sessions end on the next request or status check after their deadline
+        if self.session is not None and self.session.expired():
+            session, self.session = self.session, None
+            self.last_report = session.finish()
+
+    def run(self, func, *args, **kwargs):
+        session = self.session
+        if session is None:
+            return func(*args, **kwargs)
+        try:
+            return session.run(func, *args, **kwargs)
+        finally:
+            if session.expired():
+                with self._lock:
+                    if self.session is session:
+                        self._expire()
+
+profiler = Profiler()
+
+def profiled(func):
+    """
+    Decorator for sync endpoints: runs the call under the active profiling
+    session, if any. FastAPI runs sync endpoints in its threadpool, so the
+    profile covers the request's own thread (feature computation, model
+    scoring, data loading); background shadow scoring and streamed range
+    bodies run elsewhere and are not included.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if profiler.session is None:
+            return func(*args, **kwargs)
+        return profiler.run(func, *args, **kwargs)
+    return wrapper
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    # Admin endpoints do not exist unless ADMIN_TOKEN is configured
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def start_session(mode: str, requests: int, seconds: float) -> dict:
+    if mode not in MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {MODES}")
+    if not 0 < requests <= PROFILE_MAX_REQUESTS or not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"requests must be in 1..{PROFILE_MAX_REQUESTS} "
+                                                    f"and seconds in (0, {PROFILE_MAX_SECONDS}]")
+    return profiler.start(mode, requests, seconds)
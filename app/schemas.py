@@ -1,8 +1,12 @@
+from datetime import date
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional
 
 class RiskPredictionRequest(BaseModel):
     ticker: str
+    as_of: Optional[date] = None # Score the last bar on or before this date
+    start: Optional[date] = None # With end: stream predictions for every bar in the range (NDJSON)
+    end: Optional[date] = None
 
 class RiskPredictionResponse(BaseModel):
     ticker: str
@@ -11,13 +15,46 @@ class RiskPredictionResponse(BaseModel):
     volatility: float
     confidence_score: float
     recommendation: str
+    date: Optional[str] = None # Bar that was scored (as_of requests)
     
 class ReturnPredictionRequest(BaseModel):
     ticker: str
+    as_of: Optional[date] = None
+    start: Optional[date] = None
+    end: Optional[date] = None
 
 class ReturnPredictionResponse(BaseModel):
     ticker: str
     predicted_next_day_return: float
+    date: Optional[str] = None
+    
+class HorizonPredictionRequest(BaseModel):
+    ticker: str
+
+class HorizonPrediction(BaseModel):
+    horizon_days: int
+    predicted_return: float
+    risk_class: str
+    probabilities: Dict[str, float]
+    confidence_score: float
+
+class HorizonPredictionResponse(BaseModel):
+    ticker: str
+    horizons: List[HorizonPrediction]
+    
+class PortfolioRiskRequest(BaseModel):
+    holdings: Dict[str, float] # {ticker: portfolio weight}
+
+class RiskContribution(BaseModel):
+    ticker: str
+    weight: float
+    risk_contribution: float
+    volatility: float
+
+class PortfolioRiskResponse(BaseModel):
+    volatility: float
+    risk_class: str
+    contributions: List[RiskContribution]
     
 class RecommendationRequest(BaseModel):
     ticker: str
@@ -25,6 +62,18 @@ class RecommendationRequest(BaseModel):
 
 class RecommendationResponse(BaseModel):
     input_ticker: str
-    recommendations: List[Dict[str, str]] # List of {ticker: "AAPL", risk_class: "Low"}
+    recommendations: List[Dict[str, Any]] # List of {ticker: "AAPL", distance: 0.3, risk_class: "Low"}
+
+
 
+class ProfileRequest(BaseModel):
+    mode: str = "cpu" # "cpu" (cProfile) or "memory" (tracemalloc)
+    requests: int = 100 # Stop after this many profiled requests...
+    seconds: float = 60 # ...or this many seconds, whichever comes first
 
+class ExportRequest(BaseModel):
+    tickers: Optional[List[str]] = None # Default: the configured universe
+    start: Optional[date] = None
+    end: Optional[date] = None
+    format: str = "arrow" # "arrow" (IPC stream) or "parquet"
+    predictions: bool = True # Include model outputs next to the features
@@ -1,21 +1,123 @@
 import pandas as pd
 import numpy as np
+from ml.cleaning import trading_bars
 from ml.data_ingestion import fetch_stock_data
 from ml.feature_engineering import create_features
-from ml.config import RISK_LEVELS, TICKERS
+from ml.feature_registry import FEATURE_SPECS, history_tail
+from ml.portfolio import returns_matrix, portfolio_risk
+from ml.similarity import behaviour_embeddings
+from ml.segments import SegmentModels
+from ml.config import RISK_LEVELS, TICKERS, COMPILED_INFERENCE, RANGE_CHUNK_ROWS
+
+def _as_timestamp(value, tz) -> pd.Timestamp:
+    # Request dates are naive calendar dates; compare them in the data's timezone
+    ts = pd.Timestamp(value)
+    if tz is not None and ts.tzinfo is None:
+        ts = ts.tz_localize(tz)
+    return ts
 
 class PredictionService:
     def __init__(self, models):
         self.models = models
         self.features_list = models["features"]
+        # Only what this version scores with, plus the volatility reported with risk predictions.
+        # Versions listing features the registry does not define get every feature, as before.
+        serving = list(dict.fromkeys(self.features_list + ["return_lag1", "volatility_20d"]))
+        self.serving_features = serving if all(f in FEATURE_SPECS for f in serving) else None
+        # Prefer the compiled tree evaluators saved with the version, if any
+        self.regressor = models["regressor"]
+        self.classifier = models["classifier"]
+        if COMPILED_INFERENCE:
+            self.regressor = models.get("regressor_compiled", self.regressor)
+            self.classifier = models.get("classifier_compiled", self.classifier)
+        # {h: {"regressor", "classifier"}} for the multi-horizon endpoint
+        self.horizon_models = {
+            h: {name: pair[name] for name in ["regressor", "classifier"]}
+            for h, pair in (models.get("horizon_models") or {}).items()
+        }
+        if COMPILED_INFERENCE:
+            for h, compiled in (models.get("horizon_models_compiled") or {}).items():
+                for name in ["regressor", "classifier"]:
+                    if f"{name}_compiled" in compiled:
+                        self.horizon_models[h][name] = compiled[f"{name}_compiled"]
+        # Per-segment next-day models, loaded the first time one of their tickers is requested
+        self.segments = SegmentModels.from_models(models)
+
+    def warm_up(self):
+        """
+        Runs every model once on a dummy row, so the first real request does
+        not pay for first-call initialisation.
+        """
+        X = pd.DataFrame(np.zeros((1, len(self.features_list))), columns=self.features_list)
+        self.regressor.predict(X)
+        self.classifier.predict_proba(X)
+        for pair in self.horizon_models.values():
+            pair["regressor"].predict(X)
+            pair["classifier"].predict_proba(X)
+        if "pca" in self.models and "kmeans" in self.models:
+            self.models["kmeans"].predict(self.models["pca"].transform(X))
+        index = self.models.get("similarity_index")
+        if index is not None and index.tickers:
+            index.query(index.vector(index.tickers[0]), 1)
+
+    def models_for(self, ticker: str) -> tuple:
+        """
+        (regressor, classifier) serving ticker: its segment's pair if it has
+        one, otherwise the global models.
+        """
+        pair = self.segments.get(ticker) if self.segments is not None else None
+        if pair is None:
+            return self.regressor, self.classifier
+        if COMPILED_INFERENCE:
+            return pair.get("regressor_compiled", pair["regressor"]), pair.get("classifier_compiled", pair["classifier"])
+        return pair["regressor"], pair["classifier"]
+
+    def _featurize(self, df: pd.DataFrame, rows: int = None) -> pd.DataFrame:
+        # rows: only featurize the bars the last `rows` rows of each ticker look back over
+        if self.serving_features is not None and rows is not None:
+            # Filled calendar bars are dropped first, so the tail holds enough real bars
+            df = history_tail(trading_bars(df), self.serving_features, rows)
+        return create_features(df, inference=True, features=self.serving_features)
+
+    def _get_features_range(self, ticker: str, start=None, end=None) -> pd.DataFrame:
+        """
+        Feature rows of a ticker dated within [start, end] (inclusive, either
+        may be None). Features for the whole history are computed in one
+        vectorized pass and the range is located by binary search on the dates.
+        """
+        df = fetch_stock_data([ticker], use_cache=True)
+        if df.empty:
+            raise ValueError(f"No data found for {ticker}")
+        history = self._featurize(df)
+        dates = pd.DatetimeIndex(history["date"])
+        order = np.argsort(dates.asi8, kind="stable")
+        history, dates = history.iloc[order], dates[order]
+
+        lo, hi = 0, len(dates)
+        if start is not None:
+            lo = dates.searchsorted(_as_timestamp(start, dates.tz), side="left")
+        if end is not None:
+            # Dates are inclusive: everything before the start of the next day
+            hi = dates.searchsorted(_as_timestamp(end, dates.tz) + pd.Timedelta(days=1), side="left")
+        rows = history.iloc[lo:hi].dropna(subset=self.features_list)
+        if rows.empty:
+            raise ValueError(f"No feature rows for {ticker} in the requested date range.")
+        return rows
+
+    def _get_latest_features(self, ticker: str, return_all=False, as_of=None):
+        if as_of is not None:
+            # Point-in-time: the last row on or before as_of
+            latest = self._get_features_range(ticker, end=as_of).iloc[[-1]]
+            return latest if return_all else latest[self.features_list]
 
-    def _get_latest_features(self, ticker: str, return_all=False):
         # Fetch data (cached if possible/recent)
         df = fetch_stock_data([ticker], use_cache=True)
         if df.empty:
             raise ValueError(f"No data found for {ticker}")
             
-        df_features = create_features(df)
+        # Serving never needs targets/labels, so skip building them; only the
+        # bars the last row's features look back over are featurized
+        df_features = self._featurize(df, rows=1)
         
         # Get the very last row
         latest = df_features.iloc[[-1]].copy()
@@ -36,44 +138,209 @@ class PredictionService:
 
         return latest[self.features_list]
 
-    def predict_risk(self, ticker: str):
-        # Get full row to extract volatility
-        full_row = self._get_latest_features(ticker, return_all=True)
-        features = full_row[self.features_list]
-        
-        # Proba
-        probas = self.models["classifier"].predict_proba(features)[0]
-        max_idx = np.argmax(probas)
-        confidence = float(probas[max_idx])
-        risk_class = RISK_LEVELS[max_idx] if max_idx < len(RISK_LEVELS) else "Unknown"
-        
-        # Extract Volatility (handle if missing)
-        vol = 0.0
-        if "volatility_20d" in full_row.columns:
-            vol = float(full_row.iloc[0]["volatility_20d"])
-            if np.isnan(vol): vol = 0.0
-
-        # Simple Recommendation Logic
-        # If Low Risk -> Buy/Hold
-        # If High Risk -> Sell
-        rec = "HOLD"
-        if risk_class == "Low": rec = "BUY"
-        elif risk_class == "High": rec = "SELL"
-        
+    def _score_risk(self, rows: pd.DataFrame, classifier=None) -> list:
+        # Vectorized over rows: one predict_proba call for the whole frame
+        classifier = classifier or self.classifier
+        probas = np.asarray(classifier.predict_proba(rows[self.features_list]))
+        if "volatility_20d" in rows.columns:
+            vols = np.nan_to_num(rows["volatility_20d"].to_numpy(dtype=np.float64), nan=0.0)
+        else:
+            vols = np.zeros(len(rows))
+
+        results = []
+        for row_probas, vol in zip(probas, vols):
+            max_idx = np.argmax(row_probas)
+            risk_class = RISK_LEVELS[max_idx] if max_idx < len(RISK_LEVELS) else "Unknown"
+
+            # Simple Recommendation Logic
+            # If Low Risk -> Buy/Hold
+            # If High Risk -> Sell
+            rec = "HOLD"
+            if risk_class == "Low": rec = "BUY"
+            elif risk_class == "High": rec = "SELL"
+
+            results.append({
+                "risk_class": risk_class,
+                "probabilities": {RISK_LEVELS[i]: float(p) for i, p in enumerate(row_probas)},
+                "volatility": float(vol),
+                "confidence_score": float(row_probas[max_idx]),
+                "recommendation": rec
+            })
+        return results
+
+    def predict_risk(self, ticker: str, as_of=None, rows=None):
+        # Get full row to extract volatility; rows may be precomputed (shared by a ModelPool)
+        full_row = rows if rows is not None else self._get_latest_features(ticker, return_all=True, as_of=as_of)
+        result = self._score_risk(full_row, self.models_for(ticker)[1])[0]
+        if as_of is not None:
+            result["date"] = pd.Timestamp(full_row.iloc[0]["date"]).isoformat()
+        return result
+
+    def predict_return(self, ticker: str, rows=None):
+        features = rows[self.features_list] if rows is not None else self._get_latest_features(ticker)
+        pred = self.models_for(ticker)[0].predict(features)[0]
+        return float(pred)
+
+    def predict_return_as_of(self, ticker: str, as_of, rows=None):
+        """
+        Return forecast made from the last bar on or before as_of, with that bar's date.
+        """
+        full_row = rows if rows is not None else self._get_latest_features(ticker, return_all=True, as_of=as_of)
+        pred = self.models_for(ticker)[0].predict(full_row[self.features_list])[0]
+        return float(pred), pd.Timestamp(full_row.iloc[0]["date"]).isoformat()
+
+    def iter_risk_range(self, ticker: str, start=None, end=None, chunk_rows: int = RANGE_CHUNK_ROWS):
+        """
+        Risk predictions for every date in [start, end], yielded as lists of
+        records, chunk_rows at a time. Features are validated eagerly so errors
+        surface before streaming starts.
+        """
+        rows = self._get_features_range(ticker, start, end)
+        classifier = self.models_for(ticker)[1]
+
+        def chunks():
+            for offset in range(0, len(rows), chunk_rows):
+                chunk = rows.iloc[offset:offset + chunk_rows]
+                yield [
+                    {"ticker": ticker, "date": pd.Timestamp(date).isoformat(), **result}
+                    for date, result in zip(chunk["date"], self._score_risk(chunk, classifier))
+                ]
+        return chunks()
+
+    def iter_return_range(self, ticker: str, start=None, end=None, chunk_rows: int = RANGE_CHUNK_ROWS):
+        """
+        Return forecasts for every date in [start, end]; see iter_risk_range.
+        """
+        rows = self._get_features_range(ticker, start, end)
+        regressor = self.models_for(ticker)[0]
+
+        def chunks():
+            for offset in range(0, len(rows), chunk_rows):
+                chunk = rows.iloc[offset:offset + chunk_rows]
+                preds = regressor.predict(chunk[self.features_list])
+                yield [
+                    {"ticker": ticker, "date": pd.Timestamp(date).isoformat(), "predicted_next_day_return": float(p)}
+                    for date, p in zip(chunk["date"], preds)
+                ]
+        return chunks()
+
+    @property
+    def export_features(self) -> list:
+        return self.serving_features or self.features_list
+
+    def iter_export(self, tickers, start=None, end=None, predictions: bool = True):
+        """
+        Feature rows of every ticker dated within [start, end], one DataFrame
+        per ticker, with the return forecast, class probabilities and risk
+        class when predictions is set (the columns of ml.export.export_schema).
+        Tickers are fetched and featurized one at a time; tickers without data
+        in the range are skipped.
+        """
+        for ticker in tickers:
+            try:
+                rows = self._get_features_range(ticker, start, end)
+            except ValueError as e:
+                print(f"Skipping {ticker} in export: {e}")
+                continue
+            frame = rows[["ticker", "date"] + self.export_features].reset_index(drop=True)
+            if predictions:
+                X = rows[self.features_list]
+                regressor, classifier = self.models_for(ticker)
+                frame["predicted_return"] = np.asarray(regressor.predict(X), dtype=np.float64)
+                probas = np.asarray(classifier.predict_proba(X), dtype=np.float64)
+                for i, level in enumerate(RISK_LEVELS):
+                    frame[f"prob_{level.lower()}"] = probas[:, i]
+                frame["risk_class"] = np.asarray(RISK_LEVELS)[probas.argmax(axis=1)]
+            yield frame
+
+    def predict_horizons(self, ticker: str):
+        """
+        Return forecast and risk class for every trained horizon, all from one
+        feature computation for the ticker.
+        """
+        if not self.horizon_models:
+            raise ValueError("The loaded model version has no horizon models.")
+        features = self._get_latest_features(ticker)
+
+        horizons = []
+        for h, pair in sorted(self.horizon_models.items()):
+            probas = pair["classifier"].predict_proba(features)[0]
+            max_idx = np.argmax(probas)
+            horizons.append({
+                "horizon_days": int(h),
+                "predicted_return": float(pair["regressor"].predict(features)[0]),
+                "risk_class": RISK_LEVELS[max_idx] if max_idx < len(RISK_LEVELS) else "Unknown",
+                "probabilities": {RISK_LEVELS[i]: float(p) for i, p in enumerate(probas)},
+                "confidence_score": float(probas[max_idx])
+            })
+        return horizons
+
+    def portfolio_risk(self, holdings: dict, covariance):
+        """
+        Volatility, per-position risk contributions and risk class of a
+        portfolio ({ticker: weight}), from the shared EWMA covariance.
+        """
+        if not holdings:
+            raise ValueError("Portfolio has no holdings.")
+        tickers = list(holdings)
+        df = fetch_stock_data(tickers, use_cache=True)
+        if df.empty:
+            raise ValueError(f"No data found for {tickers}")
+        missing = sorted(set(tickers) - set(df["ticker"]))
+        if missing:
+            raise ValueError(f"No data found for {missing}")
+
+        # Only the bars each ticker has not been folded in through yet (plus the close
+        # their first new return is computed from) are turned into returns
+        starts = pd.to_datetime(df["ticker"].map(covariance.start_dates(tickers)), utc=True)
+        df = df[starts.isna() | (pd.to_datetime(df["date"], utc=True) >= starts)]
+        cov = covariance.update(returns_matrix(df)).covariance(tickers)
+        weights = np.array([holdings[t] for t in tickers], dtype=np.float64)
+        risk = portfolio_risk(cov, weights, self.models.get("risk_thresholds"))
+
+        risk_class = risk["risk_class"]
         return {
-            "risk_class": risk_class,
-            "probabilities": {RISK_LEVELS[i]: float(p) for i, p in enumerate(probas)},
-            "volatility": vol,
-            "confidence_score": confidence,
-            "recommendation": rec
+            "volatility": risk["volatility"],
+            "risk_class": RISK_LEVELS[risk_class] if risk_class is not None else "Unknown",
+            "contributions": [
+                {"ticker": t, "weight": float(w), "risk_contribution": float(c),
+                 "volatility": float(np.sqrt(cov[i, i]))}
+                for i, (t, w, c) in enumerate(zip(tickers, weights, risk["contributions"]))
+            ]
         }
 
-    def predict_return(self, ticker: str):
-        features = self._get_latest_features(ticker)
-        pred = self.models["regressor"].predict(features)[0]
-        return float(pred)
+    def recommend_similar(self, input_ticker: str, risk_preference: str = None, k: int = 5):
+        """
+        Top-k tickers with the most similar behaviour embedding, nearest first.
+        Versions saved without a similarity index fall back to KMeans clusters.
+        """
+        index = self.models.get("similarity_index")
+        if index is None:
+            return self._recommend_by_cluster(input_ticker, risk_preference)
+
+        if input_ticker in index:
+            vector = index.vector(input_ticker)
+        else:
+            # Not in the indexed universe: embed it from fresh features
+            df = fetch_stock_data([input_ticker], use_cache=True)
+            if df.empty:
+                raise ValueError(f"No data found for {input_ticker}")
+            df_features = self._featurize(df, rows=index.window)
+            embedding = behaviour_embeddings(df_features, self.models["pca"], self.features_list, index.window)
+            vector = index.normalize(embedding.iloc[0].to_numpy())
+
+        # Over-fetch when filtering by risk so k results usually remain
+        n = k * 4 if risk_preference else k
+        recommendations = []
+        for ticker, distance in index.query(vector, n, exclude=input_ticker):
+            risk_idx = index.risk_classes.get(ticker)
+            candidate_risk = RISK_LEVELS[risk_idx] if risk_idx is not None and risk_idx < len(RISK_LEVELS) else "Unknown"
+            if risk_preference and risk_preference.lower() != candidate_risk.lower():
+                continue
+            recommendations.append({"ticker": ticker, "distance": distance, "risk_class": candidate_risk})
+        return recommendations[:k]
 
-    def recommend_similar(self, input_ticker: str, risk_preference: str = None):
+    def _recommend_by_cluster(self, input_ticker: str, risk_preference: str = None):
         # 1. Get features for input
         input_features = self._get_latest_features(input_ticker)
         
@@ -1,3 +1,21 @@
+// Last representation per request, revalidated with If-None-Match (304 -> reuse)
+const responseCache = new Map();
+
+async function cachedFetch(url, options = {}) {
+    const key = `${options.method || 'GET'} ${url} ${options.body || ''}`;
+    const cached = responseCache.get(key);
+    const headers = { ...(options.headers || {}) };
+    if (cached) headers['If-None-Match'] = cached.etag;
+
+    const response = await fetch(url, { ...options, headers });
+    if (response.status === 304 && cached) return { ok: true, status: 200, data: cached.data };
+
+    const data = await response.json();
+    const etag = response.headers.get('ETag');
+    if (response.ok && etag) responseCache.set(key, { etag, data });
+    return { ok: response.ok, status: response.status, data };
+}
+
 async function analyzeRisk() {
     const input = document.getElementById('tickerInput');
     const button = document.getElementById('analyzeBtn');
@@ -17,13 +35,13 @@ async function analyzeRisk() {
     errorDiv.classList.add('hidden');
 
     try {
-        const response = await fetch('/predict_risk', {
+        const response = await cachedFetch('/predict_risk', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ ticker: ticker })
         });
 
-        const data = await response.json();
+        const data = response.data;
 
         if (!response.ok) throw new Error(data.detail || 'Prediction failed');
 
@@ -1,4 +1,5 @@
 import sys
+import time
 from pathlib import Path
 # Add project root to python path to allow imports from 'ml'
 sys.path.append(str(Path(__file__).parent.parent))
@@ -7,21 +8,41 @@ from prefect import flow, task, get_run_logger
 from dotenv import load_dotenv
 load_dotenv()
 import pandas as pd
-from ml.config import TICKERS, HISTORY_YEARS, TEST_SIZE_DAYS
+from ml.config import HISTORY_YEARS, TEST_SIZE_DAYS, SHARD_SIZE, FEATURE_STORE_DIR, CROSS_SECTIONAL, SEGMENT_KEY
 from ml.data_ingestion import fetch_stock_data
-from ml.feature_engineering import create_features, split_data
-from ml.models import train_models, save_models
+from ml.feature_engineering import (
+    create_features, split_data, compute_risk_thresholds, compute_horizon_risk_thresholds,
+    assign_risk_class, assign_risk_class_in_store
+)
+from ml.models import (
+    FEATURES, train_models, train_models_from_store, update_models, choose_training_mode,
+    save_models, load_models, data_fingerprint
+)
+from ml.registry import ModelRegistry
+from ml.universe import get_tickers, iter_shards, load_universe
+from ml.cross_sectional import add_cross_sectional_features
+from ml.similarity import build_similarity_index
+from ml.segments import train_segment_models
+from ml.feature_store import FeatureStore
 from ml.evaluation import evaluate_models
-from ml.drift import check_data_integrity, check_feature_drift
+from ml.drift import check_data_integrity, check_feature_drift, run_drift_suite
 
 @task(retries=3)
 def get_data_task():
-    return fetch_stock_data(TICKERS)
+    # The configured universe (UNIVERSE_FILE), or TICKERS without one
+    return fetch_stock_data(get_tickers())
 
 @task
 def feature_engineering_task(df):
     return create_features(df)
 
+@task
+def cross_sectional_task(df):
+    # Market/peer-relative features need every ticker of a date together. Analysis only:
+    # the columns ride along in the frame but are not in FEATURES, so no model trains on them
+    sectors = load_universe().set_index("ticker")["sector"]
+    return add_cross_sectional_features(df, sectors=sectors)
+
 @task
 def validate_data_task(df):
     report = check_data_integrity(df)
@@ -31,12 +52,21 @@ def validate_data_task(df):
 
 @task
 def split_data_task(df):
-    # Retrieve TEST_SIZE_DAYS from config. Note: config defines it as "days" (int), 
-    # but split_data expects "test_size" (float ratio) or int count. 
-    # If TEST_SIZE_DAYS is an integer (e.g. 30), sklearn interprets it as absolute number of samples.
-    # We must ensure we pass it to the parameter 'test_size' that the function accepts.
+    # TEST_SIZE_DAYS (int) is the number of newest dates that form the test split, for every ticker
     return split_data(df, test_size=TEST_SIZE_DAYS)
 
+@task
+def risk_thresholds_task(train_df, test_df):
+    """
+    Computes risk thresholds (overall and per horizon) on the training split
+    only and relabels both splits with them.
+    """
+    thresholds = compute_risk_thresholds(train_df)
+    horizon_thresholds = compute_horizon_risk_thresholds(train_df)
+    return (thresholds, horizon_thresholds,
+            assign_risk_class(train_df, thresholds, horizon_thresholds),
+            assign_risk_class(test_df, thresholds, horizon_thresholds))
+
 @task(name="notify_completion")
 def notify_completion(version: str):
     """
@@ -52,14 +82,38 @@ def notify_completion(version: str):
 def train_task(train_df):
     return train_models(train_df)
 
+@task
+def previous_version_task():
+    # Latest registered version and its models, the starting point of an incremental update
+    latest = ModelRegistry().latest_version()
+    if latest is None or not latest["path"].exists():
+        return None, None
+    return latest["version"], load_models(latest["path"])
+
+@task
+def training_mode_task(previous, train_df):
+    return choose_training_mode(previous, train_df)
+
+@task
+def update_task(previous, train_df, previous_version, reason):
+    return update_models(previous, train_df, parent_version=previous_version, reason=reason)
+
+@task
+def segment_task(train_df, models):
+    return train_segment_models(train_df, models, SEGMENT_KEY)
+
 @task
 def evaluate_task(models, test_df):
+    # Test-set metrics are persisted with the version in the model registry
     return evaluate_models(models, test_df)
 
 @task
-def save_task(models, metrics):
-    # Save only the model artifacts; metrics are not persisted in this demo
-    return save_models(models)
+def drift_task(train_df, test_df):
+    return run_drift_suite(train_df, test_df, features=FEATURES)
+
+@task
+def save_task(models, metrics, fingerprint=None, timings=None, reports=None):
+    return save_models(models, metrics=metrics, data_fingerprint=fingerprint, timings=timings, reports=reports)
 
 @flow(name="Stock Risk Training Flow")
 def training_flow():
@@ -73,16 +127,22 @@ def training_flow():
     6. Evaluation
     7. Saving
     8. Notification
+    Training updates the previous version with the new rows when
+    choose_training_mode allows it (TRAINING_MODE=incremental) and retrains
+    from scratch otherwise; the mode is recorded with the version.
     """
     logger = get_run_logger()
     logger.info("Starting training flow...")
+    timings = {} # Stage wall-clock seconds, recorded in the registry
     
     # 1. Get Data
+    start = time.perf_counter()
     try:
         raw_df = get_data_task()
     except Exception as e:
         logger.error(f"Data ingestion failed: {e}")
         return
+    timings["ingestion"] = time.perf_counter() - start
 
     # 2. Validation
     validation_results = validate_data_task(raw_df)
@@ -90,7 +150,11 @@ def training_flow():
         logger.warning(f"Data integrity warning: {validation_results}")
     
     # 3. Features
+    start = time.perf_counter()
     df_features = feature_engineering_task(raw_df)
+    if CROSS_SECTIONAL:
+        df_features = cross_sectional_task(df_features)
+    timings["features"] = time.perf_counter() - start
     
     if df_features.empty:
         logger.warning("No data available for training. Stopping flow.")
@@ -98,32 +162,142 @@ def training_flow():
 
     # 4. Split
     train_df, test_df = split_data_task(df_features)
+    risk_thresholds, horizon_thresholds, train_df, test_df = risk_thresholds_task(train_df, test_df)
+    logger.info(f"Risk thresholds (train split): {risk_thresholds}")
     
-    # 5. Drift Check (DeepChecks)
-    try:
-        from ml.drift import run_deepchecks_suite
-        deepcheck_results = run_deepchecks_suite(train_df, test_df)
-        if not deepcheck_results["passed"]:
-             logger.warning(f"DeepChecks Drift/integrity warning: {deepcheck_results}")
-        else:
-             logger.info(f"DeepChecks Passed. Score: {deepcheck_results.get('score', 'N/A')}")
-    except Exception as e:
-        logger.error(f"DeepChecks failed to run: {e}")
+    # 5. Drift Check (native suite; the report is saved with the version)
+    start = time.perf_counter()
+    drift_report = drift_task(train_df, test_df)
+    timings["drift"] = time.perf_counter() - start
+    if not drift_report["passed"]:
+        logger.warning(f"Drift/integrity warning: {drift_report['failures']}")
+    else:
+        logger.info(f"Drift suite passed. Score: {drift_report['score']:.2f}")
 
-    # 6. Train
-    models = train_task(train_df)
+    # 6. Train: incremental update of the previous version, or a full retrain
+    previous_version, previous = previous_version_task()
+    training_mode, reason = training_mode_task(previous, train_df)
+    logger.info(f"Training mode: {training_mode} ({reason})")
+    if training_mode == "skip":
+        return
+
+    start = time.perf_counter()
+    if training_mode == "incremental":
+        # Keep the labels the previous trees were fitted on
+        risk_thresholds = previous["risk_thresholds"]
+        horizon_thresholds = previous.get("horizon_risk_thresholds") or horizon_thresholds
+        train_df = assign_risk_class(train_df, risk_thresholds, horizon_thresholds)
+        test_df = assign_risk_class(test_df, risk_thresholds, horizon_thresholds)
+        models = update_task(previous, train_df, previous_version, reason)
+    else:
+        models = train_task(train_df)
+        models["training_info"]["reason"] = reason
+    models["risk_thresholds"] = risk_thresholds # Persisted with the version
+    models["horizon_risk_thresholds"] = horizon_thresholds
+    # Behaviour embeddings as of the most recent data, for /recommend_similar
+    models["similarity_index"] = build_similarity_index(models, df_features)
+    timings["training"] = time.perf_counter() - start
+    if SEGMENT_KEY:
+        # Per-segment models are refitted on the whole training split in either mode
+        start = time.perf_counter()
+        models.update(segment_task(train_df, models))
+        timings["segments"] = time.perf_counter() - start
+        logger.info(f"Segment models: {sorted(models['segments']['segments'])}")
     
     # 7. Evaluate
+    start = time.perf_counter()
     metrics = evaluate_task(models, test_df)
+    timings["evaluation"] = time.perf_counter() - start
     
-    # 8. Save
-    version = save_task(models, metrics)
+    # 8. Save (artifacts + registry entry)
+    version = save_task(models, metrics, data_fingerprint(train_df), timings, {"drift_report": drift_report})
     
     # 9. Notify
     notify_completion(version)
     
     logger.info(f"Flow completed. New model version: {version}")
 
+@task(retries=3)
+def build_shard_task(shard_id: int, tickers: list, train_store: FeatureStore, test_store: FeatureStore):
+    """
+    Fetches, featurizes and splits one shard of the universe, streaming the
+    result to disk. Returns the number of rows written.
+    """
+    raw_df = fetch_stock_data(tickers)
+    report = check_data_integrity(raw_df)
+    if not report["passed"]:
+        print(f"Data integrity warning for shard {shard_id}: {report}")
+
+    df_features = create_features(raw_df)
+    if df_features.empty:
+        return 0
+
+    train_df, test_df = split_data(df_features, test_size=TEST_SIZE_DAYS)
+    name = f"shard_{shard_id:05d}"
+    train_store.write_partition(name, train_df)
+    test_store.write_partition(name, test_df)
+    return len(train_df) + len(test_df)
+
+@task
+def train_from_store_task(train_store: FeatureStore):
+    return train_models_from_store(train_store)
+
+@flow(name="Stock Risk Sharded Training Flow")
+def sharded_training_flow(universe_file: str = None, shard_size: int = SHARD_SIZE):
+    """
+    Universe-scale variant of training_flow:
+    1. Load the ticker universe
+    2. For each shard: ingest, validate, featurize, split and write to the feature store
+    3. Train from the feature store partition by partition
+    4. Evaluate, save and notify as usual
+    """
+    logger = get_run_logger()
+    tickers = get_tickers(universe_file)
+    logger.info(f"Starting sharded training flow for {len(tickers)} tickers (shard size {shard_size})...")
+
+    train_store = FeatureStore(FEATURE_STORE_DIR / "train")
+    test_store = FeatureStore(FEATURE_STORE_DIR / "test")
+    train_store.clear()
+    test_store.clear()
+
+    timings = {}
+    start = time.perf_counter()
+    total_rows = 0
+    for shard_id, shard in enumerate(iter_shards(tickers, shard_size)):
+        try:
+            total_rows += build_shard_task(shard_id, shard, train_store, test_store)
+        except Exception as e:
+            logger.error(f"Shard {shard_id} failed: {e}")
+
+    if total_rows == 0:
+        logger.warning("No data available for training. Stopping flow.")
+        return
+    timings["sharded_features"] = time.perf_counter() - start
+
+    # Shards were labelled with their own quantiles; relabel everything with
+    # exact thresholds over the whole training split.
+    risk_thresholds = compute_risk_thresholds(train_store)
+    horizon_thresholds = compute_horizon_risk_thresholds(train_store)
+    assign_risk_class_in_store(train_store, risk_thresholds, horizon_thresholds)
+    assign_risk_class_in_store(test_store, risk_thresholds, horizon_thresholds)
+    logger.info(f"Risk thresholds (train split): {risk_thresholds}")
+
+    start = time.perf_counter()
+    models = train_from_store_task(train_store)
+    models["risk_thresholds"] = risk_thresholds
+    models["horizon_risk_thresholds"] = horizon_thresholds
+    models["similarity_index"] = build_similarity_index(models, train_store, test_store)
+    timings["training"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    metrics = evaluate_task(models, test_store)
+    timings["evaluation"] = time.perf_counter() - start
+
+    version = save_task(models, metrics, data_fingerprint(train_store), timings)
+    notify_completion(version)
+
+    logger.info(f"Sharded flow completed. New model version: {version}")
+
 if __name__ == "__main__":
     training_flow()
 
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import pickle
+import zlib
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+from .config import (
+    ARTIFACTS_DIR, ARTIFACT_COMPRESSION_LEVEL, MODELS_DIR,
+    RETAIN_LAST, RETAIN_BEST, RETAIN_METRIC, RETAIN_HIGHER_IS_BETTER
+)
+
+MANIFEST_FILE = "manifest.json"
+
+class ArtifactStore:
+    """
+    Content-addressed, compressed object store for model artifacts.
+    Each pickled component is stored once under the SHA-256 of its bytes, so
+    components that do not change between versions (features, thresholds, an
+    unchanged model) cost nothing extra on disk or when syncing ./models.
+    """
+
+    def __init__(self, root: Optional[Path] = None):
+        self.root = Path(root) if root is not None else ARTIFACTS_DIR
+
+    def _path(self, digest: str) -> Path:
+        return self.root / digest[:2] / f"{digest[2:]}.pkl.z"
+
+    def put(self, obj) -> str:
+        """
+        Stores an object (if not already present) and returns its digest.
+        """
+        return self.put_bytes(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def put_bytes(self, data: bytes) -> str:
+        """
+        Stores already-pickled bytes (if not already present) and returns their digest.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write-then-rename so readers never see a partial blob
+            tmp = path.with_suffix(f".tmp{os.getpid()}")
+            with open(tmp, "wb") as f:
+                f.write(zlib.compress(data, ARTIFACT_COMPRESSION_LEVEL))
+            os.replace(tmp, path)
+        return digest
+
+    def get(self, digest: str):
+        with open(self._path(digest), "rb") as f:
+            return pickle.loads(zlib.decompress(f.read()))
+
+    def exists(self, digest: str) -> bool:
+        return self._path(digest).exists()
+
+    def digests(self) -> Iterator[str]:
+        if not self.root.exists():
+            return
+        for path in self.root.glob("*/*.pkl.z"):
+            yield path.parent.name + path.name[:-len(".pkl.z")]
+
+    def size_bytes(self) -> int:
+        if not self.root.exists():
+            return 0
+        return sum(p.stat().st_size for p in self.root.glob("*/*.pkl.z"))
+
+    def collect_garbage(self, referenced: Iterable[str], dry_run: bool = False) -> list:
+        """
+        Deletes blobs not referenced by any manifest. Returns the removed digests.
+        """
+        referenced = set(referenced)
+        removed = [d for d in self.digests() if d not in referenced]
+        if not dry_run:
+            for digest in removed:
+                self._path(digest).unlink(missing_ok=True)
+        return removed
+
+def write_version(version_dir: Path, models: dict, store: Optional[ArtifactStore] = None) -> dict:
+    """
+    Stores each component in the artifact store and writes the version's
+    manifest ({component: digest}). Returns the manifest.
+    """
+    store = store or ArtifactStore()
+    version_dir = Path(version_dir)
+    version_dir.mkdir(parents=True, exist_ok=True)
+    manifest = {name: store.put(obj) for name, obj in models.items()}
+    with open(version_dir / MANIFEST_FILE, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+def read_manifest(version_dir: Path) -> Optional[dict]:
+    path = Path(version_dir) / MANIFEST_FILE
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def is_lazy(name: str) -> bool:
+    # Grouped components ("<group>/<name>", e.g. per-segment models) are only loaded when asked for by name
+    return "/" in name
+
+def read_version(version_dir: Path, store: Optional[ArtifactStore] = None, names: Optional[Iterable[str]] = None) -> dict:
+    """
+    Loads a version's components, from its manifest or, for versions saved
+    before the artifact store, from the individual pickle files. Without
+    names, every component except the lazy (grouped) ones is loaded.
+    """
+    version_dir = Path(version_dir)
+    manifest = read_manifest(version_dir)
+    names = set(names) if names is not None else None
+    models = {}
+    if manifest is not None:
+        store = store or ArtifactStore()
+        for name, digest in manifest.items():
+            if (names is None and not is_lazy(name)) or (names is not None and name in names):
+                models[name] = store.get(digest)
+        return models
+
+    for p in sorted(version_dir.glob("*.pkl")):
+        if names is None or p.stem in names:
+            with open(p, "rb") as f:
+                models[p.stem] = pickle.load(f)
+    return models
+
+def migrate_legacy_version(version_dir: Path, store: Optional[ArtifactStore] = None) -> bool:
+    """
+    Moves a legacy version (one .pkl per component) into the artifact store.
+    Blobs are stored from the original pickle bytes, so no unpickling (and no
+    compatible library versions) is needed. Returns True if migrated.
+    """
+    store = store or ArtifactStore()
+    version_dir = Path(version_dir)
+    pickles = sorted(version_dir.glob("*.pkl"))
+    if read_manifest(version_dir) is not None or not pickles:
+        return False
+
+    manifest = {p.stem: store.put_bytes(p.read_bytes()) for p in pickles}
+
+    with open(version_dir / MANIFEST_FILE, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    for p in pickles:
+        p.unlink()
+    return True
+
+def apply_retention(registry=None, store: Optional[ArtifactStore] = None, keep_last: int = RETAIN_LAST,
+                    keep_best: int = RETAIN_BEST, metric: str = RETAIN_METRIC,
+                    higher_is_better: bool = RETAIN_HIGHER_IS_BETTER, dry_run: bool = False) -> dict:
+    """
+    Drops versions outside the retention policy (keep last N, keep best M,
+    keep pinned), then deletes blobs no remaining manifest references.
+    """
+    from .registry import ModelRegistry
+    registry = registry or ModelRegistry()
+    store = store or ArtifactStore()
+    registry.sync_from_disk()
+
+    removed_versions = registry.garbage_collect(keep_last, keep_best, metric, higher_is_better, dry_run=dry_run)
+    removed_set = set(removed_versions)
+    referenced = set()
+    for version_dir in registry.models_dir.glob("version_*"):
+        manifest = read_manifest(version_dir)
+        if manifest and version_dir.name not in removed_set:
+            referenced.update(manifest.values())
+    removed_blobs = store.collect_garbage(referenced, dry_run=dry_run)
+    return {"removed_versions": removed_versions, "removed_blobs": len(removed_blobs)}
+
+def compact(models_dir: Optional[Path] = None, registry=None, store: Optional[ArtifactStore] = None,
+            dry_run: bool = False, **retention) -> dict:
+    """
+    Migrates legacy version directories into the artifact store, applies the
+    retention policy and reports disk usage before and after.
+    """
+    models_dir = Path(models_dir) if models_dir is not None else MODELS_DIR
+    store = store or ArtifactStore()
+
+    def disk_usage() -> int:
+        return sum(p.stat().st_size for p in models_dir.rglob("*") if p.is_file())
+
+    before = disk_usage()
+    migrated = 0
+    if not dry_run:
+        for version_dir in sorted(models_dir.glob("version_*")):
+            migrated += migrate_legacy_version(version_dir, store)
+    report = apply_retention(registry, store, dry_run=dry_run, **retention)
+    report.update({"migrated_versions": migrated, "bytes_before": before, "bytes_after": disk_usage()})
+    return report
@@ -0,0 +1,248 @@
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import numpy as np
+import pandas as pd
+from .config import CLEAN_DATA_DIR, OUTLIER_Z, OUTLIER_WINDOW
+
+PRICE_COLS = ["open", "high", "low", "close"]
+CLEAN_COLS = ["ticker", "date"] + PRICE_COLS + ["volume", "filled", "outlier"]
+# Business-day ordinals are counted from this date (a Thursday, so itself a business day)
+_EPOCH = np.datetime64("1970-01-01", "D")
+
+def _business_ordinals(dates: pd.Series) -> Tuple[np.ndarray, Optional[str]]:
+    # Calendar dates -> business-day numbers; weekend bars map onto the following Monday
+    tz = dates.dt.tz
+    naive = dates.dt.tz_convert(None) if tz is not None else dates
+    days = naive.dt.normalize().to_numpy().astype("datetime64[D]")
+    return np.busday_count(_EPOCH, days), tz
+
+def clean_ohlcv(df: pd.DataFrame) -> Tuple[pd.DataFrame, dict]:
+    """
+    Cleans raw daily bars for any number of tickers in one vectorized pass:
+    1. drops duplicate (ticker, date) bars, keeping the provider's last one
+    2. blanks bars with non-positive prices or high < low
+    3. back-adjusts prices (and volume) for splits and dividends using the
+       split_coefficient / dividend_amount columns, when present
+    4. reindexes every ticker onto the business-day calendar between its first
+       and last bar, forward-filling missing and blanked bars (flagged `filled`).
+       The calendar has no exchange holidays, so features and targets are
+       computed from trading_bars(), which leaves filled bars out
+    5. flags close-to-close moves larger than OUTLIER_Z robust deviations of
+       the trailing OUTLIER_WINDOW returns (`outlier`); they are kept, not dropped
+    Returns (clean_df, report).
+    """
+    report = {"rows_in": len(df), "duplicates_removed": 0, "bad_bars": 0,
+              "corporate_actions": 0, "filled_bars": 0, "outliers": 0}
+    if df.empty:
+        return pd.DataFrame(columns=CLEAN_COLS), report
+
+    df = df.copy()
+    df["date"] = pd.to_datetime(df["date"], utc=True)
+    for col in PRICE_COLS + ["volume"]:
+        df[col] = pd.to_numeric(df[col], errors="coerce") if col in df.columns else np.nan
+    if "open" not in df.columns or df["open"].isna().all():
+        # Close-only inputs: use the close for the other prices
+        for col in ["open", "high", "low"]:
+            df[col] = df[col].fillna(df["close"])
+    split = pd.to_numeric(df.get("split_coefficient", 1.0), errors="coerce")
+    dividend = pd.to_numeric(df.get("dividend_amount", 0.0), errors="coerce")
+    df["split_coefficient"] = pd.Series(split, index=df.index).fillna(1.0).replace(0, 1.0)
+    df["dividend_amount"] = pd.Series(dividend, index=df.index).fillna(0.0)
+
+    # 1. Duplicates
+    df = df.sort_values(["ticker", "date"], kind="stable")
+    ordinal, tz = _business_ordinals(df["date"])
+    df["_ordinal"] = ordinal
+    dup = df.duplicated(["ticker", "_ordinal"], keep="last")
+    report["duplicates_removed"] = int(dup.sum())
+    df = df[~dup]
+
+    # 2. Bad bars
+    prices = df[PRICE_COLS].to_numpy(dtype=np.float64)
+    bad = (prices <= 0).any(axis=1) | (df["high"].to_numpy() < df["low"].to_numpy())
+    report["bad_bars"] = int(bad.sum())
+    df.loc[bad, PRICE_COLS] = np.nan
+
+    # 3. Split/dividend back-adjustment: bar t is scaled by the product of the
+    # multipliers of all later events of its ticker (a reverse cumulative product)
+    codes, tickers = pd.factorize(df["ticker"])
+    prev_close = df.groupby(codes)["close"].shift(1)
+    div_ratio = (1 - df["dividend_amount"] / prev_close).where(prev_close > 0, 1.0).clip(lower=1e-6)
+    log_split = -np.log(df["split_coefficient"].to_numpy(dtype=np.float64))
+    log_price = log_split + np.log(div_ratio.to_numpy(dtype=np.float64))
+    report["corporate_actions"] = int((log_price != 0).sum())
+
+    def later_sum(values):
+        s = pd.Series(values, index=df.index).groupby(codes)
+        return s.transform("sum").to_numpy() - s.cumsum().to_numpy()
+
+    price_factor = np.exp(later_sum(log_price))
+    split_factor = np.exp(later_sum(log_split))
+    df[PRICE_COLS] = df[PRICE_COLS].to_numpy() * price_factor[:, None]
+    df["volume"] = df["volume"].to_numpy() / split_factor
+
+    # 4. Business-day calendar: one contiguous block of ordinals per ticker
+    ordinal = df["_ordinal"].to_numpy()
+    first = pd.Series(ordinal).groupby(codes).min().to_numpy()
+    last = pd.Series(ordinal).groupby(codes).max().to_numpy()
+    lengths = last - first + 1
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    total = int(lengths.sum())
+    full_codes = np.repeat(np.arange(len(tickers)), lengths)
+    full_ordinal = np.repeat(first, lengths) + (np.arange(total) - np.repeat(starts, lengths))
+    position = starts[codes] + ordinal - first[codes]
+
+    out = {col: np.full(total, np.nan) for col in PRICE_COLS + ["volume"]}
+    for col in out:
+        out[col][position] = df[col].to_numpy(dtype=np.float64)
+    present = np.zeros(total, dtype=bool)
+    present[position] = ~bad
+
+    clean = pd.DataFrame(out)
+    clean["ticker"] = np.asarray(tickers)[full_codes]
+    dates = pd.to_datetime(np.busday_offset(_EPOCH, full_ordinal, roll="forward"))
+    clean["date"] = dates.tz_localize(tz) if tz is not None else dates
+    clean["close"] = clean["close"].groupby(full_codes).ffill()
+    missing = ~present
+    for col in ["open", "high", "low"]:
+        clean.loc[missing, col] = clean.loc[missing, "close"]
+    clean.loc[missing, "volume"] = 0.0
+    clean["filled"] = missing
+    # A ticker whose first bars were bad has nothing to fill them from
+    clean = clean[clean["close"].notna()]
+    report["filled_bars"] = int(clean["filled"].sum())
+
+    # 5. Outliers against the trailing median absolute return
+    ticker_codes = pd.factorize(clean["ticker"])[0]
+    abs_return = np.log(clean["close"]).groupby(ticker_codes).diff().abs()
+    scale = 1.4826 * abs_return.groupby(ticker_codes).rolling(OUTLIER_WINDOW, min_periods=20).median() \
+        .reset_index(level=0, drop=True).groupby(ticker_codes).shift(1)
+    clean["outlier"] = (abs_return > OUTLIER_Z * scale).to_numpy() & (scale > 0).to_numpy()
+    report["outliers"] = int(clean["outlier"].sum())
+
+    return clean[CLEAN_COLS].reset_index(drop=True), report
+
+def trading_bars(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The bars of df that were actually traded: rows the calendar reindexing
+    forward-filled (exchange holidays, provider gaps, blanked bad bars) are
+    dropped, so they add no zero returns to features and targets. Frames
+    without a `filled` column are returned as they are.
+    """
+    if "filled" not in df.columns:
+        return df
+    return df[~df["filled"].astype(bool).to_numpy()]
+
+def _cache_paths(cache_dir: Path, ticker: str) -> Tuple[Path, Path]:
+    return cache_dir / f"{ticker}.csv", cache_dir / f"{ticker}.json"
+
+# Parsed cleaned histories, keyed by cache file and invalidated by the files' mtimes,
+# so a request whose raw bars are already covered parses neither file
+_parsed: Dict[Path, Tuple[Tuple[int, int], pd.DataFrame, dict]] = {}
+_parsed_lock = threading.Lock()
+
+def _read_cached(csv_path: Path, meta_path: Path) -> Optional[Tuple[pd.DataFrame, dict]]:
+    try:
+        stamp = (csv_path.stat().st_mtime_ns, meta_path.stat().st_mtime_ns)
+    except FileNotFoundError:
+        return None
+    with _parsed_lock:
+        hit = _parsed.get(csv_path)
+    if hit is not None and hit[0] == stamp:
+        return hit[1], hit[2]
+    with open(meta_path) as f:
+        meta = json.load(f)
+    history = pd.read_csv(csv_path)
+    history["date"] = pd.to_datetime(history["date"], utc=True)
+    _remember(csv_path, meta_path, history, meta)
+    return history, meta
+
+def _remember(csv_path: Path, meta_path: Path, history: pd.DataFrame, meta: dict) -> None:
+    stamp = (csv_path.stat().st_mtime_ns, meta_path.stat().st_mtime_ns)
+    with _parsed_lock:
+        _parsed[csv_path] = (stamp, history, meta)
+
+def _replace_file(path: Path, write) -> None:
+    # Readers in other threads only ever see the old file or the complete new one
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+def clean_incremental(raw: pd.DataFrame, cache_dir: Optional[Path] = None) -> Tuple[pd.DataFrame, dict]:
+    """
+    clean_ohlcv with a per-ticker cache of cleaned bars. Only bars newer than
+    the cached ones are cleaned, together with OUTLIER_WINDOW cached bars of
+    context; if the new bars carry a split or dividend, the cached history is
+    rescaled by the same factor instead of being re-cleaned. Tickers whose raw
+    history now starts earlier than the cache are cleaned from scratch. Cache
+    files are replaced atomically, and parsed histories stay in memory until
+    their files change, so a call with no new bars neither cleans nor re-reads
+    anything.
+    """
+    cache_dir = Path(cache_dir) if cache_dir is not None else CLEAN_DATA_DIR
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    if raw.empty:
+        return pd.DataFrame(columns=CLEAN_COLS), {"tickers_cleaned": 0, "tickers_cached": 0}
+
+    raw = raw.copy()
+    raw["date"] = pd.to_datetime(raw["date"], utc=True)
+    cached, pending, contexts = {}, [], []
+    for ticker, rows in raw.groupby("ticker", sort=False):
+        entry = _read_cached(*_cache_paths(cache_dir, ticker))
+        if entry is not None:
+            history, meta = entry
+            if rows["date"].min() >= pd.Timestamp(meta["first_raw_date"]):
+                new = rows[rows["date"] > pd.Timestamp(meta["last_raw_date"])]
+                cached[ticker] = (history, meta)
+                if not new.empty:
+                    context = history.tail(OUTLIER_WINDOW + 1).drop(columns=["filled", "outlier"])
+                    contexts.append(context.assign(_context=True))
+                    pending.append(new.assign(_context=False))
+                continue
+        pending.append(rows.assign(_context=False))
+
+    frames, cleaned_tickers = [], set()
+    if pending:
+        combined = pd.concat(contexts + pending, ignore_index=True)
+        combined = combined.sort_values(["ticker", "date", "_context"], ascending=[True, True, False])
+        cleaned, report = clean_ohlcv(combined)
+        for ticker, rows in cleaned.groupby("ticker", sort=False):
+            cleaned_tickers.add(ticker)
+            raw_rows = raw[raw["ticker"] == ticker]
+            if ticker in cached:
+                history, meta = cached[ticker]
+                last = history["date"].iloc[-1]
+                # New corporate actions rescale everything before them, context included
+                anchor = rows[rows["date"] == last]
+                price_factor = float(anchor["close"].iloc[0] / history["close"].iloc[-1]) if len(anchor) else 1.0
+                split = pd.to_numeric(raw_rows.get("split_coefficient", pd.Series(dtype=float)), errors="coerce")
+                new_split = split[raw_rows["date"] > last].fillna(1.0).replace(0, 1.0).prod() if len(split) else 1.0
+                if price_factor != 1.0 or new_split != 1.0:
+                    history = history.copy()
+                    history[PRICE_COLS] = history[PRICE_COLS] * price_factor
+                    history["volume"] = history["volume"] * new_split
+                rows = pd.concat([history, rows[rows["date"] > last]], ignore_index=True)
+                first_raw = meta["first_raw_date"]
+            else:
+                first_raw = raw_rows["date"].min().isoformat()
+            csv_path, meta_path = _cache_paths(cache_dir, ticker)
+            meta = {"first_raw_date": first_raw, "last_raw_date": raw_rows["date"].max().isoformat()}
+            _replace_file(csv_path, lambda f: rows.to_csv(f, index=False))
+            _replace_file(meta_path, lambda f: json.dump(meta, f))
+            _remember(csv_path, meta_path, rows, meta)
+            frames.append(rows)
+
+    frames += [history for ticker, (history, _) in cached.items() if ticker not in cleaned_tickers]
+    clean = pd.concat(frames, ignore_index=True)[CLEAN_COLS] if frames else pd.DataFrame(columns=CLEAN_COLS)
+    clean["filled"] = clean["filled"].astype(bool)
+    clean["outlier"] = clean["outlier"].astype(bool)
+    return clean, {"tickers_cleaned": len(cleaned_tickers), "tickers_cached": len(cached) - len(cleaned_tickers & set(cached))}
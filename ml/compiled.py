@@ -0,0 +1,138 @@
+import numpy as np
+from sklearn.dummy import DummyClassifier, DummyRegressor
+from sklearn.ensemble import GradientBoostingClassifier, GradientBoostingRegressor
+
+# Rows scored per traversal; bounds the (rows x trees) node-index matrix
+ROW_CHUNK = 4096
+
+class CompiledEnsemble:
+    """
+    A GradientBoosting model flattened into NumPy node arrays.
+    All trees live in one set of arrays and are traversed together, level by
+    level, for every row of a batch. This skips sklearn's per-call validation
+    and per-tree Python loop, which dominate latency for one-row requests.
+    """
+
+    def __init__(self, model):
+        if not isinstance(model, (GradientBoostingRegressor, GradientBoostingClassifier)):
+            raise TypeError(f"Cannot compile {type(model).__name__}; expected a GradientBoosting model.")
+        # Only constant initial predictions can be folded into a bias term
+        if not (model.init_ == "zero" or isinstance(model.init_, (DummyRegressor, DummyClassifier))):
+            raise ValueError("Only GradientBoosting models with the default or 'zero' init are supported.")
+
+        self.is_classifier = isinstance(model, GradientBoostingClassifier)
+        self.classes_ = getattr(model, "classes_", None)
+        self.n_features_in_ = model.n_features_in_
+        self.feature_names_in_ = getattr(model, "feature_names_in_", None)
+
+        estimators = model.estimators_ # (n_stages, n_outputs) of DecisionTreeRegressor
+        n_stages, n_outputs = estimators.shape
+        self.n_outputs = n_outputs
+
+        features, thresholds, lefts, rights, values, missing_left = [], [], [], [], [], []
+        roots, outputs = [], []
+        offset = 0
+        max_depth = 0
+        for stage in range(n_stages):
+            for k in range(n_outputs):
+                tree = estimators[stage, k].tree_
+                is_leaf = tree.children_left < 0
+                features.append(np.where(is_leaf, -1, tree.feature))
+                thresholds.append(tree.threshold)
+                # Leaves point at themselves so finished rows stay put
+                node_ids = np.arange(tree.node_count) + offset
+                lefts.append(np.where(is_leaf, node_ids, tree.children_left + offset))
+                rights.append(np.where(is_leaf, node_ids, tree.children_right + offset))
+                # Learning rate is folded into the leaf values
+                values.append(tree.value[:, 0, 0] * model.learning_rate)
+                missing = getattr(tree, "missing_go_to_left", None)
+                missing_left.append(np.zeros(tree.node_count, dtype=bool) if missing is None else missing.astype(bool))
+                roots.append(offset)
+                outputs.append(k)
+                offset += tree.node_count
+                max_depth = max(max_depth, tree.max_depth)
+
+        self.feature = np.concatenate(features).astype(np.intp)
+        self.safe_feature = np.maximum(self.feature, 0) # Leaves read (and ignore) feature 0
+        self.threshold = np.concatenate(thresholds)
+        # children[2 * node] is the left child, children[2 * node + 1] the right one
+        self.children = np.column_stack([np.concatenate(lefts), np.concatenate(rights)]).ravel().astype(np.intp)
+        self.value = np.concatenate(values)
+        self.missing_left = np.concatenate(missing_left)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.max_depth = max_depth # Traversal steps needed to reach every leaf
+
+        # (n_trees, n_outputs) 0/1 matrix summing leaf values per output column
+        self.output_map = np.zeros((len(roots), n_outputs))
+        self.output_map[np.arange(len(roots)), outputs] = 1.0
+
+        # Constant raw prediction of the init estimator
+        self.bias = model._raw_predict_init(np.zeros((1, self.n_features_in_), dtype=np.float32))[0].astype(np.float64)
+
+    def _raw_predict_chunk(self, X: np.ndarray) -> np.ndarray:
+        n_rows, n_features = X.shape
+        flat = X.ravel()
+        row_base = (np.arange(n_rows) * n_features)[:, None]
+        node = np.broadcast_to(self.roots, (n_rows, len(self.roots))).copy()
+        has_missing = np.isnan(flat).any()
+        for _ in range(self.max_depth):
+            x = flat[row_base + self.safe_feature[node]]
+            go_right = x > self.threshold[node]
+            if has_missing:
+                go_right &= ~np.isnan(x)
+                go_right |= np.isnan(x) & ~self.missing_left[node]
+            node = self.children[2 * node + go_right]
+        return self.value[node] @ self.output_map + self.bias
+
+    def raw_predict(self, X) -> np.ndarray:
+        """
+        Raw (pre-link) scores of shape (n_rows, n_outputs).
+        """
+        # sklearn trees compare float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has {X.shape[1]} features, model expects {self.n_features_in_}.")
+        if X.shape[0] <= ROW_CHUNK:
+            return self._raw_predict_chunk(X)
+        return np.vstack([self._raw_predict_chunk(X[i:i + ROW_CHUNK]) for i in range(0, X.shape[0], ROW_CHUNK)])
+
+    def predict_proba(self, X) -> np.ndarray:
+        if not self.is_classifier:
+            raise AttributeError("predict_proba is only available for classifiers.")
+        raw = self.raw_predict(X)
+        if self.n_outputs == 1:
+            # Binary: single logit column
+            p = 1.0 / (1.0 + np.exp(-raw[:, 0]))
+            return np.column_stack([1.0 - p, p])
+        raw = raw - raw.max(axis=1, keepdims=True)
+        exp = np.exp(raw)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def predict(self, X) -> np.ndarray:
+        raw = self.raw_predict(X)
+        if not self.is_classifier:
+            return raw[:, 0]
+        if self.n_outputs == 1:
+            return self.classes_[(raw[:, 0] > 0).astype(int)]
+        return self.classes_[np.argmax(raw, axis=1)]
+
+def compile_models(models: dict) -> dict:
+    """
+    Returns {"<name>_compiled": CompiledEnsemble} for every compilable model in the set.
+    """
+    compiled = {}
+    for name in ["regressor", "classifier"]:
+        model = models.get(name)
+        if model is None:
+            continue
+        try:
+            compiled[f"{name}_compiled"] = CompiledEnsemble(model)
+        except (TypeError, ValueError) as e:
+            print(f"Skipping compiled {name}: {e}")
+    if models.get("horizon_models"):
+        compiled["horizon_models_compiled"] = {
+            h: compile_models(pair) for h, pair in models["horizon_models"].items()
+        }
+    return compiled
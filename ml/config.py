@@ -11,6 +11,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 MODELS_DIR = BASE_DIR / "models"
 EXPERIMENTS_DIR = BASE_DIR / "experiments"
+REGISTRY_DB = MODELS_DIR / "registry.db" # Index of model versions and metrics
+ARTIFACTS_DIR = MODELS_DIR / "objects" # Content-addressed, compressed model components
 
 # Tickers to track
 # Mix of US Tech and Pakistan Stock Exchange (PSX via .PA suffix)
@@ -23,6 +25,14 @@ TICKERS = [
     "NVDA",
 ] # PSX Blue Chips
 
+# Ticker universe
+# Point UNIVERSE_FILE at a .txt (one ticker per line), .csv (a "ticker" column,
+# optional "sector" column) or .json list to override the default TICKERS above.
+UNIVERSE_FILE = os.getenv("UNIVERSE_FILE")
+SHARD_SIZE = 50 # Tickers fetched/featurized together in the sharded training path
+FEATURE_STORE_DIR = DATA_DIR / "features"
+MEMORY_BUDGET_MB = int(os.getenv("MEMORY_BUDGET_MB", "512")) # Peak batch memory for out-of-core training/evaluation
+
 # Model hyperparameters (simple for "laptop-scale")
 # Model hyperparameters (simple for "laptop-scale")
 RF_N_ESTIMATORS = 100
@@ -30,6 +40,137 @@ RF_MAX_DEPTH = 15
 CLUSTERS_K = 3
 PCA_COMPONENTS = 3
 
+# Clustering stage: k is picked by silhouette among CLUSTERS_K_CANDIDATES (CLUSTERS_K_AUTO=0 keeps CLUSTERS_K)
+CLUSTERS_K_AUTO = os.getenv("CLUSTERS_K_AUTO", "1") == "1"
+CLUSTERS_K_CANDIDATES = list(range(2, 9))
+CLUSTER_CHUNK_ROWS = 50_000 # Rows per IncrementalPCA / projection chunk
+CLUSTER_BATCH_ROWS = 1024 # MiniBatchKMeans batch size
+CLUSTER_SELECTION_ROWS = 50_000 # Candidate ks are fitted on a sample this size; only the chosen k sees every row
+CLUSTER_SAMPLE_ROWS = 5000 # Projected rows the silhouette of each candidate k is measured on
+CLUSTER_WORKERS = int(os.getenv("CLUSTER_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Incremental retraining (training_flow): "incremental" updates the latest version with the
+# rows added since it was trained, falling back to a full retrain when that is unsafe; "full" always rebuilds
+TRAINING_MODE = os.getenv("TRAINING_MODE", "incremental")
+INCREMENTAL_ESTIMATORS = int(os.getenv("INCREMENTAL_ESTIMATORS", "10")) # Boosting stages added per update
+INCREMENTAL_MAX_PSI = float(os.getenv("INCREMENTAL_MAX_PSI", "0.25")) # Feature/label PSI of the new rows that forces a full retrain
+INCREMENTAL_MAX_NEW_FRACTION = 0.25 # A full retrain is cheaper than an update this large
+INCREMENTAL_MIN_NEW_ROWS = int(os.getenv("INCREMENTAL_MIN_NEW_ROWS", "500")) # Fewer new rows retrain in full instead
+INCREMENTAL_MAX_CHAIN = int(os.getenv("INCREMENTAL_MAX_CHAIN", "30")) # Updates in a row before a full retrain
+
+# Load models and run one dummy prediction when the API starts (app/main.py lifespan)
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+
+# Serve GradientBoosting models through the flattened NumPy evaluator (ml/compiled.py)
+COMPILED_INFERENCE = os.getenv("COMPILED_INFERENCE", "1") == "1"
+
+# Shadow/canary serving (app/model_pool.py). Shadows score every request off the response path;
+# canaries also serve a sticky share of tickers, e.g. CANARY_VERSIONS="version_20250101_120000:0.1"
+SHADOW_VERSIONS = [v for v in os.getenv("SHADOW_VERSIONS", "").split(",") if v]
+
+def _parse_canaries(value: str) -> dict:
+    # "version:fraction,..." -> {version: fraction}; a bad entry stops startup with the variable named
+    canaries = {}
+    for entry in value.split(","):
+        if not entry.strip():
+            continue
+        version, _, fraction = entry.strip().partition(":")
+        try:
+            share = float(fraction)
+        except ValueError:
+            share = None
+        if not version or share is None or not 0.0 <= share <= 1.0:
+            raise ValueError(f"CANARY_VERSIONS entry {entry!r} must be <version>:<fraction between 0 and 1>.")
+        canaries[version] = share
+    return canaries
+
+CANARY_VERSIONS = _parse_canaries(os.getenv("CANARY_VERSIONS", ""))
+SHADOW_WORKERS = int(os.getenv("SHADOW_WORKERS", "2"))
+SHADOW_LOG_FILE = EXPERIMENTS_DIR / "shadow_predictions.jsonl" # One JSON line per shadow/canary comparison
+
+# Admission control for the prediction endpoints (app/admission.py). Requests whose tickers are
+# all in the fresh CSV cache use the "hit" lane, the rest (network fetches) the "miss" lane.
+# Lane concurrency should stay below the threadpool size (40 by default).
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "1") == "1"
+ADMISSION_HIT_CONCURRENCY = int(os.getenv("ADMISSION_HIT_CONCURRENCY", "28"))
+ADMISSION_MISS_CONCURRENCY = int(os.getenv("ADMISSION_MISS_CONCURRENCY", "4"))
+ADMISSION_HIT_QUEUE = int(os.getenv("ADMISSION_HIT_QUEUE", "64")) # Waiting requests beyond this get 429
+ADMISSION_MISS_QUEUE = int(os.getenv("ADMISSION_MISS_QUEUE", "8"))
+ADMISSION_QUEUE_TIMEOUT_S = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_S", "2.0")) # Longer waits get 503
+SERVE_STALE_ON_OVERLOAD = os.getenv("SERVE_STALE_ON_OVERLOAD", "1") == "1" # Rejected requests get the last good response, if any
+STALE_CACHE_SIZE = 1024
+STALE_MAX_AGE_S = float(os.getenv("STALE_MAX_AGE_S", "300")) # Older remembered responses are not served stale
+
+# HTTP conditional caching (app/http_cache.py): clients may reuse a response this long, then revalidate
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "60"))
+
+# Model artifact storage & retention
+ARTIFACT_COMPRESSION_LEVEL = 6 # zlib level for stored components
+RETAIN_LAST = int(os.getenv("RETAIN_LAST", "10")) # Always keep the N newest versions
+RETAIN_BEST = int(os.getenv("RETAIN_BEST", "3")) # ...and the M best by RETAIN_METRIC
+RETAIN_METRIC = os.getenv("RETAIN_METRIC", "classification.Accuracy")
+RETAIN_HIGHER_IS_BETTER = os.getenv("RETAIN_HIGHER_IS_BETTER", "1") == "1"
+RETENTION_ON_SAVE = os.getenv("RETENTION_ON_SAVE", "0") == "1" # Apply retention after every save
+
+# Evaluation engine
+EVAL_CHUNK_ROWS = 50_000 # Rows scored per evaluation chunk
+EVAL_WORKERS = int(os.getenv("EVAL_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Forecast horizons (trading days) for the multi-horizon return/risk models
+HORIZONS = [int(h) for h in os.getenv("HORIZONS", "1,5,20").split(",")]
+HORIZON_WORKERS = int(os.getenv("HORIZON_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Per-segment next-day models (ml/segments.py): off unless SEGMENT_KEY is "sector" or "cluster"
+SEGMENT_KEY = os.getenv("SEGMENT_KEY", "")
+SEGMENT_MIN_ROWS = int(os.getenv("SEGMENT_MIN_ROWS", "500")) # Smaller segments are served by the global models
+SEGMENT_WORKERS = int(os.getenv("SEGMENT_WORKERS", str(os.cpu_count() or 1)))
+SEGMENT_CACHE_SIZE = int(os.getenv("SEGMENT_CACHE_SIZE", "32")) # Segment models kept loaded per serving process
+
+# Historical (date range) predictions are scored and streamed this many rows at a time
+RANGE_CHUNK_ROWS = 256
+# Bulk Arrow/Parquet exports (ml/export.py) are encoded in record batches of about this many rows
+EXPORT_CHUNK_ROWS = 50_000
+EXPORT_MAX_TICKERS = int(os.getenv("EXPORT_MAX_TICKERS", "500")) # Larger /export requests get 400
+
+# On-demand profiling of the serving process (app/profiling.py); /admin endpoints are off without ADMIN_TOKEN
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+PROFILE_DIR = EXPERIMENTS_DIR / "profiles"
+PROFILE_MAX_REQUESTS = 10_000 # Upper bounds for one session
+PROFILE_MAX_SECONDS = 600
+PROFILE_TOP_N = 40 # Functions / allocation sites listed in a report
+PROFILE_TRACE_FRAMES = 25 # Stack depth tracemalloc records per allocation
+
+# Raw bar cleaning applied by fetch_stock_data (ml/cleaning.py)
+CLEAN_ON_FETCH = os.getenv("CLEAN_ON_FETCH", "1") == "1"
+CLEAN_DATA_DIR = DATA_DIR / "clean" # Per-ticker cache of cleaned bars; only new bars are re-cleaned
+OUTLIER_Z = 10.0 # Returns beyond this many robust deviations are flagged as outliers
+OUTLIER_WINDOW = 60 # Trailing bars the robust deviation is measured over
+
+# Append-only archive of raw provider responses (ml/raw_archive.py)
+RAW_ARCHIVE = os.getenv("RAW_ARCHIVE", "1") == "1"
+RAW_ARCHIVE_DIR = DATA_DIR / "raw" # gzip JSON per response: <ticker>/<source>_<fetched_at>_<first>_<last>.json.gz
+REPROCESS_WORKERS = int(os.getenv("REPROCESS_WORKERS", str(os.cpu_count() or 1)))
+
+# Drift/integrity suite run on every training split (ml/drift.py)
+DRIFT_PSI_THRESHOLD = 0.25 # PSI above this is significant drift
+DRIFT_KS_THRESHOLD = 0.2 # KS statistic above this is significant drift
+DRIFT_PSI_BINS = 10
+MAX_GAP_DAYS = 7 # Calendar days between consecutive bars before a ticker is flagged
+
+# Portfolio risk: RiskMetrics decay for the EWMA return covariance
+PORTFOLIO_EWMA_DECAY = float(os.getenv("PORTFOLIO_EWMA_DECAY", "0.94"))
+
+# Cross-sectional (market/peer-relative) feature stage
+CROSS_SECTIONAL = os.getenv("CROSS_SECTIONAL", "0") == "1" # Opt-in analysis-only stage in training_flow; not model inputs
+CROSS_SECTIONAL_WINDOW = 60 # Trailing days for beta/correlation to the market
+MARKET_TICKER = os.getenv("MARKET_TICKER") # e.g. "SPY"; default is the equal-weighted universe return
+
+# Similarity search (ml/similarity.py)
+EMBEDDING_WINDOW = 20 # Trailing feature rows summarized into a ticker's behaviour embedding
+ANN_TREES = 16 # Random-projection trees in the nearest-neighbour forest
+ANN_LEAF_SIZE = 32
+ANN_EXACT_BELOW = 2048 # Smaller universes are searched exactly
+
 # Data settings
 HISTORY_YEARS = 5 # Fetch last 5 years for more data
 TEST_SIZE_DAYS = 90 # Last 90 days (approx 3 months) for testing
@@ -0,0 +1,92 @@
+from typing import Optional
+import numpy as np
+import pandas as pd
+from .config import CROSS_SECTIONAL_WINDOW, MARKET_TICKER
+
+CROSS_SECTIONAL_FEATURES = ["xs_return_rank", "beta_market", "corr_market", "sector_rel_vol"]
+
+def _wide(df: pd.DataFrame, column: str, dates, tickers, date_idx: np.ndarray, ticker_idx: np.ndarray) -> np.ndarray:
+    # Scatter a long column into a (dates x tickers) matrix; absent cells stay NaN
+    wide = np.full((len(dates), len(tickers)), np.nan)
+    wide[date_idx, ticker_idx] = df[column].to_numpy(dtype=np.float64)
+    return wide
+
+def _rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    # Column-wise trailing sums via one cumulative sum: S[t] - S[t - window]
+    csum = np.cumsum(values, axis=0)
+    out = csum.copy()
+    out[window:] -= csum[:-window]
+    return out
+
+def rolling_beta_corr(returns: np.ndarray, market: np.ndarray, window: int, min_periods: int = None):
+    """
+    Trailing-window beta and correlation of every column of returns (dates x
+    tickers) against market (dates,), from rolling sums of x, y, x*y, x^2 and
+    y^2 over the rows where both are observed. No per-ticker loop.
+    """
+    min_periods = min_periods or window
+    market = np.broadcast_to(market[:, None], returns.shape)
+    valid = ~(np.isnan(returns) | np.isnan(market))
+    x = np.where(valid, market, 0.0)
+    y = np.where(valid, returns, 0.0)
+
+    n = _rolling_sum(valid.astype(np.float64), window)
+    sx, sy = _rolling_sum(x, window), _rolling_sum(y, window)
+    sxy, sxx, syy = _rolling_sum(x * y, window), _rolling_sum(x * x, window), _rolling_sum(y * y, window)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = sxy - sx * sy / n
+        var_x = sxx - sx * sx / n
+        var_y = syy - sy * sy / n
+        beta = np.where(var_x > 0, cov / var_x, np.nan)
+        corr = np.where((var_x > 0) & (var_y > 0), cov / np.sqrt(var_x * var_y), np.nan)
+    enough = n >= min_periods
+    return np.where(enough, beta, np.nan), np.where(enough, np.clip(corr, -1, 1), np.nan)
+
+def add_cross_sectional_features(df: pd.DataFrame, sectors: Optional[pd.Series] = None,
+                                 window: int = CROSS_SECTIONAL_WINDOW,
+                                 market_ticker: Optional[str] = MARKET_TICKER) -> pd.DataFrame:
+    """
+    Adds market- and peer-relative features to the output of create_features:
+    - xs_return_rank: percentile rank of the day's return across tickers
+    - beta_market / corr_market: trailing `window`-day beta and correlation to
+      the market (market_ticker's returns if present, else the equal-weighted
+      average return of the universe)
+    - sector_rel_vol: volatility_20d relative to the sector median that day
+    Returns are pivoted into one dates x tickers matrix, every statistic is a
+    vectorized operation on that matrix, and results are gathered back onto
+    the original rows by position instead of merging.
+    sectors maps ticker -> sector (e.g. from load_universe); without it the
+    whole universe is one sector.
+    The stage is for analysis only: these columns are not FeatureSpecs and no
+    model version trains on them, because serving scores one ticker at a time
+    and has no universe to rank or regress against.
+    """
+    if df.empty:
+        return df
+    date_idx, dates = pd.factorize(df["date"], sort=True)
+    ticker_idx, tickers = pd.factorize(df["ticker"].astype(str), sort=True)
+
+    returns = _wide(df, "return", dates, tickers, date_idx, ticker_idx)
+    if market_ticker and market_ticker in set(tickers):
+        market = returns[:, list(tickers).index(market_ticker)]
+    else:
+        with np.errstate(invalid="ignore"):
+            market = np.nanmean(np.where(np.isnan(returns).all(axis=1, keepdims=True), 0.0, returns), axis=1)
+
+    rank = pd.DataFrame(returns).rank(axis=1, pct=True).to_numpy()
+    beta, corr = rolling_beta_corr(returns, market, window, min_periods=max(window // 2, 2))
+
+    vol = pd.DataFrame(_wide(df, "volatility_20d", dates, tickers, date_idx, ticker_idx), columns=tickers)
+    if sectors is not None:
+        groups = pd.Series(sectors).reindex(tickers).fillna("Unknown").to_numpy()
+    else:
+        groups = np.full(len(tickers), "All")
+    sector_median = vol.T.groupby(groups).transform("median").T.to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rel_vol = np.where(sector_median > 0, vol.to_numpy() / sector_median, np.nan)
+
+    df = df.copy()
+    for name, wide in zip(CROSS_SECTIONAL_FEATURES, [rank, beta, corr, rel_vol]):
+        df[name] = wide[date_idx, ticker_idx]
+    return df
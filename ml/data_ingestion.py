@@ -1,22 +1,56 @@
 
 import os
-from dotenv import load_dotenv
-load_dotenv()
 import pandas as pd
 import time
-import requests  # Alpha Vantage API calls
-import yfinance as yf  # fallback if Alpha Vantage fails
 from pathlib import Path
 from typing import List, Optional
-from .config import DATA_DIR
+from .config import DATA_DIR, CLEAN_ON_FETCH, RAW_ARCHIVE # Importing config also loads .env
+from .raw_archive import archive_payload, parse_alpha_vantage, parse_yfinance, yfinance_payload
+
+# requests (Alpha Vantage) and yfinance (fallback) are imported where they are
+# used, so serving from the CSV cache never pays for them.
 
 # Get Alpha Vantage API key from environment variables
 ALPHA_VANTAGE_API_KEY = os.getenv("ALPHAVANTAGE_API_KEY")
+CACHE_MAX_AGE_S = 86400 # Cached CSVs older than 24 hours are refetched
+
+def cache_is_fresh(ticker: str) -> bool:
+    """
+    True if fetch_stock_data(use_cache=True) would serve the ticker from its CSV cache
+    (assuming the file is readable), i.e. without a network fetch.
+    """
+    cache_path = DATA_DIR / f"{ticker}.csv"
+    try:
+        return (time.time() - cache_path.stat().st_mtime) <= CACHE_MAX_AGE_S
+    except OSError:
+        return False
 
-def fetch_stock_data(tickers: List[str], use_cache: bool = True) -> pd.DataFrame:
+def cached_last_bar(ticker: str) -> Optional[pd.Timestamp]:
+    """
+    Date of the newest bar in a ticker's fresh CSV cache, read from the file's
+    last line (the cache is sorted by date and starts with the date column).
+    None if there is no fresh cache, i.e. a request would fetch new data.
+    """
+    if not cache_is_fresh(ticker):
+        return None
+    try:
+        with open(DATA_DIR / f"{ticker}.csv", "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(f.tell() - 512, 0))
+            last_line = f.read().rstrip().rsplit(b"\n", 1)[-1].decode()
+        return pd.Timestamp(last_line.split(",", 1)[0])
+    except (OSError, ValueError):
+        return None
+
+def fetch_stock_data(tickers: List[str], use_cache: bool = True, clean: bool = CLEAN_ON_FETCH) -> pd.DataFrame:
     """
     Fetches daily stock data for the given tickers using Alpha Vantage API.
-    Returns a combined DataFrame with columns: [ticker, date, open, high, low, close, volume]
+    The CSV cache keeps the raw bars with their split_coefficient and dividend_amount;
+    with RAW_ARCHIVE every provider response is also archived as received, and
+    scripts/reprocess_raw.py rebuilds the CSV cache from the archive offline.
+    With clean=True (the default) the result goes through ml.cleaning.clean_incremental
+    and has columns: [ticker, date, open, high, low, close, volume, filled, outlier];
+    otherwise the raw columns are returned.
     """
     if not ALPHA_VANTAGE_API_KEY:
         raise ValueError("ALPHA_VANTAGE_API_KEY environment variable not set.")
@@ -32,8 +66,7 @@ def fetch_stock_data(tickers: List[str], use_cache: bool = True) -> pd.DataFrame
         # Simple cache logic
         if use_cache and cache_path.exists():
             # Check if cache is stale (older than 24 hours)
-            last_modified = cache_path.stat().st_mtime
-            if (time.time() - last_modified) > 86400: # 24 hours in seconds
+            if not cache_is_fresh(ticker):
                 print(f"Cache for {ticker} is expired (>24h). Refetching...")
             else:
                 print(f"Loading {ticker} from cache...")
@@ -48,6 +81,7 @@ def fetch_stock_data(tickers: List[str], use_cache: bool = True) -> pd.DataFrame
         print(f"Fetching {ticker} from Alpha Vantage...")
         
         try:
+            import requests  # Alpha Vantage API calls
             url = f"https://www.alphavantage.co/query?function=TIME_SERIES_DAILY_ADJUSTED&symbol={ticker}&outputsize=full&apikey={ALPHA_VANTAGE_API_KEY}"
             response = requests.get(url)
             response.raise_for_status() # Raise an exception for HTTP errors
@@ -57,27 +91,20 @@ def fetch_stock_data(tickers: List[str], use_cache: bool = True) -> pd.DataFrame
             if "Information" in data and "premium" in data["Information"].lower():
                 print(f"Alpha Vantage premium limit reached for {ticker}, falling back to yfinance")
                 try:
+                    import yfinance as yf  # fallback if Alpha Vantage fails
                     yf_ticker = yf.Ticker(ticker)
                     hist = yf_ticker.history(period="5y")
                     if hist.empty:
                         print(f"yfinance returned empty data for {ticker}")
                         continue
-                    hist = hist.reset_index().rename(columns={
-                        "Date": "date",
-                        "Open": "open",
-                        "High": "high",
-                        "Low": "low",
-                        "Close": "close",
-                        "Volume": "volume",
-                    })
-                    hist["date"] = pd.to_datetime(hist["date"], utc=True)
-                    df = hist[["date", "open", "high", "low", "close", "volume"]].copy()
+                    payload = yfinance_payload(hist)
+                    if RAW_ARCHIVE:
+                        archive_payload(ticker, "yfinance", payload)
+                    df = parse_yfinance(payload, ticker)
                 except Exception as e:
                     print(f"yfinance error for {ticker}: {e}")
                     continue
                 # Append and skip the rest of Alpha Vantage processing
-                df["ticker"] = ticker
-                df = df.sort_values("date")
                 if use_cache:
                     df.to_csv(cache_path, index=False)
                 all_data.append(df)
@@ -101,37 +128,11 @@ def fetch_stock_data(tickers: List[str], use_cache: bool = True) -> pd.DataFrame
                 print(f"Warning: No daily time series data found for {ticker}")
                 continue
 
-            # Convert the time series data to a DataFrame
-            hist = pd.DataFrame.from_dict(time_series, orient="index")
-            hist.index.name = "date"
-            hist = hist.reset_index()
-
-            # Rename columns to a standardized format
-            # Alpha Vantage gives: 1. open, 2. high, 3. low, 4. close, 5. adjusted close, 6. volume, 7. dividend amount, 8. split coefficient
-            hist.columns = [
-                "date", "open", "high", "low", "close", "adjusted close",
-                "volume", "dividend amount", "split coefficient"
-            ]
-            
-            # Convert date column to datetime objects
-            hist["date"] = pd.to_datetime(hist["date"], utc=True)
-
-            # Standardize columns
-            needed_cols = ["date", "open", "high", "low", "close", "volume"]
-            # Ensure all needed columns exist and are numeric
-            for col in needed_cols[1:]: # Skip 'date'
-                hist[col] = pd.to_numeric(hist[col], errors='coerce')
-            
-            if not all(col in hist.columns for col in needed_cols):
-                 print(f"Missing columns for {ticker}. Found: {hist.columns}")
-                 continue
+            # Keep the full response so parsing can be redone offline (ml/raw_archive.py)
+            if RAW_ARCHIVE:
+                archive_payload(ticker, "alpha_vantage", data)
+            df = parse_alpha_vantage(data, ticker)
 
-            df = hist[needed_cols].copy()
-            df["ticker"] = ticker
-            
-            # Sort
-            df = df.sort_values("date")
-            
             # Cache it
             if use_cache:
                 df.to_csv(cache_path, index=False)
@@ -148,6 +149,9 @@ def fetch_stock_data(tickers: List[str], use_cache: bool = True) -> pd.DataFrame
         return pd.DataFrame()
 
     combined_df = pd.concat(all_data, ignore_index=True)
+    if clean:
+        from .cleaning import clean_incremental, clean_ohlcv
+        combined_df, _ = clean_incremental(combined_df) if use_cache else clean_ohlcv(combined_df)
     return combined_df
 
 
@@ -1,14 +1,21 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
+from .config import DRIFT_PSI_THRESHOLD, DRIFT_KS_THRESHOLD, DRIFT_PSI_BINS, MAX_GAP_DAYS, EVAL_WORKERS
 
 def check_data_integrity(df: pd.DataFrame) -> dict:
     """
-    Checks for basic data integrity issues.
+    Checks for basic data integrity issues. Duplicate bars and non-positive
+    prices fail the check; on cleaned data (ml/cleaning.py) the forward-filled
+    and outlier bars are counted as well.
     """
     report = {
         "passed": True,
         "missing_values": {},
-        "empty_ticker_data": []
+        "empty_ticker_data": [],
+        "duplicate_bars": 0,
+        "non_positive_prices": 0,
     }
     
     if df.empty:
@@ -28,7 +35,17 @@ def check_data_integrity(df: pd.DataFrame) -> dict:
         if count < 50:
             report["empty_ticker_data"].append(ticker)
             report["passed"] = False
-            
+
+    if "date" in df.columns:
+        report["duplicate_bars"] = int(df.duplicated(["ticker", "date"]).sum())
+    prices = [c for c in ["open", "high", "low", "close"] if c in df.columns]
+    report["non_positive_prices"] = int((df[prices] <= 0).any(axis=1).sum()) if prices else 0
+    if report["duplicate_bars"] or report["non_positive_prices"]:
+        report["passed"] = False
+    for flag in ["filled", "outlier"]:
+        if flag in df.columns:
+            report[f"{flag}_bars"] = int(df[flag].sum())
+
     return report
 
 def check_feature_drift(train_df: pd.DataFrame, new_df: pd.DataFrame, features: list) -> dict:
@@ -120,3 +137,135 @@ def run_deepchecks_suite(train_df: pd.DataFrame, test_df: pd.DataFrame) -> dict:
         }
 
 
+
+# --- Native drift/integrity suite ---
+
+def ks_statistic(reference, current) -> tuple:
+    """
+    Two-sample Kolmogorov-Smirnov statistic and asymptotic p-value.
+    Both empirical CDFs are evaluated on the pooled sample with binary searches.
+    """
+    a = np.sort(reference)
+    b = np.sort(current)
+    n, m = len(a), len(b)
+    pooled = np.concatenate([a, b])
+    d = float(np.abs(np.searchsorted(a, pooled, side="right") / n - np.searchsorted(b, pooled, side="right") / m).max())
+    # Kolmogorov distribution with Stephens' small-sample correction
+    en = np.sqrt(n * m / (n + m))
+    lam = (en + 0.12 + 0.11 / en) * d
+    j = np.arange(1, 101)
+    p_value = float(np.clip(2 * np.sum((-1.0) ** (j - 1) * np.exp(-2 * j ** 2 * lam ** 2)), 0.0, 1.0))
+    return d, p_value
+
+def population_stability_index(reference, current, bins: int = DRIFT_PSI_BINS) -> float:
+    """
+    PSI over quantile bins of the reference sample: sum((c - r) * ln(c / r)).
+    """
+    edges = np.unique(np.quantile(reference, np.linspace(0, 1, bins + 1))[1:-1])
+    ref = np.bincount(np.searchsorted(edges, reference, side="right"), minlength=len(edges) + 1) / len(reference)
+    cur = np.bincount(np.searchsorted(edges, current, side="right"), minlength=len(edges) + 1) / len(current)
+    # Empty bins would make the log undefined
+    ref, cur = np.clip(ref, 1e-4, None), np.clip(cur, 1e-4, None)
+    return float(np.sum((cur - ref) * np.log(cur / ref)))
+
+def categorical_psi(reference, current) -> float:
+    """
+    PSI between the class frequencies of two label samples.
+    """
+    classes = np.union1d(np.unique(reference), np.unique(current))
+    ref = np.array([(reference == c).mean() for c in classes])
+    cur = np.array([(current == c).mean() for c in classes])
+    ref, cur = np.clip(ref, 1e-4, None), np.clip(cur, 1e-4, None)
+    return float(np.sum((cur - ref) * np.log(cur / ref)))
+
+def _feature_drift(name: str, reference: np.ndarray, current: np.ndarray) -> dict:
+    reference = reference[~np.isnan(reference)]
+    current = current[~np.isnan(current)]
+    if len(reference) == 0 or len(current) == 0:
+        return {"feature": name, "ks": None, "ks_pvalue": None, "psi": None, "drift_detected": False}
+    ks, p_value = ks_statistic(reference, current)
+    psi = population_stability_index(reference, current)
+    return {
+        "feature": name,
+        "ks": ks,
+        "ks_pvalue": p_value,
+        "psi": psi,
+        "drift_detected": bool(psi > DRIFT_PSI_THRESHOLD or ks > DRIFT_KS_THRESHOLD)
+    }
+
+def _ticker_integrity(df: pd.DataFrame, min_rows: int = 50) -> dict:
+    # Row counts, largest calendar gap between bars and duplicate dates, per ticker, without a Python loop over tickers
+    dates = pd.to_datetime(df["date"])
+    keyed = pd.DataFrame({"ticker": df["ticker"].to_numpy(), "date": dates.to_numpy()}).sort_values(["ticker", "date"])
+    rows = keyed.groupby("ticker").size()
+    gaps = keyed.groupby("ticker")["date"].diff().dt.days
+    max_gap = gaps.groupby(keyed["ticker"]).max().fillna(0)
+    duplicates = keyed.duplicated(["ticker", "date"]).groupby(keyed["ticker"]).sum()
+    return {
+        "rows_per_ticker": {str(t): int(n) for t, n in rows.items()},
+        "short_tickers": sorted(str(t) for t in rows[rows < min_rows].index),
+        "max_gap_days": {str(t): int(g) for t, g in max_gap.items()},
+        "gap_tickers": sorted(str(t) for t in max_gap[max_gap > MAX_GAP_DAYS].index),
+        "duplicate_dates": {str(t): int(n) for t, n in duplicates[duplicates > 0].items()}
+    }
+
+def run_drift_suite(train_df: pd.DataFrame, test_df: pd.DataFrame, features: list = None,
+                    label_cols: tuple = ("target_return_next_day", "risk_class"), n_jobs: int = None) -> dict:
+    """
+    Native replacement for run_deepchecks_suite.
+    Per feature (in parallel threads): KS statistic/p-value and PSI between
+    the train and test splits. Labels: KS for numeric targets, class-frequency
+    PSI for risk_class. Integrity: per-ticker row counts, date gaps and
+    duplicate dates in both splits. Returns a JSON-serializable report.
+    """
+    start = time.perf_counter()
+    if features is None:
+        features = [c for c in train_df.select_dtypes("number").columns
+                    if c in test_df.columns and c not in label_cols]
+
+    columns = [(f, train_df[f].to_numpy(dtype=np.float64), test_df[f].to_numpy(dtype=np.float64)) for f in features]
+    with ThreadPoolExecutor(max_workers=n_jobs or EVAL_WORKERS) as pool:
+        results = list(pool.map(lambda args: _feature_drift(*args), columns))
+    feature_report = {r.pop("feature"): r for r in results}
+
+    label_report = {}
+    for col in label_cols:
+        if col not in train_df.columns or col not in test_df.columns:
+            continue
+        reference = train_df[col].dropna().to_numpy()
+        current = test_df[col].dropna().to_numpy()
+        if len(reference) == 0 or len(current) == 0:
+            continue
+        if col == "risk_class" or col.startswith("risk_class_"):
+            psi = categorical_psi(reference, current)
+            label_report[col] = {"psi": psi, "drift_detected": bool(psi > DRIFT_PSI_THRESHOLD)}
+        else:
+            ks, p_value = ks_statistic(reference.astype(np.float64), current.astype(np.float64))
+            label_report[col] = {"ks": ks, "ks_pvalue": p_value, "drift_detected": bool(ks > DRIFT_KS_THRESHOLD)}
+
+    integrity = {name: _ticker_integrity(df) for name, df in [("train", train_df), ("test", test_df)]}
+    missing_in_test = sorted(set(integrity["train"]["rows_per_ticker"]) - set(integrity["test"]["rows_per_ticker"]))
+
+    failures = [f"Feature drift: {f}" for f, r in feature_report.items() if r["drift_detected"]]
+    failures += [f"Label drift: {c}" for c, r in label_report.items() if r["drift_detected"]]
+    for name, report in integrity.items():
+        if report["duplicate_dates"]:
+            failures.append(f"Duplicate dates ({name}): {sorted(report['duplicate_dates'])}")
+        if report["gap_tickers"]:
+            failures.append(f"Date gaps > {MAX_GAP_DAYS} days ({name}): {report['gap_tickers']}")
+    if integrity["train"]["short_tickers"]:
+        failures.append(f"Insufficient train rows: {integrity['train']['short_tickers']}")
+    if missing_in_test:
+        failures.append(f"Tickers missing from test split: {missing_in_test}")
+
+    n_checks = len(feature_report) + len(label_report) + 5
+    return {
+        "passed": not failures,
+        "failures": failures,
+        "score": 1.0 - len(failures) / n_checks,
+        "mode": "Native",
+        "features": feature_report,
+        "labels": label_report,
+        "integrity": {**integrity, "missing_in_test": missing_in_test},
+        "duration_s": time.perf_counter() - start
+    }
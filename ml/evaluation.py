@@ -1,54 +1,312 @@
 import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterator, Optional
 import pandas as pd
 import numpy as np
-from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score, accuracy_score, f1_score, precision_score, recall_score
-from .config import EXPERIMENTS_DIR
-from datetime import datetime
+from .config import EXPERIMENTS_DIR, EVAL_CHUNK_ROWS, EVAL_WORKERS
+from .feature_store import FeatureStore
+from .segments import SegmentModels
+
+# Segment key of rows served by the global models
+GLOBAL_SEGMENT = "global"
 
-def evaluate_models(models: dict, df_test: pd.DataFrame) -> dict:
+class RegressionAccumulator:
     """
-    Evaluates trained models on test data.
+    Streaming RMSE/MAE/R2. Keeps only sums (and a running mean/M2 of the target
+    for R2's total sum of squares), so chunks can be scored independently and merged.
     """
-    features = models["features"]
-    X_test = df_test[features]
-    y_reg_test = df_test["target_return_next_day"]
-    y_clf_test = df_test["risk_class"]
-    
-    # Regression metrics
-    y_reg_pred = models["regressor"].predict(X_test)
-    rmse = np.sqrt(mean_squared_error(y_reg_test, y_reg_pred))
-    mae = mean_absolute_error(y_reg_test, y_reg_pred)
-    r2 = r2_score(y_reg_test, y_reg_pred)
-    
-    # Classification metrics
-    y_clf_pred = models["classifier"].predict(X_test)
-    acc = accuracy_score(y_clf_test, y_clf_pred)
-    f1 = f1_score(y_clf_test, y_clf_pred, average="weighted")
-    precision = precision_score(y_clf_test, y_clf_pred, average="weighted", zero_division=0)
-    recall = recall_score(y_clf_test, y_clf_pred, average="weighted", zero_division=0)
-    
-    metrics = {
-        "timestamp": datetime.now().isoformat(),
-        "regression": {
-            "RMSE": rmse,
-            "MAE": mae,
+
+    def __init__(self):
+        self.n = 0
+        self.sse = 0.0
+        self.sae = 0.0
+        self.mean_y = 0.0
+        self.m2_y = 0.0
+
+    def update(self, y_true, y_pred):
+        y_true = np.asarray(y_true, dtype=np.float64)
+        y_pred = np.asarray(y_pred, dtype=np.float64)
+        if len(y_true) == 0:
+            return
+        other = RegressionAccumulator()
+        err = y_true - y_pred
+        other.n = len(y_true)
+        other.sse = float(np.dot(err, err))
+        other.sae = float(np.abs(err).sum())
+        other.mean_y = float(y_true.mean())
+        other.m2_y = float(((y_true - other.mean_y) ** 2).sum())
+        self.merge(other)
+
+    def merge(self, other: "RegressionAccumulator"):
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        # Chan et al. parallel variance update
+        delta = other.mean_y - self.mean_y
+        self.m2_y += other.m2_y + delta * delta * self.n * other.n / n
+        self.mean_y += delta * other.n / n
+        self.sse += other.sse
+        self.sae += other.sae
+        self.n = n
+
+    def result(self) -> dict:
+        if self.n == 0:
+            return {"RMSE": None, "MAE": None, "R2": None}
+        if self.n < 2:
+            r2 = None
+        elif self.m2_y == 0:
+            # Same convention as sklearn's r2_score for a constant target
+            r2 = 1.0 if self.sse == 0 else 0.0
+        else:
+            r2 = 1.0 - self.sse / self.m2_y
+        return {
+            "RMSE": float(np.sqrt(self.sse / self.n)),
+            "MAE": self.sae / self.n,
             "R2": r2
-        },
-        "classification": {
-            "Accuracy": acc,
-            "F1": f1,
-            "Precision": precision,
-            "Recall": recall
         }
-    }
-    
-    # Save metrics
-    EXPERIMENTS_DIR.mkdir(parents=True, exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    with open(EXPERIMENTS_DIR / f"metrics_{timestamp}.json", "w") as f:
-        json.dump(metrics, f, indent=4)
-        
-    print(f"Metrics saved to experiments/metrics_{timestamp}.json")
-    return metrics
 
+class ConfusionAccumulator:
+    """
+    Streaming confusion matrix; accuracy and support-weighted
+    F1/precision/recall (zero_division=0) are derived from it.
+    """
+
+    def __init__(self, labels=()):
+        self.labels = list(labels)
+        self.matrix = np.zeros((len(self.labels), len(self.labels)), dtype=np.int64)
+
+    def _grow(self, labels):
+        new = [label for label in labels if label not in self.labels]
+        if new:
+            size = len(self.labels) + len(new)
+            matrix = np.zeros((size, size), dtype=np.int64)
+            matrix[:len(self.labels), :len(self.labels)] = self.matrix
+            self.labels.extend(new)
+            self.matrix = matrix
+
+    def update(self, y_true, y_pred):
+        y_true = np.asarray(y_true)
+        y_pred = np.asarray(y_pred)
+        if len(y_true) == 0:
+            return
+        uniques, codes = np.unique(np.concatenate([y_true, y_pred]), return_inverse=True)
+        self._grow(uniques.tolist())
+        index = np.array([self.labels.index(label) for label in uniques.tolist()])
+        true_idx = index[codes[:len(y_true)]]
+        pred_idx = index[codes[len(y_true):]]
+        k = len(self.labels)
+        self.matrix += np.bincount(true_idx * k + pred_idx, minlength=k * k).reshape(k, k)
+
+    def merge(self, other: "ConfusionAccumulator"):
+        self._grow(other.labels)
+        index = [self.labels.index(label) for label in other.labels]
+        self.matrix[np.ix_(index, index)] += other.matrix
+
+    def result(self) -> dict:
+        total = self.matrix.sum()
+        if total == 0:
+            return {"Accuracy": None, "F1": None, "Precision": None, "Recall": None}
+        tp = np.diag(self.matrix).astype(np.float64)
+        support = self.matrix.sum(axis=1).astype(np.float64)
+        predicted = self.matrix.sum(axis=0).astype(np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            precision = np.where(predicted > 0, tp / predicted, 0.0)
+            recall = np.where(support > 0, tp / support, 0.0)
+            f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+        weights = support / support.sum()
+        return {
+            "Accuracy": float(tp.sum() / total),
+            "F1": float((f1 * weights).sum()),
+            "Precision": float((precision * weights).sum()),
+            "Recall": float((recall * weights).sum())
+        }
+
+class EvaluationAccumulator:
+    """
+    Overall metrics plus per-ticker and per-period breakdowns; with segment
+    models, also per segment for the models that serve it (by_segment) and
+    for the global models on the same rows (global_by_segment).
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.regression = RegressionAccumulator()
+        self.classification = ConfusionAccumulator()
+        self.groups = {"by_ticker": {}, "by_period": {}, "by_horizon": {}, "by_segment": {}, "global_by_segment": {}}
+
+    def _group(self, breakdown: str, key) -> "EvaluationAccumulator":
+        groups = self.groups[breakdown]
+        if key not in groups:
+            groups[key] = EvaluationAccumulator()
+        return groups[key]
 
+    def update(self, y_reg, reg_pred, y_clf, clf_pred, tickers=None, periods=None, segments=None):
+        self.n += len(y_reg)
+        self.regression.update(y_reg, reg_pred)
+        self.classification.update(y_clf, clf_pred)
+        for breakdown, keys in [("by_ticker", tickers), ("by_period", periods), ("by_segment", segments)]:
+            if keys is None:
+                continue
+            # Sort once and slice each group instead of masking per group
+            uniques, codes = np.unique(keys, return_inverse=True)
+            order = np.argsort(codes, kind="stable")
+            bounds = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(uniques)))])
+            for i, key in enumerate(uniques.tolist()):
+                idx = order[bounds[i]:bounds[i + 1]]
+                group = self._group(breakdown, key)
+                group.n += len(idx)
+                group.regression.update(y_reg[idx], reg_pred[idx])
+                group.classification.update(y_clf[idx], clf_pred[idx])
+
+    def merge(self, other: "EvaluationAccumulator"):
+        self.n += other.n
+        self.regression.merge(other.regression)
+        self.classification.merge(other.classification)
+        for breakdown, groups in other.groups.items():
+            for key, group in groups.items():
+                self._group(breakdown, key).merge(group)
+
+    def result(self) -> dict:
+        metrics = {
+            "n_rows": self.n,
+            "regression": self.regression.result(),
+            "classification": self.classification.result()
+        }
+        for breakdown, groups in self.groups.items():
+            if groups:
+                metrics[breakdown] = {
+                    str(key): {
+                        "n_rows": group.n,
+                        "regression": group.regression.result(),
+                        "classification": group.classification.result()
+                    }
+                    for key, group in sorted(groups.items())
+                }
+        return metrics
+
+class JsonMetricsSink:
+    """
+    Writes each evaluation result to <directory>/metrics_<timestamp>.json.
+    """
+
+    def __init__(self, directory: Optional[Path] = None):
+        self.directory = Path(directory) if directory is not None else EXPERIMENTS_DIR
+        self.last_path = None
+
+    def __call__(self, metrics: dict):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.last_path = self.directory / f"metrics_{timestamp}.json"
+        with open(self.last_path, "w") as f:
+            json.dump(metrics, f, indent=4)
+        print(f"Metrics saved to {self.last_path}")
+
+def _iter_chunks(data, columns, chunk_rows: int, memory_budget_mb: float = None) -> Iterator[pd.DataFrame]:
+    if isinstance(data, FeatureStore):
+        yield from data.iter_frames(columns, batch_size=chunk_rows, memory_budget_mb=memory_budget_mb)
+    else:
+        available = [c for c in columns if c in data.columns]
+        for start in range(0, len(data), chunk_rows):
+            yield data.iloc[start:start + chunk_rows][available]
+
+def _score_chunk(models: dict, chunk: pd.DataFrame, period_freq: Optional[str],
+                 segments: Optional[SegmentModels] = None) -> EvaluationAccumulator:
+    features = models["features"]
+    chunk = chunk.dropna(subset=features + ["target_return_next_day", "risk_class"])
+    acc = EvaluationAccumulator()
+    if chunk.empty:
+        return acc
+
+    X = chunk[features]
+    y_reg = chunk["target_return_next_day"].to_numpy(dtype=np.float64)
+    y_clf = chunk["risk_class"].to_numpy()
+    reg_pred = np.asarray(models["regressor"].predict(X), dtype=np.float64)
+    clf_pred = np.asarray(models["classifier"].predict(X))
+    # Labels are stored as floats (NaN-able); compare them as the classifier's dtype
+    if np.issubdtype(clf_pred.dtype, np.number):
+        y_clf = y_clf.astype(clf_pred.dtype)
+
+    tickers = chunk["ticker"].astype(str).to_numpy() if "ticker" in chunk.columns else None
+    segment_keys, global_pred = None, None
+    if segments is not None and tickers is not None:
+        # Rows are scored by the models that serve their ticker, as PredictionService.models_for routes them
+        segment_keys = np.array([segments.segment(t) or GLOBAL_SEGMENT for t in tickers])
+        global_pred = reg_pred.copy(), clf_pred.copy()
+        for segment in sorted(set(segment_keys.tolist()) - {GLOBAL_SEGMENT}):
+            mask = segment_keys == segment
+            pair = segments.get(tickers[mask][0])
+            reg_pred[mask] = pair["regressor"].predict(X[mask])
+            clf_pred[mask] = pair["classifier"].predict(X[mask])
+    periods = None
+    if period_freq and "date" in chunk.columns:
+        dates = pd.to_datetime(chunk["date"])
+        if dates.dt.tz is not None:
+            dates = dates.dt.tz_convert(None)
+        periods = dates.dt.to_period(period_freq).astype(str).to_numpy()
+
+    acc.update(y_reg, reg_pred, y_clf, clf_pred, tickers, periods, segment_keys)
+    if segment_keys is not None:
+        for segment in sorted(set(segment_keys.tolist()) - {GLOBAL_SEGMENT}):
+            mask = segment_keys == segment
+            group = acc._group("global_by_segment", segment)
+            group.n += int(mask.sum())
+            group.regression.update(y_reg[mask], global_pred[0][mask])
+            group.classification.update(y_clf[mask], global_pred[1][mask])
+
+    # Horizon models are scored on the same feature rows, against their own targets
+    for h, pair in (models.get("horizon_models") or {}).items():
+        reg_col, clf_col = f"target_return_{h}d", f"risk_class_{h}d"
+        if reg_col not in chunk.columns or clf_col not in chunk.columns:
+            continue
+        mask = chunk[[reg_col, clf_col]].notna().all(axis=1).to_numpy()
+        if not mask.any():
+            continue
+        X_h = X[mask]
+        h_clf_pred = np.asarray(pair["classifier"].predict(X_h))
+        group = acc._group("by_horizon", f"{h}d")
+        group.n += int(mask.sum())
+        group.regression.update(chunk.loc[mask, reg_col].to_numpy(dtype=np.float64), pair["regressor"].predict(X_h))
+        group.classification.update(chunk.loc[mask, clf_col].to_numpy().astype(h_clf_pred.dtype), h_clf_pred)
+    return acc
+
+def evaluate_models(models: dict, df_test, sink: Optional[Callable[[dict], None]] = None,
+                    chunk_rows: int = None, n_jobs: int = None, period_freq: Optional[str] = "M",
+                    memory_budget_mb: float = None) -> dict:
+    """
+    Evaluates trained models on test data.
+    df_test may be a DataFrame or a FeatureStore. Rows are scored in chunks of
+    chunk_rows across n_jobs worker threads, and metrics (overall, per ticker,
+    per period_freq period and, for horizon models, per horizon) are accumulated
+    incrementally, so the full test set is never scored in one piece.
+    With segment models, each row is scored by the models serving its ticker,
+    and metrics are also broken down per segment next to the global models'
+    metrics on the same rows.
+    Nothing is written unless a sink is given, e.g. JsonMetricsSink().
+    """
+    chunk_rows = chunk_rows or EVAL_CHUNK_ROWS
+    n_jobs = n_jobs or EVAL_WORKERS
+    columns = models["features"] + ["target_return_next_day", "risk_class", "ticker", "date"]
+    for h in models.get("horizon_models") or {}:
+        columns += [f"target_return_{h}d", f"risk_class_{h}d"]
+
+    segments = SegmentModels.from_models(models)
+    total = EvaluationAccumulator()
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        # Bound the number of chunks in flight so memory stays flat
+        pending = []
+        for chunk in _iter_chunks(df_test, columns, chunk_rows, memory_budget_mb):
+            pending.append(pool.submit(_score_chunk, models, chunk, period_freq, segments))
+            if len(pending) >= 2 * n_jobs:
+                total.merge(pending.pop(0).result())
+        for future in pending:
+            total.merge(future.result())
+
+    if total.n == 0:
+        raise ValueError("No rows with targets to evaluate.")
+
+    metrics = {"timestamp": datetime.now().isoformat(), **total.result()}
+    if sink is not None:
+        sink(metrics)
+    return metrics
@@ -0,0 +1,104 @@
+from typing import Iterable, Iterator, List
+import pandas as pd
+from .config import EXPORT_CHUNK_ROWS, RISK_LEVELS
+
+# Bulk exports of feature/prediction frames as Arrow IPC streams or Parquet.
+# pyarrow is imported where it is used, so the rest of the app does not need it.
+
+FORMATS = {"arrow": "application/vnd.apache.arrow.stream", "parquet": "application/vnd.apache.parquet"}
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Arrow/Parquet exports need pyarrow (pip install pyarrow).") from e
+    return pyarrow
+
+def prediction_columns() -> List[str]:
+    return ["predicted_return"] + [f"prob_{level.lower()}" for level in RISK_LEVELS] + ["risk_class"]
+
+def export_schema(features: List[str], predictions: bool = True):
+    """
+    Arrow schema of an export: ticker, date (UTC), the feature columns and,
+    with predictions, the return forecast, one probability per risk level
+    and the risk class.
+    """
+    pa = _pyarrow()
+    fields = [("ticker", pa.string()), ("date", pa.timestamp("ns", tz="UTC"))]
+    fields += [(name, pa.float64()) for name in features]
+    if predictions:
+        fields += [(name, pa.float64()) for name in prediction_columns()[:-1]] + [("risk_class", pa.string())]
+    return pa.schema(fields)
+
+def coalesce(frames: Iterable[pd.DataFrame], rows: int = EXPORT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    Regroups frames into frames of about `rows` rows (small per-ticker frames
+    are joined, none is split), so batches are large enough to be columnar
+    but memory stays bounded by one batch plus one input frame.
+    """
+    pending, size = [], 0
+    for frame in frames:
+        if frame.empty:
+            continue
+        pending.append(frame)
+        size += len(frame)
+        if size >= rows:
+            yield pd.concat(pending, ignore_index=True)
+            pending, size = [], 0
+    if pending:
+        yield pd.concat(pending, ignore_index=True)
+
+class _ChunkSink:
+    # Write-only file object that keeps what a writer emitted until it is drained
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+def iter_encoded(frames: Iterable[pd.DataFrame], schema, fmt: str = "arrow") -> Iterator[bytes]:
+    """
+    Encodes frames batch by batch and yields the bytes as they are produced:
+    an Arrow IPC stream (one record batch per frame) or a Parquet file (one
+    row group per frame). Only the current batch is held in memory.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; expected one of {list(FORMATS)}.")
+    pa = _pyarrow()
+    sink = _ChunkSink()
+    output = pa.PythonFile(sink, mode="w")
+    if fmt == "arrow":
+        writer = pa.ipc.new_stream(output, schema)
+    else:
+        writer = pa.parquet.ParquetWriter(output, schema)
+    for frame in frames:
+        # One record batch (row group) per frame, even if its columns arrive in pieces
+        table = pa.Table.from_pandas(frame[schema.names], schema=schema, preserve_index=False).combine_chunks()
+        writer.write_table(table)
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    data = sink.drain()
+    if data:
+        yield data
@@ -1,55 +1,131 @@
 import pandas as pd
 import numpy as np
-from .config import HISTORY_YEARS
+from .config import HISTORY_YEARS, HORIZONS
+from .feature_registry import ALL_FEATURES, INTERMEDIATES, compute_features
+from .cleaning import trading_bars
 
-def create_features(df: pd.DataFrame) -> pd.DataFrame:
+RISK_QUANTILES = (0.33, 0.66)
+# The risk label (future_vol) is the realized volatility of the next RISK_HORIZON_DAYS
+# returns, defined like every future_vol_{h}d, so risk_class == risk_class_5d
+RISK_HORIZON_DAYS = 5
+RISK_LABEL = "rms_5d" # Recorded with model versions; labels are not comparable across definitions
+# Rows missing these are still in the feature warm-up; training rows are cut on them
+WARMUP_COLUMNS = ["return_lag5", "volatility_20d"]
+
+def compute_risk_thresholds(data, column: str = "future_vol") -> dict:
+    """
+    Computes the future_vol quantiles that separate Low/Medium/High risk.
+    Accepts a DataFrame or a FeatureStore (exact quantiles with bounded memory).
+    Must be called on the training split only, then persisted with the model version.
+    """
+    from .feature_store import FeatureStore
+    if isinstance(data, FeatureStore):
+        low, high = data.quantiles(column, list(RISK_QUANTILES))
+    else:
+        vol = data[column].dropna()
+        low, high = vol.quantile(RISK_QUANTILES[0]), vol.quantile(RISK_QUANTILES[1])
+    return {"low": float(low), "high": float(high)}
+
+def label_risk_class(future_vol, thresholds: dict) -> np.ndarray:
+    """
+    Maps future volatility to 0=Low, 1=Medium, 2=High (NaN stays NaN).
+    """
+    vol = np.asarray(future_vol, dtype=np.float64)
+    labels = np.select([vol <= thresholds["low"], vol <= thresholds["high"]], [0.0, 1.0], default=2.0)
+    labels[np.isnan(vol)] = np.nan
+    return labels
+
+def compute_horizon_risk_thresholds(data, horizons=None) -> dict:
+    """
+    Risk thresholds per forecast horizon ({h: {"low", "high"}}), from future_vol_{h}d.
+    """
+    return {h: compute_risk_thresholds(data, f"future_vol_{h}d") for h in (horizons or HORIZONS)}
+
+def assign_risk_class(df: pd.DataFrame, thresholds: dict, horizon_thresholds: dict = None) -> pd.DataFrame:
+    """
+    Returns a copy of df with risk_class (and, if given, risk_class_{h}d)
+    recomputed from the given thresholds.
+    """
+    df = df.copy()
+    df["risk_class"] = label_risk_class(df["future_vol"], thresholds)
+    for h, h_thresholds in (horizon_thresholds or {}).items():
+        df[f"risk_class_{h}d"] = label_risk_class(df[f"future_vol_{h}d"], h_thresholds)
+    return df
+
+def assign_risk_class_in_store(store, thresholds: dict, horizon_thresholds: dict = None):
+    """
+    Rewrites the risk_class (and risk_class_{h}d) columns of every FeatureStore partition in place.
+    """
+    for name in store.partitions():
+        store.write_column(name, "risk_class", label_risk_class(store.column(name, "future_vol"), thresholds))
+        for h, h_thresholds in (horizon_thresholds or {}).items():
+            store.write_column(name, f"risk_class_{h}d",
+                               label_risk_class(store.column(name, f"future_vol_{h}d"), h_thresholds))
+
+def add_horizon_targets(df: pd.DataFrame, horizons=None) -> pd.DataFrame:
+    """
+    Adds, for every horizon h, target_return_{h}d (compounded return over the
+    next h days) and future_vol_{h}d (realized volatility: root mean square of
+    the next h daily returns). All horizons come from one per-ticker cumulative
+    sum plus a shift each, instead of a rolling window per horizon.
+    Assumes df is sorted by ticker and date and has a "return" column.
+    """
+    close = df["close"]
+    by_ticker = df["ticker"]
+    sq_cum = _squared_return_cumsum(df)
+    targets = {}
+    for h in (horizons or HORIZONS):
+        targets[f"target_return_{h}d"] = close.groupby(by_ticker).shift(-h) / close - 1
+        targets[f"future_vol_{h}d"] = forward_volatility(df, h, sq_cum)
+    return df.assign(**targets)
+
+def _squared_return_cumsum(df: pd.DataFrame) -> pd.Series:
+    return (df["return"] ** 2).fillna(0).groupby(df["ticker"]).cumsum()
+
+def forward_volatility(df: pd.DataFrame, h: int, sq_cum: pd.Series = None) -> pd.Series:
+    """
+    Realized volatility over the next h days: the root mean square of the
+    next h daily returns (zero-mean, as in the EWMA covariance). NaN where
+    the window runs past a ticker's last bar. Assumes df is sorted by ticker
+    and date and has a "return" column.
+    """
+    sq_cum = _squared_return_cumsum(df) if sq_cum is None else sq_cum
+    forward_sq = (sq_cum.groupby(df["ticker"]).shift(-h) - sq_cum).clip(lower=0)
+    return np.sqrt(forward_sq / h)
+
+def create_features(df: pd.DataFrame, inference: bool = False, risk_thresholds: dict = None,
+                    horizon_thresholds: dict = None, features: list = None) -> pd.DataFrame:
     """
     Generates features for time-series analysis.
     Assumes df has columns: 'ticker', 'date', 'close' etc.
+    inference=True skips target and label construction (future_vol,
+    target_return_next_day, risk_class and the per-horizon targets), which
+    serving never uses.
+    risk_thresholds / horizon_thresholds label rows with persisted thresholds;
+    if omitted they are computed from this frame.
+    features limits the computed features to those listed (and their inputs);
+    by default every registered feature is built. With inference=True, rows
+    missing any of the listed features are dropped.
     """
-    df = df.copy()
+    # Forward-filled calendar bars are not trading days (see ml/cleaning.py)
+    df = trading_bars(df).copy()
     if df.empty:
         print("Warning: Input DataFrame is empty. Skipping feature creation.")
         return df
 
     df = df.sort_values(["ticker", "date"])
 
-    # Calculate daily returns
-    df["return"] = df.groupby("ticker")["close"].pct_change()
-    
-    # Lag features
-    for lag in [1, 2, 3, 5]:
-        df[f"return_lag{lag}"] = df.groupby("ticker")["return"].shift(lag)
-    
-    # Rolling statistics
-    # Volatility (Std Dev of returns)
-    df["volatility_5d"] = df.groupby("ticker")["return"].rolling(window=5).std().reset_index(0, drop=True)
-    df["volatility_20d"] = df.groupby("ticker")["return"].rolling(window=20).std().reset_index(0, drop=True)
-    
-    # Rolling mean
-    df["ma_5d"] = df.groupby("ticker")["close"].rolling(window=5).mean().reset_index(0, drop=True)
-    df["ma_20d"] = df.groupby("ticker")["close"].rolling(window=20).mean().reset_index(0, drop=True)
-    
-    # Relative to MA
-    df["price_vs_ma20"] = (df["close"] - df["ma_20d"]) / df["ma_20d"]
-
-    # RSI (Relative Strength Index)
-    delta = df.groupby("ticker")["close"].diff()
-    gain = (delta.where(delta > 0, 0)).fillna(0)
-    loss = (-delta.where(delta < 0, 0)).fillna(0)
-    
-    avg_gain = gain.groupby(df["ticker"]).rolling(window=14).mean().reset_index(0, drop=True)
-    avg_loss = loss.groupby(df["ticker"]).rolling(window=14).mean().reset_index(0, drop=True)
-    
-    rs = avg_gain / avg_loss.replace(0, np.nan) # Avoid div by zero
-    df["rsi_14"] = 100 - (100 / (1 + rs))
-    df["rsi_14"] = df["rsi_14"].fillna(50) # Neutral fill
+    # Only the requested features and what they depend on (ml/feature_registry.py)
+    features = list(ALL_FEATURES) if features is None else list(features)
+    all_features = set(features) == set(ALL_FEATURES)
+    if not inference:
+        # Training rows are cut on the warm-up columns, whichever features were asked for
+        features = list(dict.fromkeys(features + WARMUP_COLUMNS))
+    compute_features(df, features)
+    df = df.drop(columns=[c for c in INTERMEDIATES if c in df.columns and c not in features])
 
-    # MACD (Moving Average Convergence Divergence)
-    ema_12 = df.groupby("ticker")["close"].ewm(span=12, adjust=False).mean().reset_index(0, drop=True)
-    ema_26 = df.groupby("ticker")["close"].ewm(span=26, adjust=False).mean().reset_index(0, drop=True)
-    df["macd"] = ema_12 - ema_26
-    df["macd_signal"] = df.groupby("ticker")["macd"].ewm(span=9, adjust=False).mean().reset_index(0, drop=True)
+    if inference:
+        return df.dropna(subset=WARMUP_COLUMNS if all_features else features)
 
     # Target Generation
     # Regression target: Next day return
@@ -58,26 +134,24 @@ def create_features(df: pd.DataFrame) -> pd.DataFrame:
     # Classification target: Risk Class (Forecast future volatility)
     # We define "Risk" as the volatility of returns over the NEXT 5 days.
     # This prevents leakage because the model must predict future behavior from past features.
-    df["future_vol"] = df.groupby("ticker")["return"].rolling(window=5).std().shift(-5).reset_index(0, drop=True)
+    df["future_vol"] = forward_volatility(df, RISK_HORIZON_DAYS)
+
+    # Multi-horizon targets (target_return_{h}d, future_vol_{h}d) in one vectorized pass
+    df = add_horizon_targets(df)
     
     # Drop initial NaNs from lags/rolling
-    df = df.dropna(subset=["return_lag5", "volatility_20d"])
-    
-    # Define risk classes based on future_vol quantiles
-    # We use the training portion of the data to define thresholds to be strictly correct,
-    # but for this demo, global quantiles on the whole set is fine as long as we drop NaNs.
-    df_with_target = df.dropna(subset=["future_vol"])
+    df = df.dropna(subset=WARMUP_COLUMNS)
     
-    low_thresh = df_with_target["future_vol"].quantile(0.33)
-    high_thresh = df_with_target["future_vol"].quantile(0.66)
-    
-    def get_risk_class(vol):
-        if pd.isna(vol): return np.nan
-        if vol <= low_thresh: return 0 # Low
-        elif vol <= high_thresh: return 1 # Medium
-        else: return 2 # High
-        
-    df["risk_class"] = df["future_vol"].apply(get_risk_class)
+    # Define risk classes based on future_vol quantiles.
+    # Training passes thresholds computed on the training split (see compute_risk_thresholds);
+    # without them we fall back to quantiles over this frame.
+    if risk_thresholds is None:
+        risk_thresholds = compute_risk_thresholds(df)
+    df["risk_class"] = label_risk_class(df["future_vol"], risk_thresholds)
+    if horizon_thresholds is None:
+        horizon_thresholds = compute_horizon_risk_thresholds(df)
+    for h, h_thresholds in horizon_thresholds.items():
+        df[f"risk_class_{h}d"] = label_risk_class(df[f"future_vol_{h}d"], h_thresholds)
     
     # Final cleanup: The last 5 rows will have NaN risk_class/future_vol.
     # We keep them in the dataframe returning from create_features so the Pipeline 
@@ -86,8 +160,9 @@ def create_features(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 def split_data(df: pd.DataFrame, test_size: float = 0.2, random_state: int = 42) -> tuple[pd.DataFrame, pd.DataFrame]:
-    """Randomly split the DataFrame into train and test sets.
-    Uses sklearn's train_test_split with stratification on the risk class to keep class balance.
+    """Split the DataFrame into train and test sets by date.
+    test_size is the share (float) or number (int) of the newest dates that
+    form the test split, so every ticker is in both splits.
     Returns (train_df, test_df).
     """
     if df.empty:
@@ -100,15 +175,20 @@ def split_data(df: pd.DataFrame, test_size: float = 0.2, random_state: int = 42)
     # Drop rows with NaNs in the target columns
     df_clean = df.dropna(subset=required).copy()
     # Strict Time-Series Split (No Shuffle) to prevent data leakage.
-    # Assumption: df is already sorted by date (handled in create_features).
+    # The cut is made on dates, not rows: create_features sorts by ticker, so the last rows
+    # would be the last ticker's only. Every ticker's newest dates go to the test split.
+    dates = pd.to_datetime(df_clean["date"]) if "date" in df_clean.columns else pd.Series(np.arange(len(df_clean)))
+    unique_dates = np.sort(dates.unique())
     if isinstance(test_size, float):
-        train_size = int(len(df_clean) * (1 - test_size))
+        n_test = len(unique_dates) - int(len(unique_dates) * (1 - test_size))
     else:
-        # Assumes int means number of test samples (e.g. days)
-        train_size = len(df_clean) - int(test_size)
-        
-    train_df = df_clean.iloc[:train_size]
-    test_df = df_clean.iloc[train_size:]
+        # Assumes int means number of test dates (e.g. days)
+        n_test = int(test_size)
+    n_test = min(max(n_test, 0), len(unique_dates))
+    is_test = (dates >= unique_dates[-n_test]).to_numpy() if n_test else np.zeros(len(df_clean), dtype=bool)
+
+    train_df = df_clean[~is_test]
+    test_df = df_clean[is_test]
     
     print(f"Time-Series Split: Train={len(train_df)}, Test={len(test_df)}")
     return train_df, test_df
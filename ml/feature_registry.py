@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Every feature create_features can produce, declared once and used by both
+# training and serving, so the two cannot compute a feature differently.
+# Computations receive the frame sorted by ticker and date with their inputs
+# already present, and return a column aligned with it.
+
+class FeatureSpec:
+    """
+    A feature: the columns it is computed from (raw bar columns or other
+    features), how many earlier rows of those inputs one value needs
+    (lookback; None if it depends on the whole history, like an EWM), and
+    its computation.
+    """
+
+    def __init__(self, name: str, inputs: Tuple[str, ...], lookback: Optional[int],
+                 compute: Callable[[pd.DataFrame], pd.Series]):
+        self.name = name
+        self.inputs = tuple(inputs)
+        self.lookback = lookback
+        self.compute = compute
+
+    def __repr__(self) -> str:
+        return f"FeatureSpec({self.name!r}, inputs={self.inputs}, lookback={self.lookback})"
+
+def _by_ticker(df: pd.DataFrame, column: str):
+    return df.groupby("ticker")[column]
+
+def _rolling(column: str, window: int, how: str):
+    def compute(df):
+        return getattr(_by_ticker(df, column).rolling(window=window), how)().reset_index(0, drop=True)
+    return compute
+
+def _ewm(column: str, span: int):
+    def compute(df):
+        return _by_ticker(df, column).ewm(span=span, adjust=False).mean().reset_index(0, drop=True)
+    return compute
+
+def _lag(column: str, lag: int):
+    def compute(df):
+        return _by_ticker(df, column).shift(lag)
+    return compute
+
+def _rsi(window: int):
+    def compute(df):
+        delta = _by_ticker(df, "close").diff()
+        gain = (delta.where(delta > 0, 0)).fillna(0)
+        loss = (-delta.where(delta < 0, 0)).fillna(0)
+        avg_gain = gain.groupby(df["ticker"]).rolling(window=window).mean().reset_index(0, drop=True)
+        avg_loss = loss.groupby(df["ticker"]).rolling(window=window).mean().reset_index(0, drop=True)
+        rs = avg_gain / avg_loss.replace(0, np.nan) # Avoid div by zero
+        return (100 - (100 / (1 + rs))).fillna(50) # Neutral fill
+    return compute
+
+RAW_COLUMNS = ("ticker", "date", "open", "high", "low", "close", "volume")
+
+FEATURE_SPECS: Dict[str, FeatureSpec] = {spec.name: spec for spec in [
+    # Daily close-to-close return
+    FeatureSpec("return", ("close",), 1, lambda df: _by_ticker(df, "close").pct_change()),
+    # Lag features
+    *[FeatureSpec(f"return_lag{lag}", ("return",), lag, _lag("return", lag)) for lag in [1, 2, 3, 5]],
+    # Volatility (std dev of returns)
+    FeatureSpec("volatility_5d", ("return",), 4, _rolling("return", 5, "std")),
+    FeatureSpec("volatility_20d", ("return",), 19, _rolling("return", 20, "std")),
+    # Rolling means and price relative to the 20-day mean
+    FeatureSpec("ma_5d", ("close",), 4, _rolling("close", 5, "mean")),
+    FeatureSpec("ma_20d", ("close",), 19, _rolling("close", 20, "mean")),
+    FeatureSpec("price_vs_ma20", ("close", "ma_20d"), 0, lambda df: (df["close"] - df["ma_20d"]) / df["ma_20d"]),
+    # RSI (Relative Strength Index)
+    FeatureSpec("rsi_14", ("close",), 14, _rsi(14)),
+    # MACD (Moving Average Convergence Divergence); EWMs depend on the whole history
+    FeatureSpec("ema_12", ("close",), None, _ewm("close", 12)),
+    FeatureSpec("ema_26", ("close",), None, _ewm("close", 26)),
+    FeatureSpec("macd", ("ema_12", "ema_26"), 0, lambda df: df["ema_12"] - df["ema_26"]),
+    FeatureSpec("macd_signal", ("macd",), None, _ewm("macd", 9)),
+]}
+
+# Computed only as inputs of other features; create_features drops them
+INTERMEDIATES = ("ema_12", "ema_26")
+# Columns create_features has always produced
+ALL_FEATURES = [name for name in FEATURE_SPECS if name not in INTERMEDIATES]
+
+def feature_plan(names: Iterable[str]) -> List[FeatureSpec]:
+    """
+    The specs needed to compute names, dependencies first, each once.
+    Raw columns are taken as given; unknown names raise KeyError.
+    """
+    plan, seen = [], set()
+
+    def visit(name: str, path: tuple):
+        if name in seen or name in RAW_COLUMNS:
+            return
+        if name in path:
+            raise ValueError(f"Feature dependency cycle: {' -> '.join(path + (name,))}")
+        if name not in FEATURE_SPECS:
+            raise KeyError(f"Unknown feature {name!r}.")
+        spec = FEATURE_SPECS[name]
+        for dependency in spec.inputs:
+            visit(dependency, path + (name,))
+        seen.add(name)
+        plan.append(spec)
+
+    for name in names:
+        visit(name, ())
+    return plan
+
+def required_history(names: Iterable[str]) -> Optional[int]:
+    """
+    Rows of bar history per ticker needed for the last row to have every
+    feature in names exactly as over the full history; None when one of
+    them depends on the whole history.
+    """
+    depth: Dict[str, Optional[int]] = {}
+    for spec in feature_plan(names):
+        inputs = [0 if i in RAW_COLUMNS else depth[i] for i in spec.inputs]
+        if spec.lookback is None or None in inputs:
+            depth[spec.name] = None
+        else:
+            depth[spec.name] = spec.lookback + max(inputs, default=0)
+    needed = [0 if n in RAW_COLUMNS else depth[n] for n in names]
+    return None if None in needed else max(needed, default=0) + 1
+
+def history_tail(df: pd.DataFrame, names: Iterable[str], rows: int = 1) -> pd.DataFrame:
+    """
+    The last bars of each ticker that are enough to compute names for its
+    last `rows` rows (the whole frame if a feature needs all history).
+    """
+    needed = required_history(names)
+    if needed is None:
+        return df
+    return df.sort_values(["ticker", "date"]).groupby("ticker").tail(needed + rows - 1)
+
+def compute_features(df: pd.DataFrame, names: Iterable[str]) -> pd.DataFrame:
+    """
+    Adds names (and the intermediates they depend on) to df, which must be
+    sorted by ticker and date.
+    """
+    for spec in feature_plan(names):
+        df[spec.name] = spec.compute(df)
+    return df
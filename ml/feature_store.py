@@ -0,0 +1,230 @@
+import json
+import shutil
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+import numpy as np
+import pandas as pd
+from .config import FEATURE_STORE_DIR, MEMORY_BUDGET_MB
+
+SCHEMA_FILE = "_schema.json"
+
+# sklearn makes a few working copies of each batch (validation, float32 casts),
+# so size batches well below the raw budget.
+BATCH_OVERHEAD_FACTOR = 4
+
+class FeatureStore:
+    """
+    On-disk feature dataset made of independent partitions (one per shard).
+    Each partition is a directory holding one .npy file per column, so columns
+    can be memory-mapped and read in fixed-size batches without loading the
+    partition (or the universe) into memory.
+    """
+
+    def __init__(self, root: Optional[Path] = None):
+        self.root = Path(root) if root is not None else FEATURE_STORE_DIR
+
+    # --- Writing ---
+
+    def write_partition(self, name: str, df: pd.DataFrame) -> Path:
+        """
+        Writes a single partition column by column and returns its directory.
+        """
+        part_dir = self.root / name
+        if part_dir.exists():
+            shutil.rmtree(part_dir)
+        part_dir.mkdir(parents=True)
+
+        schema = {"num_rows": len(df), "columns": {}}
+        for col in df.columns:
+            series = df[col]
+            tz = None
+            if isinstance(series.dtype, pd.DatetimeTZDtype):
+                tz = str(series.dt.tz)
+                series = series.dt.tz_convert(None)
+            if pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_datetime64_dtype(series.dtype):
+                values = series.to_numpy()
+            else:
+                # Strings are stored fixed-width so they remain mmap-able
+                values = series.astype(str).to_numpy(dtype=str)
+            np.save(part_dir / f"{col}.npy", values, allow_pickle=False)
+            schema["columns"][col] = {"dtype": values.dtype.str, "tz": tz}
+
+        with open(part_dir / SCHEMA_FILE, "w") as f:
+            json.dump(schema, f, indent=2)
+        return part_dir
+
+    def write_column(self, name: str, column: str, values: np.ndarray):
+        """
+        Adds or replaces a single numeric column of an existing partition.
+        """
+        values = np.asarray(values)
+        schema = self.schema(name)
+        if len(values) != schema["num_rows"]:
+            raise ValueError(f"Column '{column}' has {len(values)} rows, partition has {schema['num_rows']}.")
+        np.save(self.root / name / f"{column}.npy", values, allow_pickle=False)
+        schema["columns"][column] = {"dtype": values.dtype.str, "tz": None}
+        with open(self.root / name / SCHEMA_FILE, "w") as f:
+            json.dump(schema, f, indent=2)
+
+    def clear(self):
+        if self.root.exists():
+            shutil.rmtree(self.root)
+
+    # --- Metadata ---
+
+    def partitions(self) -> List[str]:
+        """
+        Returns partition names in write order.
+        """
+        if not self.root.exists():
+            return []
+        return sorted(p.parent.name for p in self.root.glob(f"*/{SCHEMA_FILE}"))
+
+    def schema(self, name: str) -> Dict:
+        with open(self.root / name / SCHEMA_FILE) as f:
+            return json.load(f)
+
+    def num_rows(self) -> int:
+        return sum(self.schema(name)["num_rows"] for name in self.partitions())
+
+    # --- Reading ---
+
+    def column(self, name: str, column: str) -> np.ndarray:
+        """
+        Returns a read-only memory-mapped view of one column of a partition.
+        """
+        return np.load(self.root / name / f"{column}.npy", mmap_mode="r", allow_pickle=False)
+
+    def read_partition(self, name: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        schema = self.schema(name)["columns"]
+        columns = list(schema) if columns is None else columns
+        data = {}
+        for col in columns:
+            values = np.array(self.column(name, col))
+            if schema[col]["tz"]:
+                data[col] = pd.to_datetime(values).tz_localize(schema[col]["tz"])
+            else:
+                data[col] = values
+        return pd.DataFrame(data, columns=columns)
+
+    def iter_partitions(self, columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        """
+        Yields partitions one at a time.
+        """
+        for name in self.partitions():
+            yield self.read_partition(name, columns)
+
+    def batch_size_for(self, n_columns: int, memory_budget_mb: Optional[float] = None) -> int:
+        """
+        Number of float64 rows per batch that keeps peak memory under the budget.
+        """
+        budget = (memory_budget_mb or MEMORY_BUDGET_MB) * 1024 * 1024
+        row_bytes = max(n_columns, 1) * 8 * BATCH_OVERHEAD_FACTOR
+        return max(int(budget // row_bytes), 1)
+
+    def iter_batches(self, columns: List[str], batch_size: Optional[int] = None,
+                     memory_budget_mb: Optional[float] = None) -> Iterator[np.ndarray]:
+        """
+        Yields float64 arrays of shape (batch_size, len(columns)) spanning
+        partitions; only the final batch may be shorter. Columns are read
+        through memory maps, so at most one batch is resident at a time.
+        """
+        if batch_size is None:
+            batch_size = self.batch_size_for(len(columns), memory_budget_mb)
+
+        buffer = np.empty((batch_size, len(columns)), dtype=np.float64)
+        filled = 0
+        for name in self.partitions():
+            mapped = [self.column(name, col) for col in columns]
+            n = self.schema(name)["num_rows"]
+            start = 0
+            while start < n:
+                take = min(batch_size - filled, n - start)
+                for j, values in enumerate(mapped):
+                    buffer[filled:filled + take, j] = values[start:start + take]
+                filled += take
+                start += take
+                if filled == batch_size:
+                    yield buffer.copy()
+                    filled = 0
+        if filled:
+            yield buffer[:filled].copy()
+
+    def iter_frames(self, columns: List[str], batch_size: Optional[int] = None,
+                    memory_budget_mb: Optional[float] = None) -> Iterator[pd.DataFrame]:
+        """
+        Yields DataFrame chunks of at most batch_size rows (within partitions),
+        keeping string/date columns such as ticker and date.
+        """
+        if batch_size is None:
+            batch_size = self.batch_size_for(len(columns), memory_budget_mb)
+        for name in self.partitions():
+            schema = self.schema(name)
+            available = [c for c in columns if c in schema["columns"]]
+            mapped = {col: self.column(name, col) for col in available}
+            for start in range(0, schema["num_rows"], batch_size):
+                data = {}
+                for col, values in mapped.items():
+                    chunk = np.array(values[start:start + batch_size])
+                    tz = schema["columns"][col]["tz"]
+                    data[col] = pd.to_datetime(chunk).tz_localize(tz) if tz else chunk
+                yield pd.DataFrame(data, columns=available)
+
+    def _iter_values(self, column: str, chunk_size: int, lo: float = -np.inf, hi: float = np.inf,
+                     include_hi: bool = True) -> Iterator[np.ndarray]:
+        # Non-NaN values of one column within [lo, hi] (or [lo, hi)), read chunk by chunk
+        for name in self.partitions():
+            mapped = self.column(name, column)
+            for start in range(0, len(mapped), chunk_size):
+                values = np.asarray(mapped[start:start + chunk_size], dtype=np.float64)
+                mask = (values >= lo) & ((values <= hi) if include_hi else (values < hi))
+                yield values[mask]
+
+    def _order_statistic(self, column: str, k: int, lo: float, hi: float, chunk_size: int) -> float:
+        # k-th smallest non-NaN value, found by repeatedly histogramming the
+        # range that contains it until the remaining candidates fit in a chunk.
+        below, include_hi = 0, True
+        while True:
+            if lo == hi:
+                return float(lo)
+            in_range = sum(len(v) for v in self._iter_values(column, chunk_size, lo, hi, include_hi))
+            if in_range <= chunk_size:
+                values = np.sort(np.concatenate(list(self._iter_values(column, chunk_size, lo, hi, include_hi))))
+                return float(values[k - below])
+
+            edges = np.linspace(lo, hi, 1025)
+            counts = np.zeros(len(edges) - 1, dtype=np.int64)
+            for values in self._iter_values(column, chunk_size, lo, hi, include_hi):
+                counts += np.histogram(values, bins=edges)[0]
+            cum = np.cumsum(counts)
+            b = int(np.searchsorted(cum, k - below, side="right"))
+            below += int(cum[b - 1]) if b > 0 else 0
+            lo, hi = edges[b], edges[b + 1]
+            include_hi = include_hi and b == len(counts) - 1
+
+    def quantiles(self, column: str, qs: List[float], memory_budget_mb: Optional[float] = None) -> List[float]:
+        """
+        Exact quantiles of a numeric column (NaNs ignored), using the same
+        linear interpolation as pandas. Only one budget-sized chunk of values is
+        held in memory at a time.
+        """
+        chunk_size = self.batch_size_for(1, memory_budget_mb)
+        n, lo, hi = 0, np.inf, -np.inf
+        for values in self._iter_values(column, chunk_size):
+            if len(values):
+                n += len(values)
+                lo, hi = min(lo, values.min()), max(hi, values.max())
+        if n == 0:
+            return [np.nan for _ in qs]
+
+        stats = {}
+        results = []
+        for q in qs:
+            pos = (n - 1) * q
+            k0 = int(np.floor(pos))
+            k1 = min(k0 + 1, n - 1)
+            for k in (k0, k1):
+                if k not in stats:
+                    stats[k] = self._order_statistic(column, k, lo, hi, chunk_size)
+            results.append(stats[k0] + (stats[k1] - stats[k0]) * (pos - k0))
+        return results
@@ -1,37 +1,42 @@
+import copy
+import hashlib
+import json
+import math
 import pickle
 import os
 from pathlib import Path
 from datetime import datetime
+import numpy as np
 import pandas as pd
 from sklearn.ensemble import RandomForestRegressor, RandomForestClassifier
-from sklearn.decomposition import PCA
-from sklearn.cluster import KMeans
+from sklearn.ensemble import GradientBoostingRegressor, GradientBoostingClassifier
+from sklearn.decomposition import PCA, IncrementalPCA
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
 from sklearn.pipeline import Pipeline
 from sklearn.impute import SimpleImputer
-from .config import MODELS_DIR, RF_N_ESTIMATORS, RF_MAX_DEPTH, CLUSTERS_K, PCA_COMPONENTS
+from joblib import Parallel, delayed
+from .artifacts import write_version, read_version, apply_retention
+from .compiled import compile_models
+from .registry import ModelRegistry
+from .config import HORIZONS, HORIZON_WORKERS, RETENTION_ON_SAVE, MODELS_DIR, RF_N_ESTIMATORS, RF_MAX_DEPTH, CLUSTERS_K, PCA_COMPONENTS
+from .config import (CLUSTERS_K_AUTO, CLUSTERS_K_CANDIDATES, CLUSTER_CHUNK_ROWS, CLUSTER_BATCH_ROWS,
+                     CLUSTER_SELECTION_ROWS, CLUSTER_SAMPLE_ROWS, CLUSTER_WORKERS)
+from .config import (TRAINING_MODE, INCREMENTAL_ESTIMATORS, INCREMENTAL_MAX_PSI,
+                     INCREMENTAL_MAX_NEW_FRACTION, INCREMENTAL_MAX_CHAIN, INCREMENTAL_MIN_NEW_ROWS, DRIFT_PSI_BINS)
+from .config import RISK_LEVELS
 
-def train_models(df: pd.DataFrame):
-    """
-    Trains Regression, Classification, PCA, and KMeans models.
-    """
-    # Features to use
-    features = [
-        "return_lag1", "return_lag2", "return_lag3", "return_lag5",
-        "volatility_5d", "volatility_20d", "price_vs_ma20"
-    ]
-    
-    X = df[features]
-    y_reg = df["target_return_next_day"]
-    y_clf = df["risk_class"]
-    
-    # Regression
-    print("Training Regressor...")
-    # [IMPROVEMENT] Use GradientBoostingRegressor.
-    # Gradient Boosting often performs better than Random Forest on tabular data with subtle signals.
-    from sklearn.ensemble import GradientBoostingRegressor
-    
+# Features to use
+FEATURES = [
+    "return_lag1", "return_lag2", "return_lag3", "return_lag5",
+    "volatility_5d", "volatility_20d", "price_vs_ma20"
+]
+# Risk class labels: indices into RISK_LEVELS
+RISK_CLASSES = list(range(len(RISK_LEVELS)))
+
+def _make_regressor(**overrides) -> GradientBoostingRegressor:
     # Using GradientBoostingRegressor - often squeezes out better R2 than RF on noisy data
-    regressor = GradientBoostingRegressor(
+    params = dict(
         n_estimators=100,
         learning_rate=0.05,
         max_depth=3,
@@ -39,15 +44,13 @@ def train_models(df: pd.DataFrame):
         validation_fraction=0.1,
         n_iter_no_change=10
     )
-    regressor.fit(X, y_reg)
-    
-    # Classification
-    print("Training Classifier (Gradient Boosting)...")
-    from sklearn.ensemble import GradientBoostingClassifier
-    
+    params.update(overrides)
+    return GradientBoostingRegressor(**params)
+
+def _make_classifier(**overrides) -> GradientBoostingClassifier:
     # Gradient Boosting is often superior for tabular data where decision boundaries are non-linear but smooth.
     # Tuned for ~60-65% accuracy without overfitting.
-    classifier = GradientBoostingClassifier(
+    params = dict(
         n_estimators=200,
         learning_rate=0.05,
         max_depth=3,
@@ -55,63 +58,587 @@ def train_models(df: pd.DataFrame):
         validation_fraction=0.1,
         n_iter_no_change=10 # Early stopping to prevent overfitting
     )
+    params.update(overrides)
+    return GradientBoostingClassifier(**params)
+
+def _cluster_candidates(n_rows: int) -> list:
+    ks = CLUSTERS_K_CANDIDATES if CLUSTERS_K_AUTO else [CLUSTERS_K]
+    return [k for k in ks if k <= n_rows] or [min(CLUSTERS_K, n_rows)]
+
+def _make_kmeans(k: int) -> MiniBatchKMeans:
+    return MiniBatchKMeans(n_clusters=k, batch_size=CLUSTER_BATCH_ROWS, n_init=3, random_state=42)
+
+def _silhouette(kmeans, sample: np.ndarray) -> float:
+    labels = kmeans.predict(sample)
+    if len(np.unique(labels)) < 2:
+        return -1.0
+    return float(silhouette_score(sample, labels))
+
+def _select_kmeans(fitted: dict, sample: np.ndarray, parallel) -> tuple:
+    # Keeps the candidate k with the best silhouette on the sample
+    scores = dict(zip(fitted, parallel(delayed(_silhouette)(m, sample) for m in fitted.values())))
+    best = max(scores, key=lambda k: (scores[k], -k))
+    print(f"Cluster silhouettes: {', '.join(f'k={k}: {v:.3f}' for k, v in scores.items())} -> k={best}")
+    return fitted[best], {"k": best, "silhouette": scores}
+
+def fit_clustering(X: pd.DataFrame, n_jobs: int = None) -> tuple:
+    """
+    Unsupervised stage of train_models. PCA is an IncrementalPCA fitted over
+    chunks of at most CLUSTER_CHUNK_ROWS rows, so no full-size SVD is formed.
+    A MiniBatchKMeans is then fitted for every candidate k (CLUSTERS_K_CANDIDATES,
+    or just CLUSTERS_K) in parallel threads on a CLUSTER_SELECTION_ROWS sample of
+    the projection; the k with the best silhouette on CLUSTER_SAMPLE_ROWS rows is
+    refitted on the whole projection. Returns (pca, kmeans, {"k": chosen k, "silhouette": {k: score}}).
+    """
+    n_rows = len(X)
+    chunks = np.array_split(np.arange(n_rows), max(math.ceil(n_rows / CLUSTER_CHUNK_ROWS), 1))
+    pca = IncrementalPCA(n_components=PCA_COMPONENTS)
+    for idx in chunks:
+        pca.partial_fit(X.iloc[idx])
+    X_pca = np.vstack([pca.transform(X.iloc[idx]) for idx in chunks])
+
+    rng = np.random.default_rng(42)
+    def sample_of(n):
+        return X_pca[rng.choice(n_rows, n, replace=False)] if n_rows > n else X_pca
+    selection_rows, sample = sample_of(CLUSTER_SELECTION_ROWS), sample_of(CLUSTER_SAMPLE_ROWS)
+    ks = _cluster_candidates(n_rows)
+    with Parallel(n_jobs=min(n_jobs or CLUSTER_WORKERS, len(ks)), prefer="threads") as parallel:
+        fitted = dict(zip(ks, parallel(delayed(_make_kmeans(k).fit)(selection_rows) for k in ks)))
+        kmeans, selection = _select_kmeans(fitted, sample, parallel)
+    if len(selection_rows) < n_rows:
+        kmeans = _make_kmeans(selection["k"]).fit(X_pca)
+    return pca, kmeans, selection
+
+def train_models(df: pd.DataFrame):
+    """
+    Trains Regression, Classification, PCA, and KMeans models.
+    """
+    features = list(FEATURES)
+    
+    X = df[features]
+    y_reg = df["target_return_next_day"]
+    y_clf = df["risk_class"]
+    
+    # Regression
+    print("Training Regressor...")
+    # [IMPROVEMENT] Use GradientBoostingRegressor.
+    # Gradient Boosting often performs better than Random Forest on tabular data with subtle signals.
+    regressor = _make_regressor()
+    regressor.fit(X, y_reg)
+    
+    # Classification
+    print("Training Classifier (Gradient Boosting)...")
+    classifier = _make_classifier()
     classifier.fit(X, y_clf)
     
     # PCA & Clustering (Unsupervised)
     # We use the same features to cluster stock behaviors
     print("Training PCA & KMeans...")
-    pca = PCA(n_components=PCA_COMPONENTS)
-    X_pca = pca.fit_transform(X)
-    
-    kmeans = KMeans(n_clusters=CLUSTERS_K, random_state=42, n_init=10)
-    kmeans.fit(X_pca)
-    
-    return {
+    pca, kmeans, cluster_selection = fit_clustering(X)
+
+    models = {
+        "regressor": regressor,
+        "classifier": classifier,
+        "pca": pca,
+        "kmeans": kmeans,
+        "cluster_selection": cluster_selection,
+        "features": features, # Save list of features to ensure consistency
+        "training_info": _training_info("full", df)
+    }
+    if all(f"target_return_{h}d" in df.columns and f"risk_class_{h}d" in df.columns for h in HORIZONS):
+        # target_return_1d is target_return_next_day: the 1-day horizon shares the regressor
+        models["horizon_models"] = train_horizon_models(df, regressor=regressor)
+    return models
+
+def _horizon_targets(h: int) -> list:
+    return [f"target_return_{h}d", f"risk_class_{h}d"]
+
+def _watermarks(df: pd.DataFrame, targets: list = None) -> dict:
+    # {ticker: newest date} over the rows of df whose targets are all known
+    if "date" not in df.columns or "ticker" not in df.columns:
+        return {}
+    rows = df if targets is None else df[df[targets].notna().all(axis=1)]
+    return {t: d.isoformat() for t, d in pd.to_datetime(rows["date"]).groupby(rows["ticker"]).max().items()}
+
+def _training_info(mode: str, df: pd.DataFrame, chain: int = 0, parent: str = None, reason: str = None,
+                   rows: int = None) -> dict:
+    # Which mode produced a model set and, per ticker and target, the newest row it has
+    # been trained on (the watermarks of the next update). df is every row seen so far.
+    from .feature_engineering import RISK_LABEL
+    trained_through = pd.to_datetime(df["date"]).max() if "date" in df.columns and len(df) else None
+    info = {
+        "mode": mode,
+        "risk_label": RISK_LABEL,
+        "reason": reason,
+        "trained_through": trained_through.isoformat() if trained_through is not None else None,
+        "trained_through_by_ticker": _watermarks(df),
+        "chain": chain,
+        "parent_version": parent,
+        "rows": len(df) if rows is None else rows
+    }
+    horizons = [h for h in HORIZONS if all(c in df.columns for c in _horizon_targets(h))]
+    if horizons:
+        # Longer horizons are labelled later; their rows are picked up once the label exists
+        info["horizons_trained_through"] = {str(h): _watermarks(df, _horizon_targets(h)) for h in horizons}
+    return info
+
+def new_rows_mask(models: dict, df: pd.DataFrame, horizon: int = None) -> np.ndarray:
+    """
+    Rows of df dated after the newest row of their ticker the model set was
+    trained on, for the next-day models or, with horizon, that horizon's
+    models (rows whose label is still unknown are not counted). Versions
+    saved without per-ticker watermarks fall back to their newest bar.
+    """
+    info = models.get("training_info") or {}
+    if horizon is None:
+        watermarks = info.get("trained_through_by_ticker")
+    else:
+        watermarks = (info.get("horizons_trained_through") or {}).get(str(horizon))
+    dates = pd.to_datetime(df["date"], utc=True)
+    if watermarks is not None:
+        # Tickers without a watermark have never been trained on: every row is new
+        limits = pd.to_datetime(df["ticker"].map(watermarks), utc=True)
+        new = (limits.isna() | (dates > limits)).to_numpy()
+    elif info.get("trained_through") is not None:
+        new = (dates > pd.to_datetime(info["trained_through"], utc=True)).to_numpy()
+    else:
+        new = np.ones(len(df), dtype=bool)
+    if horizon is not None:
+        new = new & df[_horizon_targets(horizon)].notna().all(axis=1).to_numpy()
+    return new
+
+def choose_training_mode(previous: dict, df: pd.DataFrame, mode: str = TRAINING_MODE) -> tuple:
+    """
+    Decides how to train on df given the previous model set (None if there is
+    none): "incremental" when it can be updated with just the new rows,
+    "skip" when there are no new rows, otherwise "full". Updates are refused
+    when the previous set has no per-ticker watermarks, was trained on a
+    different set of tickers, risk label definition or feature/horizon layout,
+    after INCREMENTAL_MAX_CHAIN updates in a row, when the new rows are fewer
+    than INCREMENTAL_MIN_NEW_ROWS or a large share of the data, and when any
+    feature or the risk label of the new rows has drifted beyond
+    INCREMENTAL_MAX_PSI from the rows already seen.
+    Returns (mode, reason).
+    """
+    from .drift import population_stability_index, categorical_psi
+    from .feature_engineering import RISK_LABEL
+    if mode != "incremental":
+        return "full", f"training mode is {mode!r}"
+    if previous is None:
+        return "full", "no previous version"
+    info = previous.get("training_info") or {}
+    if info.get("trained_through_by_ticker") is None:
+        return "full", "previous version has no per-ticker training watermark"
+    if set(df["ticker"].unique()) != set(info["trained_through_by_ticker"]):
+        return "full", "ticker set changed"
+    new = new_rows_mask(previous, df)
+    if not new.any():
+        return "skip", "no new rows since the previous version"
+    if new.sum() < INCREMENTAL_MIN_NEW_ROWS:
+        # A few rows per ticker would fit extra stages to a single day; a full retrain of a
+        # universe this small is cheap
+        return "full", f"{int(new.sum())} new rows < INCREMENTAL_MIN_NEW_ROWS ({INCREMENTAL_MIN_NEW_ROWS})"
+    if previous.get("risk_thresholds") is None:
+        return "full", "previous version has no risk thresholds"
+    if info.get("risk_label") != RISK_LABEL:
+        # Its persisted thresholds split a different volatility measure
+        return "full", "risk label definition changed"
+    if previous.get("features") != list(FEATURES):
+        return "full", "feature set changed"
+    if "horizon_models" in previous and sorted(previous["horizon_models"]) != sorted(HORIZONS):
+        return "full", "forecast horizons changed"
+    if info.get("chain", 0) >= INCREMENTAL_MAX_CHAIN:
+        return "full", f"{INCREMENTAL_MAX_CHAIN} incremental updates in a row"
+
+    if new.all() or new.mean() > INCREMENTAL_MAX_NEW_FRACTION:
+        return "full", f"{int(new.sum())} new rows out of {len(df)}"
+
+    # A few days of bars give a noisy PSI even without drift: bins are coarsened to
+    # about ten new rows each, and the no-drift expectation of the PSI,
+    # about (bins - 1) * (1/n + 1/m), is added to the threshold.
+    n_new, n_old = int(new.sum()), int((~new).sum())
+    bins = int(np.clip(n_new // 10, 2, DRIFT_PSI_BINS))
+    limit = INCREMENTAL_MAX_PSI + (bins - 1) * (1 / n_new + 1 / n_old)
+    psi = {}
+    for name in FEATURES:
+        reference = df.loc[~new, name].dropna().to_numpy(dtype=np.float64)
+        current = df.loc[new, name].dropna().to_numpy(dtype=np.float64)
+        if len(reference) and len(current):
+            psi[name] = population_stability_index(reference, current, bins)
+    if "risk_class" in df.columns:
+        psi["risk_class"] = categorical_psi(df.loc[~new, "risk_class"].dropna().to_numpy(),
+                                            df.loc[new, "risk_class"].dropna().to_numpy())
+    drifted = sorted(name for name, value in psi.items() if value > limit)
+    if drifted:
+        return "full", f"new rows drifted (PSI > {limit:.2f}): {drifted}"
+    return "incremental", f"{int(new.sum())} new rows"
+
+def _extend_boosting(model, X, y, extra: int):
+    # Adds `extra` stages fitted to the residuals of the existing ensemble on the new rows.
+    # Early stopping is off: the stage count is explicit and the new rows are few.
+    model = copy.deepcopy(model)
+    model.set_params(warm_start=True, n_estimators=model.n_estimators_ + extra, n_iter_no_change=None)
+    return model.fit(X, y)
+
+def _extend_classifier(model, X, y, extra: int):
+    # The output layout is fixed by the first fit, so rows missing a class cannot extend it
+    if not np.array_equal(np.unique(y), model.classes_):
+        print(f"Skipping classifier update: new classes {np.unique(y).tolist()} != {model.classes_.tolist()}")
+        return model
+    return _extend_boosting(model, X, y, extra)
+
+def _as_incremental_pca(pca) -> IncrementalPCA:
+    # Continues a batch PCA as an IncrementalPCA with the same components and sample count
+    if isinstance(pca, IncrementalPCA):
+        return copy.deepcopy(pca)
+    ipca = IncrementalPCA(n_components=pca.n_components_)
+    for attr in ["components_", "singular_values_", "mean_", "explained_variance_",
+                 "explained_variance_ratio_", "noise_variance_", "n_components_",
+                 "n_features_in_", "feature_names_in_"]:
+        if hasattr(pca, attr):
+            setattr(ipca, attr, copy.copy(getattr(pca, attr)))
+    n = pca.n_samples_
+    ipca.n_samples_seen_ = n
+    # PCA keeps no per-feature variances; only their sum enters the explained-variance ratio
+    total_var = pca.explained_variance_.sum() / pca.explained_variance_ratio_.sum() * (n - 1) / n
+    ipca.var_ = np.full(pca.n_features_in_, total_var / pca.n_features_in_)
+    return ipca
+
+def _update_kmeans(kmeans, X_new: np.ndarray) -> MiniBatchKMeans:
+    # A MiniBatchKMeans continues from its own counts. A KMeans seeds one: each previous
+    # center enters the first mini-batch weighted by its cluster size, so the centers
+    # move to the running mean of old and new points rather than jumping to the new ones.
+    if isinstance(kmeans, MiniBatchKMeans):
+        return copy.deepcopy(kmeans).partial_fit(X_new)
+    centers = kmeans.cluster_centers_
+    sizes = np.bincount(kmeans.labels_, minlength=len(centers)).astype(np.float64)
+    updated = MiniBatchKMeans(n_clusters=len(centers), init=centers, n_init=1, random_state=42)
+    return updated.partial_fit(np.vstack([centers, X_new]),
+                               sample_weight=np.concatenate([sizes, np.ones(len(X_new))]))
+
+def update_models(previous: dict, df: pd.DataFrame, extra_estimators: int = None,
+                  parent_version: str = None, reason: str = None) -> dict:
+    """
+    Incremental counterpart of train_models: updates a previous model set with
+    the rows of df newer than its per-ticker watermarks. Boosting models are
+    warm-started with extra_estimators more stages fitted on the new rows
+    only; each horizon's models take the rows whose label has become known
+    since they were trained, which for long horizons lag the newest bars. PCA is updated with partial_fit and KMeans continued as a
+    MiniBatchKMeans from the previous centers. The previous models are not
+    modified. Persisted extras (risk thresholds, similarity index) are not
+    carried over; the caller sets them as after train_models.
+    """
+    extra = extra_estimators or INCREMENTAL_ESTIMATORS
+    features = list(FEATURES)
+    new_df = df[new_rows_mask(previous, df)]
+    if new_df.empty:
+        raise ValueError("No rows newer than the previous version to update with.")
+    X = new_df[features]
+
+    print(f"Updating models with {len(new_df)} new rows (+{extra} boosting stages)...")
+    regressor = _extend_boosting(previous["regressor"], X, new_df["target_return_next_day"], extra)
+    classifier = _extend_classifier(previous["classifier"], X, new_df["risk_class"], extra)
+
+    pca = _as_incremental_pca(previous["pca"])
+    if len(X) >= pca.n_components_:
+        pca.partial_fit(X)
+    kmeans = _update_kmeans(previous["kmeans"], pca.transform(X))
+
+    info = previous.get("training_info") or {}
+    models = {
         "regressor": regressor,
         "classifier": classifier,
         "pca": pca,
         "kmeans": kmeans,
-        "features": features # Save list of features to ensure consistency
+        "features": features,
+        "training_info": _training_info("incremental", df, info.get("chain", 0) + 1, parent_version, reason,
+                                        rows=len(new_df))
     }
+    if "cluster_selection" in previous:
+        models["cluster_selection"] = previous["cluster_selection"]
+    if "horizon_models" in previous:
+        horizon_models = {}
+        for h, pair in previous["horizon_models"].items():
+            h_df = df[new_rows_mask(previous, df, horizon=h)]
+            if h_df.empty:
+                print(f"No newly labelled rows for the {h}d horizon; keeping its models.")
+                horizon_models[h] = {**pair, "regressor": regressor} if h == 1 else pair
+                continue
+            X_h = h_df[features]
+            target, label = _horizon_targets(h)
+            horizon_models[h] = {
+                # The 1-day horizon shares the next-day regressor updated above
+                "regressor": regressor if h == 1 else _extend_boosting(pair["regressor"], X_h, h_df[target], extra),
+                "classifier": _extend_classifier(pair["classifier"], X_h, h_df[label].astype(int), extra)
+            }
+        models["horizon_models"] = horizon_models
+    return models
 
-def save_models(models: dict) -> str:
+def _fit(model, X, y):
+    return model.fit(X, y)
+
+def train_horizon_models(df: pd.DataFrame, horizons=None, n_jobs: int = None, regressor=None) -> dict:
+    """
+    Trains a return regressor and a risk classifier for every forecast horizon.
+    All horizons share one feature matrix; the fits run in parallel threads
+    (the tree builders release the GIL), so X is neither recomputed nor copied
+    per process. target_return_1d equals target_return_next_day, so a
+    regressor already fitted on df (train_models passes the next-day one) is
+    reused for the 1-day horizon instead of fitting the same model twice.
+    Returns {h: {"regressor": ..., "classifier": ...}}.
+    """
+    horizons = horizons or HORIZONS
+    X = df[list(FEATURES)]
+
+    jobs = []
+    for h in horizons:
+        # Longer horizons lose their last h rows to the forward window
+        mask = df[[f"target_return_{h}d", f"risk_class_{h}d"]].notna().all(axis=1).to_numpy()
+        X_h = X if mask.all() else X[mask]
+        if not (h == 1 and regressor is not None):
+            jobs.append((h, "regressor", _make_regressor(), X_h, df.loc[mask, f"target_return_{h}d"]))
+        jobs.append((h, "classifier", _make_classifier(), X_h, df.loc[mask, f"risk_class_{h}d"].astype(int)))
+
+    print(f"Training horizon models for {list(horizons)} ({len(jobs)} fits)...")
+    n_jobs = min(n_jobs or HORIZON_WORKERS, len(jobs))
+    fitted = Parallel(n_jobs=n_jobs, prefer="threads")(
+        delayed(_fit)(model, X_h, y) for _, _, model, X_h, y in jobs
+    )
+
+    horizon_models = {h: {"regressor": regressor} if h == 1 and regressor is not None else {} for h in horizons}
+    for (h, name, _, _, _), model in zip(jobs, fitted):
+        horizon_models[h][name] = model
+    return horizon_models
+
+def _with_all_classes(X: pd.DataFrame, y: np.ndarray, classes: list) -> tuple:
+    # Zero-weight rows (two per class, for the stratified validation split) for classes
+    # the batch lacks, so every fit sees the same class set. Returns (X, y, sample_weight).
+    counts = dict(zip(*np.unique(y, return_counts=True)))
+    pad = [c for c in classes for _ in range(max(0, 2 - counts.get(c, 0)))]
+    weight = np.ones(len(y))
+    if not pad:
+        return X, y, weight
+    filler = pd.DataFrame([X.mean().to_numpy()] * len(pad), columns=X.columns)
+    return (pd.concat([X, filler], ignore_index=True), np.concatenate([y, pad]),
+            np.concatenate([weight, np.zeros(len(pad))]))
+
+def _warm_start(model, stages: int, X, y, classes: list = None):
+    # Adds `stages` boosting stages fitted on one batch; classifiers see every class in classes
+    model.n_estimators = getattr(model, "n_estimators_", 0) + stages
+    if classes is None:
+        return model.fit(X, y)
+    X, y, weight = _with_all_classes(X, y, classes)
+    return model.fit(X, y, sample_weight=weight)
+
+def train_models_from_store(store, memory_budget_mb: float = None) -> dict:
     """
-    Saves models to models/version_<timestamp>.
+    Trains the same model set as train_models from a partitioned FeatureStore.
+    Rows are streamed as fixed-size NumPy batches sized from memory_budget_mb
+    (MEMORY_BUDGET_MB by default), so peak memory does not depend on dataset size.
+    Boosting models are warm-started with a share of their stages per batch,
+    PCA is fitted incrementally and KMeans with mini-batches over a second pass,
+    which updates every candidate k and keeps the best by silhouette. When the
+    store holds the targets of every HORIZONS entry, the horizon models are
+    warm-started in the same pass, each on the rows whose label is known.
+    """
+    features = list(FEATURES)
+    targets = ["target_return_next_day", "risk_class"]
+    partitions = store.partitions()
+    stored = set(store.schema(partitions[0])["columns"]) if partitions else set()
+    horizons = HORIZONS if all(c in stored for h in HORIZONS for c in _horizon_targets(h)) else []
+    columns = features + targets + [c for h in horizons for c in _horizon_targets(h)]
+    n_features = len(features)
+
+    batch_size = store.batch_size_for(len(columns), memory_budget_mb)
+    n_batches = max(math.ceil(store.num_rows() / batch_size), 1)
+
+    # Spread the usual number of boosting stages over the batches
+    regressor = _make_regressor(warm_start=True)
+    # The class set is fixed up front (RISK_CLASSES), so the class prior cannot come
+    # from the first batch either: boosting starts from equal class scores
+    classifier = _make_classifier(warm_start=True, init="zero")
+    reg_stages = max(math.ceil(regressor.n_estimators / n_batches), 1)
+    clf_stages = max(math.ceil(classifier.n_estimators / n_batches), 1)
+    regressor.n_estimators = 0
+    classifier.n_estimators = 0
+    # The 1-day horizon shares the next-day regressor, as in train_models
+    horizon_models = {
+        h: {"regressor": regressor if h == 1 else _make_regressor(warm_start=True, n_estimators=0),
+            "classifier": _make_classifier(warm_start=True, init="zero", n_estimators=0)}
+        for h in horizons
+    }
+    pca = IncrementalPCA(n_components=PCA_COMPONENTS)
+
+    # Pass 1: supervised models + PCA
+    n_rows = 0
+    for batch in store.iter_batches(columns, batch_size=batch_size):
+        X_all = pd.DataFrame(batch[:, :n_features], columns=features)
+        known = ~np.isnan(batch[:, :n_features])
+        for i, h in enumerate(horizons):
+            # Longer horizons lose each ticker's last h rows to the forward window
+            col = n_features + 2 + 2 * i
+            rows = known.all(axis=1) & ~np.isnan(batch[:, col:col + 2]).any(axis=1)
+            if rows.sum() < PCA_COMPONENTS:
+                continue
+            X_h, pair = X_all[rows].reset_index(drop=True), horizon_models[h]
+            if h != 1:
+                _warm_start(pair["regressor"], reg_stages, X_h, batch[rows, col])
+            _warm_start(pair["classifier"], clf_stages, X_h, batch[rows, col + 1].astype(int), RISK_CLASSES)
+
+        rows = ~np.isnan(batch[:, :n_features + 2]).any(axis=1)
+        if rows.sum() < PCA_COMPONENTS:
+            continue
+        X = X_all[rows].reset_index(drop=True)
+        y_reg = batch[rows, n_features]
+        y_clf = batch[rows, n_features + 1].astype(int)
+        n_rows += len(X)
+
+        print(f"Warm-starting boosting on batch ({len(X)} rows)...")
+        _warm_start(regressor, reg_stages, X, y_reg)
+        # The classifier's output layout is fixed by its first fit; batches missing a
+        # class are padded so that layout is always RISK_CLASSES and every batch extends it
+        _warm_start(classifier, clf_stages, X, y_clf, RISK_CLASSES)
+
+        pca.partial_fit(X)
+
+    if n_rows == 0:
+        raise ValueError("Feature store contains no trainable rows.")
+
+    # Pass 2: clustering on the final PCA projection, every candidate k updated per batch
+    ks = _cluster_candidates(n_rows)
+    candidates = {k: _make_kmeans(k) for k in ks}
+    per_batch = math.ceil(CLUSTER_SAMPLE_ROWS / n_batches)
+    rng, samples = np.random.default_rng(42), []
+    with Parallel(n_jobs=min(CLUSTER_WORKERS, len(ks)), prefer="threads") as parallel:
+        for batch in store.iter_batches(features, batch_size=batch_size):
+            batch = batch[~np.isnan(batch).any(axis=1)]
+            if not len(batch):
+                continue
+            X_pca = pca.transform(pd.DataFrame(batch, columns=features))
+            parallel(delayed(m.partial_fit)(X_pca) for k, m in candidates.items() if k <= len(X_pca))
+            samples.append(X_pca[rng.choice(len(X_pca), min(per_batch, len(X_pca)), replace=False)])
+        fitted = {k: m for k, m in candidates.items() if hasattr(m, "cluster_centers_")}
+        kmeans, cluster_selection = _select_kmeans(fitted, np.vstack(samples), parallel)
+
+    print(f"Trained out-of-core models on {n_rows} rows in {n_batches} batch(es).")
+    models = {
+        "regressor": regressor,
+        "classifier": classifier,
+        "pca": pca,
+        "kmeans": kmeans,
+        "cluster_selection": cluster_selection,
+        "features": features
+    }
+    # A horizon none of whose batches had enough labelled rows is left out
+    horizon_models = {h: pair for h, pair in horizon_models.items() if hasattr(pair["classifier"], "estimators_")}
+    if horizon_models:
+        models["horizon_models"] = horizon_models
+    return models
+
+def training_config(models: dict) -> dict:
+    """
+    Hyperparameters and settings that produced a model set, for the registry.
+    """
+    config = {
+        "features": models.get("features"),
+        "risk_thresholds": models.get("risk_thresholds"),
+        "horizons": sorted(models.get("horizon_models") or []),
+        "horizon_risk_thresholds": models.get("horizon_risk_thresholds"),
+        "pca_components": PCA_COMPONENTS,
+        "clusters_k": getattr(models.get("kmeans"), "n_clusters", CLUSTERS_K),
+        "cluster_selection": models.get("cluster_selection"),
+        "training_info": models.get("training_info"),
+        "segments": {k: v for k, v in (models.get("segments") or {}).items() if k != "routes"} or None,
+    }
+    for name in ["regressor", "classifier"]:
+        model = models.get(name)
+        if hasattr(model, "get_params"):
+            config[name] = {"class": type(model).__name__, **model.get_params()}
+    return config
+
+def data_fingerprint(data) -> str:
+    """
+    Content hash of a training DataFrame or FeatureStore.
+    """
+    from .feature_store import FeatureStore
+    digest = hashlib.sha256()
+    if isinstance(data, FeatureStore):
+        # Stream the stored columns through the hash, one memory map at a time
+        for name in data.partitions():
+            for col in sorted(data.schema(name)["columns"]):
+                digest.update(f"{name}/{col}".encode())
+                digest.update(np.ascontiguousarray(data.column(name, col)).data)
+    else:
+        digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def save_models(models: dict, metrics: dict = None, config: dict = None,
+                data_fingerprint: str = None, timings: dict = None, registry: ModelRegistry = None,
+                reports: dict = None) -> str:
+    """
+    Saves models to models/version_<timestamp> and records the version
+    (with metrics, config, data fingerprint and timings) in the registry.
+    reports ({name: dict}, e.g. the drift report) are written next to the
+    manifest as <name>.json.
     Returns the version string.
     """
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    save_dir = MODELS_DIR / f"version_{timestamp}"
+    version = f"version_{timestamp}"
+    save_dir = MODELS_DIR / version
     save_dir.mkdir(parents=True, exist_ok=True)
     
-    for name, model in models.items():
-        with open(save_dir / f"{name}.pkl", "wb") as f:
-            pickle.dump(model, f)
+    # Flattened copies of the boosting models for the fast inference path;
+    # a loaded set's lazy segment router is not an artifact (its pairs are)
+    models = {**{k: v for k, v in models.items() if k != "segment_models"}, **compile_models(models)}
+    
+    # Components go to the content-addressed store; the version keeps a manifest
+    write_version(save_dir, models)
+    for name, report in (reports or {}).items():
+        with open(save_dir / f"{name}.json", "w") as f:
+            json.dump(report, f, indent=4, default=str)
             
     print(f"Models saved to {save_dir}")
-    return  f"version_{timestamp}"
 
-def load_latest_models() -> dict:
+    registry = registry or ModelRegistry()
+    registry.register_version(
+        version, save_dir, metrics=metrics,
+        config=config if config is not None else training_config(models),
+        data_fingerprint=data_fingerprint, timings=timings
+    )
+    if RETENTION_ON_SAVE:
+        apply_retention(registry)
+    return version
+
+def load_models(version_dir: Path) -> dict:
+    """
+    Loads every artifact saved with a version (models, features, risk_thresholds, ...).
+    Per-segment models are not read here; models["segment_models"] loads
+    them as their tickers are requested.
+    """
+    from .segments import attach_segments
+    return attach_segments(read_version(version_dir), version_dir)
+
+def load_latest_models(registry: ModelRegistry = None) -> dict:
     """
     Loads the most recent model version.
+    The registry answers "latest" from an index, skipping versions whose
+    directory is gone. Directories it does not know (created before it
+    existed, or copied in) are registered at API startup, by
+    `manage_models.py sync` and by retention, not on every load; an empty
+    registry is still synced here.
     """
     if not MODELS_DIR.exists():
         raise FileNotFoundError("Models directory not found.")
-        
-    versions = sorted([d for d in MODELS_DIR.iterdir() if d.is_dir() and d.name.startswith("version_")])
+
+    registry = registry or ModelRegistry()
+    latest = registry.latest_version()
+    if latest is None and registry.sync_from_disk():
+        latest = registry.latest_version()
     
-    if not versions:
+    if latest is None:
         raise FileNotFoundError("No model versions found.")
         
-    latest_version = versions[-1]
-    print(f"Loading models from {latest_version}...")
-    
-    models = {}
-    for filename in ["regressor.pkl", "classifier.pkl", "pca.pkl", "kmeans.pkl", "features.pkl"]:
-        p = latest_version / filename
-        if p.exists():
-            with open(p, "rb") as f:
-                models[p.stem] = pickle.load(f)
-                
+    print(f"Loading models from {latest['path']}...")
+    models = load_models(latest["path"])
+    models["version"] = latest["version"] # Identifies the loaded set, e.g. in HTTP cache validators
     return models
-
-
@@ -0,0 +1,156 @@
+import math
+import threading
+from typing import List, Optional
+import numpy as np
+import pandas as pd
+from .config import PORTFOLIO_EWMA_DECAY
+from .cleaning import trading_bars
+from .feature_engineering import label_risk_class
+
+# Observations older than this weight (relative to the newest) are dropped from the retained history
+HISTORY_WEIGHT_CUTOFF = 1e-8
+
+def returns_matrix(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Pivots [ticker, date, close] rows into a date x ticker matrix of daily
+    returns (the same close-to-close "return" create_features computes per ticker).
+    """
+    closes = trading_bars(df).pivot_table(index="date", columns="ticker", values="close", aggfunc="last").sort_index()
+    return closes.pct_change(fill_method=None).iloc[1:]
+
+class EwmaCovariance:
+    """
+    Exponentially weighted (RiskMetrics) covariance of daily returns across tickers.
+    Zero-mean returns; each new day r updates the weighted sum of outer products,
+    S <- decay * S + (1 - decay) * r r', so keeping the matrix current costs one
+    small matrix product per new day instead of a pass over the full history.
+    Each ticker keeps the date its returns were last applied through. A request
+    that moves the dates forward leaves the tickers it does not cover behind;
+    when they are sent again, their missed days are written into the retained
+    history and their row/column is recomputed from it, as for a ticker seen
+    for the first time. The history is trimmed to the window where weights are
+    still non-negligible. Returns missing from the data (holidays, listing gaps)
+    count as zero.
+    """
+
+    def __init__(self, decay: float = PORTFOLIO_EWMA_DECAY):
+        self.decay = decay
+        self.window = max(int(math.ceil(math.log(HISTORY_WEIGHT_CUTOFF) / math.log(decay))), 1)
+        self.tickers: List[str] = []
+        self._index = {}
+        self._applied = {} # ticker -> last date its returns are applied through
+        self._sum = np.zeros((0, 0))
+        self._weight = 0.0
+        self.history = pd.DataFrame()
+        self._lock = threading.Lock()
+
+    @property
+    def last_date(self):
+        return self.history.index[-1] if len(self.history) else None
+
+    def start_dates(self, tickers: List[str]) -> dict:
+        """
+        {ticker: first bar date update() needs for it}: its last applied date
+        (the close later returns are computed from), the start of the
+        retained history for tickers not seen yet, or None for all history.
+        """
+        with self._lock:
+            first = self.history.index[0] if len(self.history) else None
+            return {t: self._applied.get(t, first) for t in tickers}
+
+    def _weights(self, n: int) -> np.ndarray:
+        # Oldest first; the newest observation gets (1 - decay)
+        return (1 - self.decay) * self.decay ** np.arange(n - 1, -1, -1)
+
+    def _add_tickers(self, new: List[str]):
+        for ticker in new:
+            self._index[ticker] = len(self.tickers)
+            self.tickers.append(ticker)
+        n = len(self.tickers)
+        grown = np.zeros((n, n))
+        grown[:self._sum.shape[0], :self._sum.shape[1]] = self._sum
+        self._sum = grown
+        self.history = self.history.reindex(columns=self.tickers).astype(np.float64)
+
+    def _refresh(self, tickers: List[str]):
+        # Recomputes the rows/columns of tickers from the retained history
+        values = self.history.fillna(0).to_numpy()
+        idx = [self._index[t] for t in tickers]
+        block = (values * self._weights(len(values))[:, None]).T @ values[:, idx]
+        self._sum[:, idx] = block
+        self._sum[idx, :] = block.T
+
+    def _advance(self, returns: pd.DataFrame):
+        returns = returns.reindex(columns=self.tickers)
+        values = returns.fillna(0).to_numpy()
+        w = self._weights(len(values))
+        shrink = self.decay ** len(values)
+        self._sum = shrink * self._sum + (values * w[:, None]).T @ values
+        self._weight = shrink * self._weight + w.sum()
+        history = returns if self.history.empty else pd.concat([self.history, returns])
+        self.history = history.iloc[-self.window:]
+
+    def update(self, returns: pd.DataFrame) -> "EwmaCovariance":
+        """
+        Folds in a date x ticker return matrix (see returns_matrix). For each
+        ticker only dates after the ones already applied for it are used;
+        unseen tickers are added.
+        """
+        returns = returns.sort_index()
+        with self._lock:
+            self._add_tickers([t for t in returns.columns if t not in self._index])
+            last = self.last_date
+            if last is not None:
+                # Days before the newest one that some tickers have not been given yet
+                behind = []
+                for ticker in returns.columns:
+                    applied = self._applied.get(ticker)
+                    missed = returns[ticker].loc[:last].dropna()
+                    if applied is not None:
+                        missed = missed[missed.index > applied]
+                    missed = missed[missed.index.isin(self.history.index)]
+                    if len(missed):
+                        self.history.loc[missed.index, ticker] = missed
+                        behind.append(ticker)
+                if behind:
+                    self._refresh(behind)
+            fresh = returns if last is None else returns[returns.index > last]
+            if len(fresh):
+                self._advance(fresh)
+            for ticker in returns.columns:
+                seen = returns[ticker].last_valid_index()
+                if seen is not None and (ticker not in self._applied or seen > self._applied[ticker]):
+                    self._applied[ticker] = seen
+        return self
+
+    def covariance(self, tickers: Optional[List[str]] = None) -> np.ndarray:
+        """
+        Current covariance matrix for the given tickers (all tickers by default).
+        """
+        with self._lock:
+            if self._weight == 0:
+                raise ValueError("Covariance has no observations yet.")
+            if tickers is None:
+                return self._sum / self._weight
+            missing = [t for t in tickers if t not in self._index]
+            if missing:
+                raise ValueError(f"No return history for {missing}")
+            idx = [self._index[t] for t in tickers]
+            # Normalize by the total weight so short histories are not biased towards zero
+            return self._sum[np.ix_(idx, idx)] / self._weight
+
+def portfolio_risk(covariance: np.ndarray, weights, risk_thresholds: dict = None) -> dict:
+    """
+    Portfolio volatility sqrt(w' C w) and each position's risk contribution
+    w_i (C w)_i / vol, which sum to the portfolio volatility. With risk
+    thresholds (daily volatility, as persisted with the models) the portfolio
+    is also given a risk class.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    marginal = covariance @ weights
+    vol = float(np.sqrt(max(weights @ marginal, 0.0)))
+    contributions = weights * marginal / vol if vol > 0 else np.zeros_like(weights)
+    risk_class = None
+    if risk_thresholds is not None:
+        risk_class = int(label_risk_class([vol], risk_thresholds)[0])
+    return {"volatility": vol, "contributions": contributions, "risk_class": risk_class}
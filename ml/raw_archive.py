@@ -0,0 +1,186 @@
+import gzip
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+import pandas as pd
+from .config import RAW_ARCHIVE_DIR, DATA_DIR, CLEAN_DATA_DIR, REPROCESS_WORKERS
+
+# Archive layout: RAW_ARCHIVE_DIR/<ticker>/<source>_<fetched_at>_<first date>_<last date>.json.gz
+# Files are only ever added, so every provider response fetched stays available
+# to be parsed again when parsing or adjustment logic changes.
+
+SOURCES = ["alpha_vantage", "yfinance"]
+RAW_COLS = ["date", "open", "high", "low", "close", "volume", "dividend_amount", "split_coefficient", "ticker"]
+_NAME = re.compile(r"^(?P<source>[a-z_]+)_(?P<fetched_at>\d{8}T\d{6}Z)_(?P<first>[\d-]+)_(?P<last>[\d-]+)(?:_\d+)?\.json\.gz$")
+
+# Alpha Vantage gives: 1. open, 2. high, 3. low, 4. close, 5. adjusted close, 6. volume, 7. dividend amount, 8. split coefficient
+AV_COLUMNS = ["date", "open", "high", "low", "close", "adjusted close", "volume", "dividend_amount", "split_coefficient"]
+
+def parse_alpha_vantage(payload: dict, ticker: str) -> pd.DataFrame:
+    """
+    Raw bars from a TIME_SERIES_DAILY_ADJUSTED response. Prices are unadjusted;
+    the corporate action columns are kept for cleaning.
+    """
+    hist = pd.DataFrame.from_dict(payload["Time Series (Daily)"], orient="index")
+    hist.index.name = "date"
+    hist = hist.reset_index()
+    hist.columns = AV_COLUMNS
+    hist["date"] = pd.to_datetime(hist["date"], utc=True)
+    for col in RAW_COLS[1:-1]:
+        hist[col] = pd.to_numeric(hist[col], errors="coerce")
+    df = hist[RAW_COLS[:-1]].copy()
+    df["ticker"] = ticker
+    return df.sort_values("date")
+
+def yfinance_payload(hist: pd.DataFrame) -> dict:
+    """
+    JSON-serialisable form of a yfinance history() frame, every column kept.
+    """
+    hist = hist.reset_index()
+    date_col = hist.columns[0]
+    hist[date_col] = pd.to_datetime(hist[date_col], utc=True).dt.strftime("%Y-%m-%dT%H:%M:%S%z")
+    return json.loads(hist.to_json(orient="split", index=False))
+
+def parse_yfinance(payload: dict, ticker: str) -> pd.DataFrame:
+    """
+    Raw bars from a yfinance_payload. history() prices are already split/dividend
+    adjusted, so no corporate actions are passed on.
+    """
+    hist = pd.DataFrame(payload["data"], columns=payload["columns"]).rename(columns={
+        "Date": "date", "Open": "open", "High": "high", "Low": "low", "Close": "close", "Volume": "volume",
+    })
+    hist["date"] = pd.to_datetime(hist["date"], utc=True)
+    df = hist[["date", "open", "high", "low", "close", "volume"]].copy()
+    df["split_coefficient"] = 1.0
+    df["dividend_amount"] = 0.0
+    df["ticker"] = ticker
+    return df.sort_values("date")
+
+PARSERS = {"alpha_vantage": parse_alpha_vantage, "yfinance": parse_yfinance}
+# Whether responses of a source fetched at different times can be merged bar by bar.
+# Alpha Vantage bars are unadjusted with their split/dividend events, so they do not
+# change between fetches; yfinance restates its adjusted history after every event.
+MERGEABLE = {"alpha_vantage": True, "yfinance": False}
+
+def _date_range(source: str, payload: dict) -> Tuple[str, str]:
+    if source == "alpha_vantage":
+        dates = list(payload.get("Time Series (Daily)", {}))
+    else:
+        dates = [row[0] for row in payload.get("data", [])]
+    dates = sorted(str(d)[:10] for d in dates)
+    return (dates[0], dates[-1]) if dates else ("none", "none")
+
+def archive_payload(ticker: str, source: str, payload: dict, fetched_at: Optional[datetime] = None,
+                    archive_dir: Optional[Path] = None) -> Path:
+    """
+    Stores one provider response, gzip-compressed, without touching earlier ones.
+    """
+    if source not in PARSERS:
+        raise ValueError(f"Unknown source {source!r}; expected one of {SOURCES}.")
+    archive_dir = Path(archive_dir) if archive_dir is not None else RAW_ARCHIVE_DIR
+    fetched_at = (fetched_at or datetime.now(timezone.utc)).astimezone(timezone.utc)
+    first, last = _date_range(source, payload)
+    ticker_dir = archive_dir / ticker
+    ticker_dir.mkdir(parents=True, exist_ok=True)
+    stem = f"{source}_{fetched_at.strftime('%Y%m%dT%H%M%SZ')}_{first}_{last}"
+    path, n = ticker_dir / f"{stem}.json.gz", 1
+    while path.exists():
+        path, n = ticker_dir / f"{stem}_{n}.json.gz", n + 1
+    tmp = path.with_suffix(".tmp")
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        json.dump(payload, f)
+    os.replace(tmp, path)
+    return path
+
+def list_payloads(ticker: str, archive_dir: Optional[Path] = None) -> List[dict]:
+    """
+    Archived responses for a ticker, oldest fetch first:
+    [{path, source, fetched_at, first_date, last_date}].
+    """
+    archive_dir = Path(archive_dir) if archive_dir is not None else RAW_ARCHIVE_DIR
+    entries = []
+    for path in (archive_dir / ticker).glob("*.json.gz"):
+        match = _NAME.match(path.name)
+        if match is None:
+            continue
+        entries.append({
+            "path": path, "source": match["source"],
+            "fetched_at": datetime.strptime(match["fetched_at"], "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc),
+            "first_date": match["first"], "last_date": match["last"],
+        })
+    return sorted(entries, key=lambda e: (e["fetched_at"], e["path"].name))
+
+def archived_tickers(archive_dir: Optional[Path] = None) -> List[str]:
+    archive_dir = Path(archive_dir) if archive_dir is not None else RAW_ARCHIVE_DIR
+    if not archive_dir.exists():
+        return []
+    return sorted(p.name for p in archive_dir.iterdir() if p.is_dir())
+
+def load_payload(path: Path) -> dict:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+def rebuild_ticker(ticker: str, archive_dir: Optional[Path] = None, data_dir: Optional[Path] = None,
+                   clean_dir: Optional[Path] = None) -> dict:
+    """
+    Re-parses archived responses for a ticker into its CSV cache. Sources
+    are never mixed, since their prices are adjusted differently: the source
+    of the most recent parseable response is used. Alpha Vantage responses are
+    merged, with bars present in several responses taking the most recently
+    fetched values; for yfinance only the most recent response is used. The
+    CSV keeps the newest fetch time as its mtime, so cache freshness is the
+    same as if it had just been fetched then; the ticker's cleaned cache is
+    dropped because its bars may have changed.
+    """
+    data_dir = Path(data_dir) if data_dir is not None else DATA_DIR
+    clean_dir = Path(clean_dir) if clean_dir is not None else CLEAN_DATA_DIR
+    entries = list_payloads(ticker, archive_dir)
+    frames, used, source = [], [], None
+    # Newest first: the first parseable response picks the source
+    for entry in reversed(entries):
+        if source is not None and entry["source"] != source:
+            continue
+        payload = load_payload(entry["path"])
+        try:
+            frames.insert(0, PARSERS[entry["source"]](payload, ticker))
+        except (KeyError, ValueError) as e:
+            print(f"Skipping unparseable payload {entry['path'].name}: {e}")
+            continue
+        source = entry["source"]
+        used.insert(0, entry)
+        if not MERGEABLE[source]:
+            break
+    if not frames:
+        return {"ticker": ticker, "payloads": len(entries), "rows": 0}
+
+    df = pd.concat(frames, ignore_index=True)
+    df = df.drop_duplicates("date", keep="last").sort_values("date")
+    data_dir.mkdir(parents=True, exist_ok=True)
+    csv_path = data_dir / f"{ticker}.csv"
+    tmp = csv_path.with_suffix(".tmp")
+    df[RAW_COLS].to_csv(tmp, index=False)
+    os.replace(tmp, csv_path)
+    fetched = used[-1]["fetched_at"].timestamp()
+    os.utime(csv_path, (fetched, fetched))
+    for stale in [clean_dir / f"{ticker}.csv", clean_dir / f"{ticker}.json"]:
+        stale.unlink(missing_ok=True)
+    return {"ticker": ticker, "payloads": len(entries), "source": source, "payloads_used": len(used), "rows": len(df),
+            "first_date": df["date"].min().date().isoformat(), "last_date": df["date"].max().date().isoformat()}
+
+def rebuild_from_archive(tickers: Optional[Iterable[str]] = None, workers: int = REPROCESS_WORKERS,
+                         archive_dir: Optional[Path] = None, data_dir: Optional[Path] = None,
+                         clean_dir: Optional[Path] = None) -> List[dict]:
+    """
+    Rebuilds the CSV price cache for tickers (default: every archived ticker)
+    from the raw archive, one ticker per worker process, with no network access.
+    """
+    tickers = list(tickers) if tickers is not None else archived_tickers(archive_dir)
+    if workers <= 1 or len(tickers) <= 1:
+        return [rebuild_ticker(t, archive_dir, data_dir, clean_dir) for t in tickers]
+    with ProcessPoolExecutor(min(workers, len(tickers))) as pool:
+        futures = [pool.submit(rebuild_ticker, t, archive_dir, data_dir, clean_dir) for t in tickers]
+        return [f.result() for f in futures]
@@ -0,0 +1,244 @@
+import json
+import shutil
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+from .config import MODELS_DIR, REGISTRY_DB
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    version TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    path TEXT NOT NULL,
+    config TEXT,
+    data_fingerprint TEXT,
+    timings TEXT,
+    report TEXT,
+    pinned INTEGER NOT NULL DEFAULT 0,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_versions_live_created ON versions (deleted, created_at);
+CREATE TABLE IF NOT EXISTS metrics (
+    version TEXT NOT NULL REFERENCES versions (version),
+    name TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (version, name)
+);
+CREATE INDEX IF NOT EXISTS idx_metrics_name_value ON metrics (name, value);
+"""
+
+def _flatten_metrics(metrics: dict) -> dict:
+    # {"regression": {"RMSE": ..}} -> {"regression.RMSE": ..}; breakdowns stay in the JSON report only
+    flat = {}
+    for section in ["regression", "classification"]:
+        for name, value in (metrics.get(section) or {}).items():
+            if isinstance(value, (int, float)) or value is None:
+                flat[f"{section}.{name}"] = value
+    return flat
+
+def version_created_at(version: str, path: Optional[Path] = None) -> str:
+    # version_<YYYYmmdd_HHMMSS> -> ISO timestamp. Other names (e.g. a copied-in directory) use the
+    # directory's modification time, so they do not sort ahead of every later version.
+    try:
+        return datetime.strptime(version.replace("version_", ""), "%Y%m%d_%H%M%S").isoformat()
+    except ValueError:
+        if path is not None and Path(path).exists():
+            return datetime.fromtimestamp(Path(path).stat().st_mtime).isoformat()
+        return datetime.now().isoformat()
+
+class ModelRegistry:
+    """
+    Embedded SQLite index of model versions and their evaluation metrics.
+    Answers "latest", "best by metric" and history queries from indexes instead
+    of listing and sorting the models/ and experiments/ directories.
+    """
+
+    def __init__(self, db_path: Optional[Path] = None, models_dir: Optional[Path] = None):
+        self.db_path = Path(db_path) if db_path is not None else REGISTRY_DB
+        self.models_dir = Path(models_dir) if models_dir is not None else MODELS_DIR
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _row_to_dict(self, row) -> Optional[dict]:
+        if row is None:
+            return None
+        record = dict(row)
+        for key in ["config", "timings", "report"]:
+            record[key] = json.loads(record[key]) if record[key] else None
+        record["pinned"] = bool(record["pinned"])
+        record["deleted"] = bool(record["deleted"])
+        record["path"] = Path(record["path"])
+        return record
+
+    # --- Writing ---
+
+    def register_version(self, version: str, path: Optional[Path] = None, metrics: Optional[dict] = None,
+                         config: Optional[dict] = None, data_fingerprint: Optional[str] = None,
+                         timings: Optional[dict] = None, created_at: Optional[str] = None):
+        """
+        Records (or updates) a model version and, optionally, its metrics.
+        """
+        path = Path(path) if path is not None else self.models_dir / version
+        created_at = created_at or version_created_at(version, path)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                """
+                INSERT INTO versions (version, created_at, path, config, data_fingerprint, timings)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (version) DO UPDATE SET
+                    path = excluded.path,
+                    config = COALESCE(excluded.config, versions.config),
+                    data_fingerprint = COALESCE(excluded.data_fingerprint, versions.data_fingerprint),
+                    timings = COALESCE(excluded.timings, versions.timings),
+                    deleted = 0
+                """,
+                (version, created_at, str(path),
+                 json.dumps(config, default=str) if config is not None else None,
+                 data_fingerprint,
+                 json.dumps(timings) if timings is not None else None)
+            )
+        if metrics is not None:
+            self.log_metrics(version, metrics)
+
+    def log_metrics(self, version: str, metrics: dict):
+        """
+        Stores the full metrics report plus indexed top-level values.
+        """
+        with closing(self._connect()) as conn, conn:
+            conn.execute("UPDATE versions SET report = ? WHERE version = ?",
+                         (json.dumps(metrics, default=str), version))
+            conn.executemany(
+                "INSERT OR REPLACE INTO metrics (version, name, value) VALUES (?, ?, ?)",
+                [(version, name, value) for name, value in _flatten_metrics(metrics).items()]
+            )
+
+    def set_pinned(self, version: str, pinned: bool = True):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("UPDATE versions SET pinned = ? WHERE version = ?", (int(pinned), version))
+
+    def sync_from_disk(self) -> int:
+        """
+        Registers version directories the registry does not know as live:
+        ones that predate it, were copied in, or were written by another
+        process. Returns how many were added.
+        """
+        if not self.models_dir.exists():
+            return 0
+        with closing(self._connect()) as conn:
+            known = {row["version"] for row in conn.execute("SELECT version FROM versions WHERE deleted = 0")}
+        added = 0
+        for d in self.models_dir.iterdir():
+            if d.is_dir() and d.name.startswith("version_") and d.name not in known:
+                self.register_version(d.name, d)
+                added += 1
+        return added
+
+    # --- Queries ---
+
+    def get_version(self, version: str) -> Optional[dict]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM versions WHERE version = ?", (version,)).fetchone()
+        return self._row_to_dict(row)
+
+    def latest_version(self, with_report: bool = False) -> Optional[dict]:
+        """
+        Newest live version whose directory exists (with_report: among those
+        with a metrics report). Rows whose directory was removed outside
+        garbage_collect are skipped and flagged as deleted.
+        """
+        latest, missing = None, []
+        where = "deleted = 0 AND report IS NOT NULL" if with_report else "deleted = 0"
+        with closing(self._connect()) as conn:
+            for row in conn.execute(f"SELECT * FROM versions WHERE {where} ORDER BY created_at DESC"):
+                record = self._row_to_dict(row)
+                if record["path"].exists():
+                    latest = record
+                    break
+                missing.append(record["version"])
+        if missing:
+            with closing(self._connect()) as conn, conn:
+                conn.executemany("UPDATE versions SET deleted = 1 WHERE version = ?", [(v,) for v in missing])
+        return latest
+
+    def latest_metrics(self) -> Optional[dict]:
+        """
+        Metrics report of the newest version that has one.
+        """
+        latest = self.latest_version(with_report=True)
+        return latest["report"] if latest else None
+
+    def best_version(self, metric: str, higher_is_better: bool = True) -> Optional[dict]:
+        """
+        Version with the best value of a flattened metric, e.g. "classification.Accuracy".
+        """
+        order = "DESC" if higher_is_better else "ASC"
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                f"""
+                SELECT v.* FROM metrics m JOIN versions v ON v.version = m.version
+                WHERE m.name = ? AND m.value IS NOT NULL AND v.deleted = 0
+                ORDER BY m.value {order} LIMIT 1
+                """,
+                (metric,)
+            ).fetchone()
+        return self._row_to_dict(row)
+
+    def history(self, limit: int = 20, include_deleted: bool = False) -> List[dict]:
+        """
+        Newest-first versions with their flattened metrics.
+        """
+        where = "" if include_deleted else "WHERE deleted = 0"
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT * FROM versions {where} ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+            records = [self._row_to_dict(row) for row in rows]
+            for record in records:
+                record["metrics"] = {
+                    m["name"]: m["value"]
+                    for m in conn.execute("SELECT name, value FROM metrics WHERE version = ?", (record["version"],))
+                }
+        return records
+
+    # --- Retention ---
+
+    def garbage_collect(self, keep_last: int, keep_best: int = 0, metric: Optional[str] = None,
+                        higher_is_better: bool = True, dry_run: bool = False) -> List[str]:
+        """
+        Deletes the version directories of everything outside the retention set:
+        the newest keep_last versions, the keep_best best by metric, and pinned
+        versions. Registry rows are kept, flagged as deleted, so metrics history
+        survives. Returns the removed version names.
+        """
+        order = "DESC" if higher_is_better else "ASC"
+        with closing(self._connect()) as conn:
+            live = conn.execute("SELECT version, path FROM versions WHERE deleted = 0").fetchall()
+            keep = {row["version"] for row in conn.execute(
+                "SELECT version FROM versions WHERE deleted = 0 AND pinned = 1")}
+            keep |= {row["version"] for row in conn.execute(
+                "SELECT version FROM versions WHERE deleted = 0 ORDER BY created_at DESC LIMIT ?", (keep_last,))}
+            if keep_best and metric:
+                keep |= {row["version"] for row in conn.execute(
+                    f"""
+                    SELECT v.version FROM metrics m JOIN versions v ON v.version = m.version
+                    WHERE m.name = ? AND m.value IS NOT NULL AND v.deleted = 0
+                    ORDER BY m.value {order} LIMIT ?
+                    """, (metric, keep_best))}
+
+        doomed = sorted((row for row in live if row["version"] not in keep), key=lambda row: row["version"])
+        removed = [row["version"] for row in doomed]
+        if dry_run:
+            return removed
+        for row in doomed:
+            shutil.rmtree(row["path"], ignore_errors=True)
+        with closing(self._connect()) as conn, conn:
+            conn.executemany("UPDATE versions SET deleted = 1 WHERE version = ?", [(v,) for v in removed])
+        return removed
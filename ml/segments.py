@@ -0,0 +1,167 @@
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+import pandas as pd
+from .artifacts import ArtifactStore, read_version
+from .config import SEGMENT_KEY, SEGMENT_MIN_ROWS, SEGMENT_WORKERS, SEGMENT_CACHE_SIZE
+
+# Per-segment next-day models. Tickers are grouped by sector or by their
+# behaviour cluster, a regressor/classifier pair is trained per segment, and
+# every pair is saved as its own version component ("segment/<name>") next to
+# a routing table ("segments"). Serving loads the routing table with the
+# version and a segment's pair only when one of its tickers is requested.
+
+KEYS = ["sector", "cluster"]
+PREFIX = "segment/"
+
+def component_name(segment: str) -> str:
+    return f"{PREFIX}{segment}"
+
+def ticker_segments(df: pd.DataFrame, models: dict, key: str) -> dict:
+    """
+    {ticker: segment} for every ticker in df. "sector" uses the universe
+    file; "cluster" is the KMeans cluster most of a ticker's rows fall in.
+    """
+    if key == "sector":
+        from .universe import load_universe
+        sectors = load_universe().set_index("ticker")["sector"].astype(str).to_dict()
+        return {t: sectors.get(t, "Unknown") for t in df["ticker"].unique()}
+    if key == "cluster":
+        X = df[models["features"]]
+        labels = pd.Series(models["kmeans"].predict(models["pca"].transform(X)), index=df.index)
+        modal = labels.groupby(df["ticker"]).agg(lambda s: s.value_counts().idxmax())
+        return {t: f"cluster_{int(c)}" for t, c in modal.items()}
+    raise ValueError(f"Unknown segment key {key!r}; expected one of {KEYS}.")
+
+def _fit_segment(segment: str, X: pd.DataFrame, y_reg: pd.Series, y_clf: pd.Series) -> tuple:
+    # Runs in a worker process; compiled copies are built there too
+    from .compiled import compile_models
+    from .models import _make_regressor, _make_classifier
+    pair = {"regressor": _make_regressor().fit(X, y_reg), "classifier": _make_classifier().fit(X, y_clf)}
+    pair.update(compile_models(pair))
+    return segment, pair
+
+def train_segment_models(df: pd.DataFrame, models: dict, key: str = None, min_rows: int = SEGMENT_MIN_ROWS,
+                         workers: int = SEGMENT_WORKERS) -> dict:
+    """
+    Trains a regressor and classifier per segment of df, one segment per
+    worker process. Segments with fewer than min_rows rows or a single risk
+    class are left out; their tickers are served by the global models.
+    Returns the components to add to the model set: the routing table under
+    "segments" and each segment's pair under "segment/<name>".
+    """
+    key = key or SEGMENT_KEY
+    routes = ticker_segments(df, models, key)
+    segment_of = df["ticker"].map(routes)
+    features = models["features"]
+
+    jobs, skipped = [], {}
+    for segment, rows in df.groupby(segment_of, sort=True):
+        if len(rows) < min_rows or rows["risk_class"].nunique() < 2:
+            skipped[segment] = len(rows)
+            continue
+        jobs.append((segment, rows[features], rows["target_return_next_day"], rows["risk_class"]))
+    if skipped:
+        print(f"Segments served by the global models (too few rows or classes): {skipped}")
+
+    print(f"Training {len(jobs)} {key} segment models on {min(workers, len(jobs)) or 1} processes...")
+    if workers <= 1 or len(jobs) <= 1:
+        fitted = [_fit_segment(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(min(workers, len(jobs))) as pool:
+            fitted = [f.result() for f in [pool.submit(_fit_segment, *job) for job in jobs]]
+
+    trained = {segment for segment, _ in fitted}
+    rows = {segment: len(X) for segment, X, _, _ in jobs}
+    tickers = Counter(routes.values())
+    components = {component_name(segment): pair for segment, pair in fitted}
+    components["segments"] = {
+        "key": key,
+        "routes": {t: s for t, s in routes.items() if s in trained},
+        "segments": {s: {"rows": rows[s], "tickers": tickers[s]} for s in sorted(trained)},
+    }
+    return components
+
+class VersionComponents:
+    """
+    Loads single components of a saved version on demand.
+    """
+
+    def __init__(self, version_dir: Path, store: Optional[ArtifactStore] = None):
+        self.version_dir = Path(version_dir)
+        self.store = store
+
+    def __call__(self, name: str):
+        components = read_version(self.version_dir, self.store, [name])
+        if name not in components:
+            raise KeyError(f"{self.version_dir.name} has no component {name!r}.")
+        return components[name]
+
+class SegmentModels:
+    """
+    Routes tickers to their segment's models. load(name) fetches a
+    component; pairs are loaded on first use and the cache_size most
+    recently used are kept, so memory follows the segments being requested
+    rather than how many were trained.
+    """
+
+    def __init__(self, table: dict, load: Callable[[str], dict], cache_size: int = SEGMENT_CACHE_SIZE):
+        self.key = table["key"]
+        self.routes = table["routes"]
+        self.segments = table["segments"]
+        self.cache_size = cache_size
+        self._load = load
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_models(cls, models: dict, cache_size: int = SEGMENT_CACHE_SIZE) -> Optional["SegmentModels"]:
+        """
+        The segment router of a model set: the lazy one attached by
+        load_models, or one over the pairs held in a freshly trained set.
+        None without segments.
+        """
+        if models.get("segment_models") is not None:
+            return models["segment_models"]
+        if models.get("segments") is None:
+            return None
+        return cls(models["segments"], models.__getitem__, cache_size)
+
+    def segment(self, ticker: str) -> Optional[str]:
+        return self.routes.get(ticker)
+
+    def get(self, ticker: str) -> Optional[dict]:
+        """
+        The segment pair serving ticker, or None if the global models do.
+        """
+        segment = self.routes.get(ticker)
+        if segment is None:
+            return None
+        with self._lock:
+            if segment in self._cache:
+                self._cache.move_to_end(segment)
+                return self._cache[segment]
+        pair = self._load(component_name(segment))
+        with self._lock:
+            self._cache[segment] = pair
+            self._cache.move_to_end(segment)
+            while self.cache_size > 0 and len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return pair
+
+    @property
+    def loaded(self) -> list:
+        with self._lock:
+            return list(self._cache)
+
+    def summary(self) -> dict:
+        return {"key": self.key, "segments": len(self.segments), "routed_tickers": len(self.routes),
+                "loaded": self.loaded}
+
+def attach_segments(models: dict, version_dir: Path, store: Optional[ArtifactStore] = None) -> dict:
+    # Called by load_models: segment pairs stay on disk until requested
+    if models.get("segments") is not None:
+        models["segment_models"] = SegmentModels(models["segments"], VersionComponents(version_dir, store))
+    return models
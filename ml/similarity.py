@@ -0,0 +1,170 @@
+from typing import List, Optional
+import numpy as np
+import pandas as pd
+from .config import EMBEDDING_WINDOW, ANN_TREES, ANN_LEAF_SIZE, ANN_EXACT_BELOW
+
+def behaviour_embeddings(df: pd.DataFrame, pca, features: List[str], window: int = EMBEDDING_WINDOW) -> pd.DataFrame:
+    """
+    One behaviour vector per ticker: the mean and standard deviation of the
+    PCA projection of its last `window` feature rows, so the embedding reflects
+    recent behaviour rather than a single day. Returns a ticker-indexed frame.
+    """
+    rows = df.dropna(subset=features).sort_values(["ticker", "date"]).groupby("ticker").tail(window)
+    if rows.empty:
+        raise ValueError("No complete feature rows to embed.")
+    projected = pd.DataFrame(pca.transform(rows[features]), index=rows.index)
+    projected["ticker"] = rows["ticker"].to_numpy()
+    grouped = projected.groupby("ticker")
+    mean, std = grouped.mean(), grouped.std(ddof=0)
+    return pd.concat([mean.add_prefix("mean_"), std.add_prefix("std_")], axis=1)
+
+class RandomProjectionForest:
+    """
+    Approximate nearest-neighbour index: a forest of random-projection trees.
+    Each internal node splits its points at the median of their projection on
+    a random direction; leaves hold at most leaf_size points. A query descends
+    every tree at once (one vectorized step per level), takes the union of the
+    reached leaves as candidates and ranks them by exact Euclidean distance.
+    Nodes are stored in flat arrays so queries need no Python object traversal.
+    """
+
+    def __init__(self, n_trees: int = ANN_TREES, leaf_size: int = ANN_LEAF_SIZE, random_state: int = 42):
+        self.n_trees = n_trees
+        self.leaf_size = leaf_size
+        self.random_state = random_state
+
+    def fit(self, X: np.ndarray) -> "RandomProjectionForest":
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        rng = np.random.default_rng(self.random_state)
+        directions, offsets, children, leaf_bounds, leaf_items, roots = [], [], [], [], [], []
+        n_leaf_items = 0
+
+        def build(idx: np.ndarray) -> int:
+            nonlocal n_leaf_items
+            node = len(offsets)
+            directions.append(None)
+            offsets.append(0.0)
+            children.append((-1, -1))
+            leaf_bounds.append((0, 0))
+            if len(idx) > self.leaf_size:
+                direction = rng.normal(size=X.shape[1])
+                proj = X[idx] @ direction
+                offset = np.median(proj)
+                left = proj <= offset
+                # Ties can leave one side empty; such nodes become leaves
+                if 0 < left.sum() < len(idx):
+                    directions[node], offsets[node] = direction, offset
+                    left_node = build(idx[left])
+                    right_node = build(idx[~left])
+                    children[node] = (left_node, right_node)
+                    return node
+            leaf_items.append(idx)
+            leaf_bounds[node] = (n_leaf_items, n_leaf_items + len(idx))
+            n_leaf_items += len(idx)
+            return node
+
+        for _ in range(self.n_trees):
+            roots.append(build(np.arange(len(X))))
+
+        dim = X.shape[1]
+        self.directions_ = np.stack([d if d is not None else np.zeros(dim) for d in directions])
+        self.offsets_ = np.asarray(offsets)
+        self.children_ = np.asarray(children, dtype=np.int64)
+        self.leaf_bounds_ = np.asarray(leaf_bounds, dtype=np.int64)
+        self.leaf_items_ = np.concatenate(leaf_items)
+        self.roots_ = np.asarray(roots, dtype=np.int64)
+        self.data_ = X
+        return self
+
+    def candidates(self, q: np.ndarray) -> np.ndarray:
+        nodes = self.roots_.copy()
+        while True:
+            internal = self.children_[nodes, 0] >= 0
+            if not internal.any():
+                break
+            current = nodes[internal]
+            go_right = (self.directions_[current] @ q) > self.offsets_[current]
+            nodes[internal] = self.children_[current, go_right.astype(np.int64)]
+        bounds = self.leaf_bounds_[nodes]
+        return np.unique(np.concatenate([self.leaf_items_[start:end] for start, end in bounds]))
+
+    def query(self, q, k: int):
+        """
+        Returns (indices, distances) of the approximate k nearest points, nearest first.
+        """
+        q = np.asarray(q, dtype=np.float64)
+        candidates = self.candidates(q)
+        dist = np.sqrt(((self.data_[candidates] - q) ** 2).sum(axis=1))
+        k = min(k, len(candidates))
+        top = np.argpartition(dist, k - 1)[:k] if k < len(candidates) else np.arange(len(candidates))
+        top = top[np.argsort(dist[top], kind="stable")]
+        return candidates[top], dist[top]
+
+class SimilarityIndex:
+    """
+    Ticker behaviour embeddings plus a nearest-neighbour index over them,
+    saved with the model version. Small universes are searched exactly.
+    """
+
+    def __init__(self, embeddings: pd.DataFrame, risk_classes: Optional[dict] = None,
+                 window: int = EMBEDDING_WINDOW, exact_below: int = ANN_EXACT_BELOW):
+        self.tickers = list(embeddings.index)
+        self.window = window
+        self.vectors = embeddings.to_numpy(dtype=np.float64)
+        # Scale each dimension so means and spreads of all components weigh equally
+        self.scale = self.vectors.std(axis=0)
+        self.scale[self.scale == 0] = 1.0
+        self.vectors = self.vectors / self.scale
+        self._position = {t: i for i, t in enumerate(self.tickers)}
+        self.risk_classes = risk_classes or {}
+        self.forest = None
+        if len(self.tickers) >= exact_below:
+            self.forest = RandomProjectionForest().fit(self.vectors)
+
+    def __contains__(self, ticker: str) -> bool:
+        return ticker in self._position
+
+    def vector(self, ticker: str) -> np.ndarray:
+        return self.vectors[self._position[ticker]]
+
+    def normalize(self, embedding) -> np.ndarray:
+        return np.asarray(embedding, dtype=np.float64) / self.scale
+
+    def query(self, vector, k: int, exclude: Optional[str] = None):
+        """
+        Returns [(ticker, distance)] for the k nearest tickers, nearest first.
+        """
+        n = k + (exclude is not None)
+        if self.forest is not None:
+            idx, dist = self.forest.query(vector, n)
+        else:
+            dist_all = np.sqrt(((self.vectors - vector) ** 2).sum(axis=1))
+            idx = np.argsort(dist_all, kind="stable")[:n]
+            dist = dist_all[idx]
+        results = [(self.tickers[i], float(d)) for i, d in zip(idx, dist) if self.tickers[i] != exclude]
+        return results[:k]
+
+def _latest_rows(sources, columns: List[str], window: int) -> pd.DataFrame:
+    # Last `window` rows per ticker across DataFrames and/or FeatureStores, one partition at a time
+    from .feature_store import FeatureStore
+    tails = []
+    for data in sources:
+        frames = data.iter_partitions(columns) if isinstance(data, FeatureStore) else [data[columns]]
+        for frame in frames:
+            tails.append(frame.dropna().sort_values(["ticker", "date"]).groupby("ticker").tail(window))
+    rows = pd.concat(tails, ignore_index=True)
+    return rows.sort_values(["ticker", "date"]).groupby("ticker").tail(window)
+
+def build_similarity_index(models: dict, *data, window: int = EMBEDDING_WINDOW) -> SimilarityIndex:
+    """
+    Embeds every ticker found in data (DataFrames or FeatureStores) with the
+    trained PCA and indexes the embeddings. Each ticker's latest predicted risk
+    class is stored alongside, so risk-filtered recommendations need no extra scoring.
+    """
+    features = models["features"]
+    rows = _latest_rows(data, features + ["ticker", "date"], window)
+    embeddings = behaviour_embeddings(rows, models["pca"], features, window)
+    latest = rows.groupby("ticker").tail(1)
+    predicted = models["classifier"].predict(latest[features])
+    risk_classes = {t: int(c) for t, c in zip(latest["ticker"], predicted)}
+    return SimilarityIndex(embeddings, risk_classes, window)
@@ -0,0 +1,65 @@
+import json
+from pathlib import Path
+from typing import Iterator, List, Optional
+import pandas as pd
+from .config import TICKERS, UNIVERSE_FILE, SHARD_SIZE
+
+def load_universe(path: Optional[str] = None) -> pd.DataFrame:
+    """
+    Loads a ticker universe definition.
+    Returns a DataFrame with columns: [ticker, sector].
+    Falls back to the hard-coded TICKERS when no universe file is configured.
+    """
+    path = path or UNIVERSE_FILE
+    if not path:
+        return pd.DataFrame({"ticker": TICKERS, "sector": "Unknown"})
+
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"Universe file not found: {path}")
+
+    suffix = path.suffix.lower()
+    if suffix == ".csv":
+        universe = pd.read_csv(path)
+        universe.columns = [c.strip().lower() for c in universe.columns]
+        if "ticker" not in universe.columns:
+            raise ValueError("Universe CSV must contain a 'ticker' column.")
+    elif suffix == ".json":
+        with open(path) as f:
+            data = json.load(f)
+        # Accept either a plain list or {"tickers": [...]}
+        if isinstance(data, dict):
+            data = data.get("tickers", [])
+        universe = pd.DataFrame(data if data and isinstance(data[0], dict) else {"ticker": data})
+    else:
+        # Plain text: one ticker per line, '#' starts a comment
+        tickers = []
+        with open(path) as f:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if line:
+                    tickers.append(line)
+        universe = pd.DataFrame({"ticker": tickers})
+
+    if "sector" not in universe.columns:
+        universe["sector"] = "Unknown"
+    universe["ticker"] = universe["ticker"].astype(str).str.strip().str.upper()
+    universe["sector"] = universe["sector"].fillna("Unknown").astype(str)
+    universe = universe[universe["ticker"] != ""].drop_duplicates(subset="ticker")
+
+    return universe[["ticker", "sector"]].reset_index(drop=True)
+
+def get_tickers(path: Optional[str] = None) -> List[str]:
+    """
+    Returns the list of tickers in the configured universe.
+    """
+    return load_universe(path)["ticker"].tolist()
+
+def iter_shards(tickers: List[str], shard_size: int = SHARD_SIZE) -> Iterator[List[str]]:
+    """
+    Yields consecutive chunks of at most shard_size tickers.
+    """
+    if shard_size <= 0:
+        raise ValueError("shard_size must be positive.")
+    for start in range(0, len(tickers), shard_size):
+        yield tickers[start:start + shard_size]
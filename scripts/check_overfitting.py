@@ -15,12 +15,13 @@ def check_overfitting():
     print("Loading data...")
     # 1. Fetch & Prepare Data (Identical to training flow)
     df = fetch_stock_data(TICKERS, use_cache=True)
-    df_features = create_features(df)
-    train_df, test_df = split_data(df_features, test_days=TEST_SIZE_DAYS)
     
     # 2. Load Models
     print("Loading latest models...")
     models = load_latest_models()
+    df_features = create_features(df, risk_thresholds=models.get("risk_thresholds"),
+                                  horizon_thresholds=models.get("horizon_risk_thresholds"))
+    train_df, test_df = split_data(df_features, test_size=TEST_SIZE_DAYS)
     regressor = models["regressor"]
     features = models["features"]
     
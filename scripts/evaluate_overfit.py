@@ -5,19 +5,12 @@ from ml.models import load_latest_models
 from ml.data_ingestion import fetch_stock_data
 from ml.feature_engineering import create_features, split_data
 from ml.evaluation import evaluate_models
-from ml.config import TICKERS, HISTORY_YEARS, TEST_SIZE_DAYS, EXPERIMENTS_DIR
+from ml.config import TICKERS, HISTORY_YEARS, TEST_SIZE_DAYS
+from ml.registry import ModelRegistry
 
-def get_latest_metrics(skip_recent=0):
-    # Find the most recent metrics file in experiments directory
-    if not EXPERIMENTS_DIR.exists():
-        return None
-    metric_files = sorted([f for f in EXPERIMENTS_DIR.iterdir() if f.is_file() and f.name.startswith('metrics_')])
-    if len(metric_files) <= skip_recent:
-        return None
-    # We skip the most recent one if we just created a training metrics file
-    latest = metric_files[-(1 + skip_recent)]
-    with open(latest) as f:
-        return json.load(f)
+def get_latest_metrics():
+    # Metrics of the newest registered model version (indexed lookup)
+    return ModelRegistry().latest_metrics()
 
 def main():
     # Load models
@@ -27,19 +20,19 @@ def main():
         return
     # Ingest data and create features
     df_raw = fetch_stock_data(TICKERS, use_cache=True)
-    df_feat = create_features(df_raw)
+    # Label with the thresholds persisted at training time (older versions: recompute)
+    df_feat = create_features(df_raw, risk_thresholds=models.get("risk_thresholds"),
+                              horizon_thresholds=models.get("horizon_risk_thresholds"))
     
     # Split to get training set
     # Note: split_data now takes test_size as a float (e.g. 0.2)
     train_df, _ = split_data(df_feat, test_size=0.2)
     
-    # Evaluate on training data
-    # IMPORTANT: evaluate_models saves metrics to disk. 
+    # Evaluate on training data (no sink: nothing is written to experiments/)
     train_metrics = evaluate_models(models, train_df)
     
     # Load actual test metrics (the ones saved from the pipeline run)
-    # Since evaluate_models just saved a file, we skip the most recent one.
-    test_metrics = get_latest_metrics(skip_recent=1)
+    test_metrics = get_latest_metrics()
     if not test_metrics:
         print('No test metrics file found.')
         return
@@ -0,0 +1,42 @@
+import sys
+import argparse
+import time
+from pathlib import Path
+
+# Add project root to python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.services import PredictionService
+from ml.config import EXPORT_CHUNK_ROWS
+from ml.export import FORMATS, coalesce, export_schema, iter_encoded
+from ml.models import load_latest_models
+from ml.universe import get_tickers
+
+def main():
+    parser = argparse.ArgumentParser(description="Export features and predictions for many tickers as Arrow IPC or Parquet.")
+    parser.add_argument("tickers", nargs="*", help="Tickers to export (default: the configured universe)")
+    parser.add_argument("--start", help="First date (YYYY-MM-DD)")
+    parser.add_argument("--end", help="Last date (YYYY-MM-DD)")
+    parser.add_argument("--format", choices=list(FORMATS), default="parquet")
+    parser.add_argument("--no-predictions", action="store_true", help="Only export features")
+    parser.add_argument("--chunk-rows", type=int, default=EXPORT_CHUNK_ROWS)
+    parser.add_argument("--output", "-o", required=True, help="Output file")
+    args = parser.parse_args()
+
+    models = load_latest_models()
+    if not models:
+        sys.exit("No trained models found.")
+    service = PredictionService(models)
+    predictions = not args.no_predictions
+    schema = export_schema(service.export_features, predictions)
+
+    start, written = time.perf_counter(), 0
+    frames = service.iter_export(args.tickers or get_tickers(), args.start, args.end, predictions)
+    with open(args.output, "wb") as f:
+        for part in iter_encoded(coalesce(frames, args.chunk_rows), schema, args.format):
+            f.write(part)
+            written += len(part)
+    print(f"Wrote {written / 1e6:.1f} MB to {args.output} in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
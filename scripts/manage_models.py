@@ -0,0 +1,74 @@
+import sys
+import argparse
+from pathlib import Path
+
+# Add project root to python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from ml.artifacts import apply_retention, compact
+from ml.config import RETAIN_LAST, RETAIN_BEST, RETAIN_METRIC
+from ml.registry import ModelRegistry
+
+def main():
+    parser = argparse.ArgumentParser(description="Query and maintain the model registry.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    history = sub.add_parser("history", help="List recent model versions")
+    history.add_argument("--limit", type=int, default=20)
+
+    sub.add_parser("latest", help="Show the latest model version")
+
+    best = sub.add_parser("best", help="Show the best version by a metric")
+    best.add_argument("metric", help='e.g. "classification.Accuracy" or "regression.RMSE"')
+    best.add_argument("--lower-is-better", action="store_true")
+
+    pin = sub.add_parser("pin", help="Protect a version from garbage collection")
+    pin.add_argument("version")
+    pin.add_argument("--unpin", action="store_true")
+
+    gc = sub.add_parser("gc", help="Delete old versions and the stored components only they used")
+    compaction = sub.add_parser("compact", help="Move versions into the compressed artifact store and apply retention")
+    for cmd in [gc, compaction]:
+        cmd.add_argument("--keep-last", type=int, default=RETAIN_LAST)
+        cmd.add_argument("--keep-best", type=int, default=RETAIN_BEST)
+        cmd.add_argument("--metric", default=RETAIN_METRIC)
+        cmd.add_argument("--lower-is-better", action="store_true")
+        cmd.add_argument("--dry-run", action="store_true")
+
+    sub.add_parser("sync", help="Register version directories missing from the registry")
+
+    args = parser.parse_args()
+    registry = ModelRegistry()
+
+    if args.command == "history":
+        for record in registry.history(args.limit):
+            pinned = " (pinned)" if record["pinned"] else ""
+            print(f"{record['version']}{pinned}  {record['created_at']}  {record['metrics']}")
+    elif args.command == "latest":
+        print(registry.latest_version())
+    elif args.command == "best":
+        print(registry.best_version(args.metric, higher_is_better=not args.lower_is_better))
+    elif args.command == "pin":
+        registry.set_pinned(args.version, not args.unpin)
+    elif args.command == "gc":
+        # Version directories only hold manifests; the space is in the unreferenced blobs
+        report = apply_retention(registry, keep_last=args.keep_last, keep_best=args.keep_best,
+                                 metric=args.metric, higher_is_better=not args.lower_is_better,
+                                 dry_run=args.dry_run)
+        action = "Would remove" if args.dry_run else "Removed"
+        print(f"{action} {len(report['removed_versions'])} version(s) and {report['removed_blobs']} blob(s): "
+              f"{report['removed_versions']}")
+    elif args.command == "compact":
+        report = compact(registry=registry, dry_run=args.dry_run, keep_last=args.keep_last,
+                         keep_best=args.keep_best, metric=args.metric,
+                         higher_is_better=not args.lower_is_better)
+        action = "Would remove" if args.dry_run else "Removed"
+        print(f"Migrated {report['migrated_versions']} legacy version(s).")
+        print(f"{action} {len(report['removed_versions'])} version(s) and {report['removed_blobs']} blob(s): "
+              f"{report['removed_versions']}")
+        print(f"models/ size: {report['bytes_before'] / 1e6:.1f} MB -> {report['bytes_after'] / 1e6:.1f} MB")
+    elif args.command == "sync":
+        print(f"Registered {registry.sync_from_disk()} version(s).")
+
+if __name__ == "__main__":
+    main()
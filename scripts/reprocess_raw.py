@@ -0,0 +1,37 @@
+import sys
+import argparse
+import time
+from pathlib import Path
+
+# Add project root to python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from ml.config import REPROCESS_WORKERS
+from ml.raw_archive import archived_tickers, list_payloads, rebuild_from_archive
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the CSV price cache from archived raw provider responses, offline.")
+    parser.add_argument("tickers", nargs="*", help="Tickers to rebuild (default: every archived ticker)")
+    parser.add_argument("--workers", type=int, default=REPROCESS_WORKERS)
+    parser.add_argument("--list", action="store_true", help="Only list the archived responses")
+    args = parser.parse_args()
+
+    tickers = args.tickers or archived_tickers()
+    if args.list:
+        for ticker in tickers:
+            for entry in list_payloads(ticker):
+                print(f"{ticker}  {entry['source']}  fetched {entry['fetched_at']:%Y-%m-%d %H:%M}  "
+                      f"{entry['first_date']} .. {entry['last_date']}")
+        return
+
+    start = time.perf_counter()
+    results = rebuild_from_archive(tickers, workers=args.workers)
+    for r in results:
+        if r["rows"]:
+            print(f"{r['ticker']}: {r['rows']} bars from {r['payloads']} payloads ({r['first_date']} .. {r['last_date']})")
+        else:
+            print(f"{r['ticker']}: nothing parseable in {r['payloads']} payloads")
+    print(f"Rebuilt {len(results)} tickers in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
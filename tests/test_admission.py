@@ -0,0 +1,68 @@
+import asyncio
+import pytest
+from app.admission import Lane, Overloaded, controller
+from tests.test_api import client, mock_fetch
+
+def test_lane_bounds_queue_and_wait():
+    async def scenario():
+        lane = Lane("hit", concurrency=1, max_queue=1, timeout=0.05)
+        await lane.acquire("a")
+        waiter = asyncio.create_task(lane.acquire("b"))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as full:
+            await lane.acquire("c")
+        assert full.value.status_code == 429 and full.value.retry_after >= 1
+        with pytest.raises(Overloaded) as timed_out:
+            await waiter
+        assert timed_out.value.status_code == 503
+        lane.release(0.01)
+        await lane.acquire("d")
+        assert lane.stats()["admitted"] == 2 and lane.stats()["rejected"] == 2
+    asyncio.run(scenario())
+
+def test_overload_rejects_or_serves_stale(mock_fetch, monkeypatch):
+    assert client.post("/predict_return", json={"ticker": "AAPL"}).status_code == 200
+    assert all(lane["active"] == 0 for lane in controller.stats().values()) # slot released
+
+    # Saturate both lanes: no slots, no queue
+    monkeypatch.setattr(controller, "lanes", {name: Lane(name, 0, 0, 0.01) for name in ["hit", "miss"]})
+    stale = client.post("/predict_return", json={"ticker": "AAPL"})
+    assert stale.status_code == 200
+    assert stale.json()["predicted_next_day_return"] == 0.01
+    assert "Stale" in stale.headers["Warning"]
+
+    rejected = client.post("/predict_return", json={"ticker": "MSFT"})
+    assert rejected.status_code == 429
+    assert int(rejected.headers["Retry-After"]) >= 1
+
+def test_stale_responses_expire_and_follow_the_model_version(mock_fetch, monkeypatch):
+    from app.main import app
+    from app.dependencies import get_models
+    from tests.test_api import mock_models
+    assert client.post("/predict_return", json={"ticker": "AAPL"}).status_code == 200
+    monkeypatch.setattr(controller, "lanes", {name: Lane(name, 0, 0, 0.01) for name in ["hit", "miss"]})
+
+    # A new model version never serves the previous version's responses
+    app.dependency_overrides[get_models] = lambda: {**mock_models, "version": "version_2"}
+    assert client.post("/predict_return", json={"ticker": "AAPL"}).status_code == 429
+    app.dependency_overrides[get_models] = lambda: mock_models
+    assert client.post("/predict_return", json={"ticker": "AAPL"}).status_code == 200
+
+    monkeypatch.setattr(controller, "stale_max_age", 0.0)
+    assert client.post("/predict_return", json={"ticker": "AAPL"}).status_code == 429
+
+def test_streamed_body_holds_the_lane_slot():
+    from app.admission import Ticket
+
+    async def scenario():
+        lane = Lane("hit", concurrency=1, max_queue=0, timeout=0.01)
+        await lane.acquire("range")
+        ticket = Ticket(controller, "range", lane)
+        body = ticket.stream(iter(["a\n", "b\n"]))
+        assert await body.__anext__() == "a\n"
+        assert lane.active == 1 # still sending
+        assert [chunk async for chunk in body] == ["b\n"]
+        assert lane.active == 0
+        ticket.release() # no double release
+        assert lane.active == 0
+    asyncio.run(scenario())
@@ -1,7 +1,11 @@
 from fastapi.testclient import TestClient
 from app.main import app
-from app.dependencies import get_models
+from app.dependencies import get_models, get_covariance
+from ml.portfolio import EwmaCovariance
+from ml.similarity import SimilarityIndex
 from unittest.mock import MagicMock
+import json
+import numpy as np
 import pandas as pd
 import pytest
 
@@ -13,7 +17,8 @@ mock_models = {
     "classifier": MagicMock(),
     "pca": MagicMock(),
     "kmeans": MagicMock(),
-    "features": ["f1"] # Dummy feature list
+    "features": ["f1"], # Dummy feature list
+    "horizon_models": {h: {"regressor": MagicMock(), "classifier": MagicMock()} for h in [1, 5, 20]}
 }
 
 # Mock methods
@@ -21,6 +26,9 @@ mock_models["regressor"].predict.return_value = [0.01]
 mock_models["classifier"].predict_proba.return_value = [[0.8, 0.1, 0.1]]
 mock_models["pca"].transform.return_value = [[1.0, 0.0, 0.0]]
 mock_models["kmeans"].predict.return_value = [0]
+for h, pair in mock_models["horizon_models"].items():
+    pair["regressor"].predict.return_value = [0.01 * h]
+    pair["classifier"].predict_proba.return_value = [[0.1, 0.2, 0.7]]
 
 # Mock fetch_stock_data to avoid API calls
 @pytest.fixture
@@ -65,3 +73,89 @@ def test_predict_return(mock_fetch):
     assert "predicted_next_day_return" in response.json()
 
 
+
+def test_predict_horizons(mock_fetch):
+    response = client.post("/predict_horizons", json={"ticker": "AAPL"})
+    assert response.status_code == 200
+    horizons = response.json()["horizons"]
+    assert [h["horizon_days"] for h in horizons] == [1, 5, 20]
+    assert horizons[2]["predicted_return"] == pytest.approx(0.2)
+    assert horizons[0]["risk_class"] == "High"
+
+def test_portfolio_risk(mocker):
+    dates = pd.bdate_range("2024-01-01", periods=60)
+    rng = np.random.default_rng(0)
+    history = pd.concat([
+        pd.DataFrame({"ticker": t, "date": dates, "close": 100 * np.cumprod(1 + rng.normal(0, 0.01, 60))})
+        for t in ["AAPL", "MSFT"]
+    ])
+    mocker.patch("app.services.fetch_stock_data", return_value=history)
+    app.dependency_overrides[get_models] = lambda: {**mock_models, "risk_thresholds": {"low": 0.005, "high": 0.02}}
+    app.dependency_overrides[get_covariance] = lambda: EwmaCovariance()
+    try:
+        response = client.post("/portfolio_risk", json={"holdings": {"AAPL": 0.6, "MSFT": 0.4}})
+    finally:
+        app.dependency_overrides = {}
+    assert response.status_code == 200
+    body = response.json()
+    assert [c["ticker"] for c in body["contributions"]] == ["AAPL", "MSFT"]
+    assert sum(c["risk_contribution"] for c in body["contributions"]) == pytest.approx(body["volatility"])
+    assert body["risk_class"] in ["Low", "Medium", "High"]
+
+def test_recommend_similar_top_k(mock_fetch):
+    embeddings = pd.DataFrame([[0.0, 0.0], [0.1, 0.0], [1.0, 1.0], [0.3, 0.1]],
+                              index=["AAPL", "MSFT", "TSLA", "NVDA"])
+    index = SimilarityIndex(embeddings, risk_classes={"MSFT": 0, "TSLA": 2, "NVDA": 2})
+    app.dependency_overrides[get_models] = lambda: {**mock_models, "similarity_index": index}
+    response = client.get("/recommend_similar", params={"ticker": "AAPL", "k": 2})
+    assert response.status_code == 200
+    recs = response.json()["recommendations"]
+    assert [r["ticker"] for r in recs] == ["MSFT", "NVDA"]
+    assert recs[0]["distance"] < recs[1]["distance"]
+
+    response = client.get("/recommend_similar", params={"ticker": "AAPL", "risk_preference": "High", "k": 2})
+    assert [r["ticker"] for r in response.json()["recommendations"]] == ["NVDA", "TSLA"]
+
+@pytest.fixture
+def history_models(mocker):
+    # Three years of bars; predictions echo the feature so rows can be identified
+    dates = pd.bdate_range("2021-01-01", "2023-12-29", tz="UTC")
+    features = pd.DataFrame({"ticker": "AAPL", "date": dates, "f1": np.arange(len(dates), dtype=float),
+                             "return_lag1": 0.01, "volatility_20d": 0.02})
+    mocker.patch("app.services.fetch_stock_data", return_value=features[["ticker", "date"]])
+    mocker.patch("app.services.create_features", return_value=features)
+    regressor, classifier = MagicMock(), MagicMock()
+    regressor.predict.side_effect = lambda X: X["f1"].to_numpy()
+    classifier.predict_proba.side_effect = lambda X: np.tile([0.2, 0.5, 0.3], (len(X), 1))
+    app.dependency_overrides[get_models] = lambda: {**mock_models, "regressor": regressor, "classifier": classifier}
+    yield features
+    app.dependency_overrides = {}
+
+def test_predict_as_of(history_models):
+    # 2022-07-04 is a Monday; the bar on that date is scored
+    response = client.post("/predict_return", json={"ticker": "AAPL", "as_of": "2022-07-04"})
+    assert response.status_code == 200
+    expected = history_models.index[history_models["date"] == pd.Timestamp("2022-07-04", tz="UTC")][0]
+    assert response.json()["predicted_next_day_return"] == expected
+    assert response.json()["date"].startswith("2022-07-04")
+
+    # A Saturday resolves to the previous Friday
+    response = client.post("/predict_risk", json={"ticker": "AAPL", "as_of": "2022-07-09"})
+    assert response.json()["date"].startswith("2022-07-08")
+    assert response.json()["risk_class"] == "Medium"
+
+def test_predict_range_streams_ndjson(history_models):
+    response = client.post("/predict_risk", json={"ticker": "AAPL", "start": "2022-01-01", "end": "2022-12-31"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    records = [json.loads(line) for line in response.text.splitlines()]
+    in_range = history_models[history_models["date"].dt.year == 2022]
+    assert len(records) == len(in_range)
+    assert records[0]["date"].startswith("2022-01-03") and records[-1]["date"].startswith("2022-12-30")
+
+    response = client.post("/predict_return", json={"ticker": "AAPL", "start": "2023-12-01"})
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert records[-1]["predicted_next_day_return"] == len(history_models) - 1
+
+    response = client.post("/predict_risk", json={"ticker": "AAPL", "as_of": "2022-01-01", "end": "2022-12-31"})
+    assert response.status_code == 400
@@ -0,0 +1,52 @@
+import pickle
+from ml.artifacts import ArtifactStore, write_version, read_version, migrate_legacy_version, compact, read_manifest
+from ml.registry import ModelRegistry
+
+def _setup(tmp_path):
+    models_dir = tmp_path / "models"
+    store = ArtifactStore(models_dir / "objects")
+    registry = ModelRegistry(models_dir / "registry.db", models_dir)
+    return models_dir, store, registry
+
+def test_unchanged_components_are_stored_once(tmp_path):
+    models_dir, store, _ = _setup(tmp_path)
+    features = ["return_lag1", "volatility_5d"] * 100
+    write_version(models_dir / "version_20240101_000000", {"features": features, "model": [1, 2, 3]}, store)
+    write_version(models_dir / "version_20240102_000000", {"features": features, "model": [4, 5, 6]}, store)
+
+    assert len(list(store.digests())) == 3
+    # Compressed blobs are smaller than the raw pickle
+    assert store.size_bytes() < 3 * len(pickle.dumps(features))
+    loaded = read_version(models_dir / "version_20240102_000000", store)
+    assert loaded == {"features": features, "model": [4, 5, 6]}
+
+def test_legacy_versions_are_migrated(tmp_path):
+    models_dir, store, _ = _setup(tmp_path)
+    legacy = models_dir / "version_20240101_000000"
+    legacy.mkdir(parents=True)
+    for name, obj in {"features": ["a", "b"], "risk_thresholds": {"low": 0.1, "high": 0.2}}.items():
+        with open(legacy / f"{name}.pkl", "wb") as f:
+            pickle.dump(obj, f)
+
+    before = read_version(legacy)
+    assert migrate_legacy_version(legacy, store)
+    assert not list(legacy.glob("*.pkl"))
+    assert read_version(legacy, store) == before
+    assert not migrate_legacy_version(legacy, store)
+
+def test_compact_keeps_recent_best_and_pinned(tmp_path):
+    models_dir, store, registry = _setup(tmp_path)
+    accuracies = [0.70, 0.50, 0.40, 0.45, 0.55]
+    for day, acc in enumerate(accuracies, start=1):
+        version = f"version_2024010{day}_000000"
+        write_version(models_dir / version, {"model": f"model-{day}", "features": ["a"]}, store)
+        registry.register_version(version, metrics={"classification": {"Accuracy": acc}})
+    registry.set_pinned("version_20240103_000000")
+
+    report = compact(models_dir, registry, store, keep_last=1, keep_best=1, metric="classification.Accuracy")
+    # Latest (05), best (01) and pinned (03) survive
+    assert report["removed_versions"] == ["version_20240102_000000", "version_20240104_000000"]
+    assert report["removed_blobs"] == 2
+    assert report["bytes_after"] < report["bytes_before"]
+    for version in ["version_20240101_000000", "version_20240103_000000", "version_20240105_000000"]:
+        assert all(store.exists(d) for d in read_manifest(models_dir / version).values())
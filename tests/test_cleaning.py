@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+from ml.cleaning import clean_ohlcv, clean_incremental
+from ml.feature_engineering import create_features
+
+def _bars(ticker="A", n_days=120, start="2024-01-01", seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start, periods=n_days, tz="UTC")
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n_days)))
+    return pd.DataFrame({
+        "ticker": ticker, "date": dates, "open": close, "high": close * 1.01,
+        "low": close * 0.99, "close": close, "volume": 1000.0,
+        "split_coefficient": 1.0, "dividend_amount": 0.0,
+    })
+
+def test_duplicates_gaps_and_bad_bars():
+    df = _bars(n_days=60)
+    df = pd.concat([df, df.iloc[[10]]]).drop(index=[20, 21])
+    df.loc[30, "close"] = -1.0
+    clean, report = clean_ohlcv(df)
+    assert report["duplicates_removed"] == 1
+    assert report["bad_bars"] == 1
+    assert len(clean) == 60
+    assert clean["date"].is_monotonic_increasing
+    filled = clean[clean["filled"]]
+    assert len(filled) == 3
+    # Filled bars carry the previous close with no volume
+    assert (filled["close"].to_numpy() == clean["close"].shift(1)[clean["filled"]].to_numpy()).all()
+    assert (filled["volume"] == 0).all()
+
+def test_filled_holiday_bars_stay_out_of_features():
+    raw = _bars(n_days=60)
+    holiday = raw["date"].iloc[40] # e.g. an exchange holiday: no bar from the provider
+    clean, _ = clean_ohlcv(raw.drop(index=40))
+    assert clean.loc[clean["date"] == holiday, "filled"].item()
+
+    features = create_features(clean, inference=True)
+    assert holiday not in set(features["date"])
+    after = features[features["date"] == raw["date"].iloc[41]].iloc[0]
+    # The return after the holiday spans both days, with no zero-return bar in between
+    assert after["return"] == pytest.approx(raw["close"].iloc[41] / raw["close"].iloc[39] - 1)
+
+def test_split_and_dividend_back_adjustment():
+    df = _bars(n_days=40)
+    df.loc[20:, ["open", "high", "low", "close"]] /= 2
+    df.loc[20, "split_coefficient"] = 2.0
+    df.loc[30, "dividend_amount"] = df.loc[29, "close"] * 0.01
+    clean, report = clean_ohlcv(df)
+    assert report["corporate_actions"] == 2
+    raw = _bars(n_days=40)["close"].to_numpy()
+    # Before the split: halved; before the dividend: also scaled by 0.99
+    np.testing.assert_allclose(clean["close"].iloc[:20], raw[:20] / 2 * 0.99)
+    np.testing.assert_allclose(clean["close"].iloc[20:30], raw[20:30] / 2 * 0.99)
+    np.testing.assert_allclose(clean["close"].iloc[30:], raw[30:] / 2)
+    np.testing.assert_allclose(clean["volume"].iloc[:20], 2000.0)
+    assert not clean["outlier"].any()
+
+def test_outliers_are_flagged_not_dropped():
+    df = _bars(n_days=100)
+    df.loc[80, ["open", "high", "low", "close"]] *= 1.5
+    clean, report = clean_ohlcv(df)
+    assert len(clean) == 100
+    assert clean["outlier"].iloc[80]
+    assert report["outliers"] >= 1
+
+def test_multiple_tickers_in_one_pass():
+    df = pd.concat([_bars("A", 50), _bars("B", 30, start="2024-02-01", seed=1)])
+    clean, _ = clean_ohlcv(df.sample(frac=1, random_state=0))
+    assert clean.groupby("ticker").size().to_dict() == {"A": 50, "B": 30}
+
+def test_incremental_matches_full_clean(tmp_path):
+    df = pd.concat([_bars("A", 200), _bars("B", 200, seed=1)], ignore_index=True)
+    df.loc[df.index[-5], "split_coefficient"] = 4.0
+    df.loc[df.index[-5]:, ["open", "high", "low", "close"]] /= 4
+    full, _ = clean_ohlcv(df)
+
+    clean_incremental(df[df["date"] < df["date"].iloc[150]], tmp_path)
+    clean, report = clean_incremental(df, tmp_path)
+    assert report == {"tickers_cleaned": 2, "tickers_cached": 0}
+    clean = clean.sort_values(["ticker", "date"]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(clean, full, check_dtype=False, rtol=1e-9)
+
+    # Nothing new: served from the cache
+    again, report = clean_incremental(df, tmp_path)
+    assert report == {"tickers_cleaned": 0, "tickers_cached": 2}
+    assert len(again) == len(full)
+
+def test_incremental_reuses_parsed_cache(tmp_path, monkeypatch):
+    df = _bars("A", 120)
+    first, _ = clean_incremental(df, tmp_path)
+    assert not list(tmp_path.glob("*.tmp"))
+
+    def no_read(*args, **kwargs):
+        raise AssertionError("cache re-read with no new bars")
+    monkeypatch.setattr(pd, "read_csv", no_read)
+    again, report = clean_incremental(df, tmp_path)
+    assert report == {"tickers_cleaned": 0, "tickers_cached": 1}
+    pd.testing.assert_frame_equal(again, first)
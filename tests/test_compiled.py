@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import GradientBoostingClassifier, GradientBoostingRegressor
+from ml.compiled import CompiledEnsemble, compile_models
+
+def _data(n_samples=300, seed=0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(size=(n_samples, 4)), columns=["a", "b", "c", "d"])
+    return X, rng
+
+def test_regressor_parity():
+    X, rng = _data()
+    y = X["a"] * 2 + np.sin(X["b"]) + rng.normal(0, 0.1, len(X))
+    model = GradientBoostingRegressor(n_estimators=50, max_depth=3, random_state=0).fit(X, y)
+
+    compiled = CompiledEnsemble(model)
+    np.testing.assert_allclose(compiled.predict(X), model.predict(X), rtol=1e-9, atol=1e-12)
+    # Single-row path
+    np.testing.assert_allclose(compiled.predict(X.iloc[[0]]), model.predict(X.iloc[[0]]))
+
+def test_multiclass_classifier_parity():
+    X, _ = _data()
+    y = np.digitize(X["a"] + X["c"], [-0.5, 0.5]) # 3 classes
+    model = GradientBoostingClassifier(n_estimators=40, max_depth=3, random_state=0).fit(X, y)
+
+    compiled = CompiledEnsemble(model)
+    np.testing.assert_allclose(compiled.predict_proba(X), model.predict_proba(X), rtol=1e-9, atol=1e-12)
+    assert (compiled.predict(X) == model.predict(X)).all()
+
+def test_binary_classifier_parity():
+    X, _ = _data()
+    y = np.where(X["b"] > 0, "High", "Low")
+    model = GradientBoostingClassifier(n_estimators=30, max_depth=2, random_state=0).fit(X, y)
+
+    compiled = compile_models({"classifier": model})["classifier_compiled"]
+    np.testing.assert_allclose(compiled.predict_proba(X), model.predict_proba(X), rtol=1e-9, atol=1e-12)
+    assert (compiled.predict(X) == model.predict(X)).all()
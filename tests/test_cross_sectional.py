@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+from ml.cross_sectional import add_cross_sectional_features
+
+def _panel(n_days=120, tickers=("A", "B", "C", "D"), seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2024-01-01", periods=n_days, tz="UTC")
+    frames = [
+        pd.DataFrame({"ticker": t, "date": dates, "return": rng.normal(0, 0.01 * (i + 1), n_days),
+                      "volatility_20d": 0.01 * (i + 1)})
+        for i, t in enumerate(tickers)
+    ]
+    # Rows arrive in arbitrary order and with a gap for one ticker
+    df = pd.concat(frames).sample(frac=1, random_state=0)
+    return df[~((df["ticker"] == "D") & (df["date"] == dates[50]))]
+
+def test_beta_and_corr_match_pandas():
+    df = _panel()
+    out = add_cross_sectional_features(df, window=40, market_ticker="A")
+    wide = df.pivot(index="date", columns="ticker", values="return")
+    for ticker in ["B", "D"]:
+        expected_beta = wide[ticker].rolling(40, min_periods=20).cov(wide["A"]) / \
+            wide["A"].where(wide[ticker].notna()).rolling(40, min_periods=20).var()
+        expected_corr = wide[ticker].rolling(40, min_periods=20).corr(wide["A"])
+        got = out[out["ticker"] == ticker].set_index("date").sort_index()
+        np.testing.assert_allclose(got["beta_market"], expected_beta.loc[got.index], atol=1e-10)
+        np.testing.assert_allclose(got["corr_market"], expected_corr.loc[got.index], atol=1e-10)
+
+def test_rank_and_sector_relative_vol():
+    df = _panel()
+    sectors = pd.Series({"A": "Tech", "B": "Tech", "C": "Energy", "D": "Energy"})
+    out = add_cross_sectional_features(df, sectors=sectors)
+    assert len(out) == len(df) and (out.index == df.index).all()
+
+    day = out[out["date"] == out["date"].max()].set_index("ticker")
+    expected_rank = day["return"].rank(pct=True)
+    pd.testing.assert_series_equal(day["xs_return_rank"], expected_rank, check_names=False)
+    # Tech median vol is 0.015, Energy median 0.035
+    assert day.loc["A", "sector_rel_vol"] == pytest.approx(0.01 / 0.015)
+    assert day.loc["D", "sector_rel_vol"] == pytest.approx(0.04 / 0.035)
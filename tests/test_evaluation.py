@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score, accuracy_score, f1_score, precision_score, recall_score
+from ml.evaluation import evaluate_models, JsonMetricsSink
+from ml.feature_store import FeatureStore
+
+class _Regressor:
+    def predict(self, X):
+        return X["f1"].to_numpy() * 0.5
+
+class _Classifier:
+    def predict(self, X):
+        return (X["f1"].to_numpy() > 0).astype(int) + (X["f1"].to_numpy() > 1).astype(int)
+
+MODELS = {"regressor": _Regressor(), "classifier": _Classifier(), "features": ["f1"]}
+
+def _frame(n=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "ticker": rng.choice(["AAA", "BBB", "CCC"], n),
+        "date": pd.date_range("2023-01-01", periods=n, freq="D", tz="UTC"),
+        "f1": rng.normal(0, 1, n),
+        "target_return_next_day": rng.normal(0, 1, n),
+        "risk_class": rng.integers(0, 3, n).astype(float),
+    })
+
+def test_streaming_metrics_match_sklearn():
+    df = _frame()
+    metrics = evaluate_models(MODELS, df, chunk_rows=77, n_jobs=3)
+
+    reg_pred = MODELS["regressor"].predict(df)
+    clf_pred = MODELS["classifier"].predict(df)
+    y_clf = df["risk_class"].astype(int)
+    assert metrics["regression"]["RMSE"] == pytest.approx(np.sqrt(mean_squared_error(df["target_return_next_day"], reg_pred)))
+    assert metrics["regression"]["MAE"] == pytest.approx(mean_absolute_error(df["target_return_next_day"], reg_pred))
+    assert metrics["regression"]["R2"] == pytest.approx(r2_score(df["target_return_next_day"], reg_pred))
+    assert metrics["classification"]["Accuracy"] == pytest.approx(accuracy_score(y_clf, clf_pred))
+    assert metrics["classification"]["F1"] == pytest.approx(f1_score(y_clf, clf_pred, average="weighted"))
+    assert metrics["classification"]["Precision"] == pytest.approx(precision_score(y_clf, clf_pred, average="weighted", zero_division=0))
+    assert metrics["classification"]["Recall"] == pytest.approx(recall_score(y_clf, clf_pred, average="weighted", zero_division=0))
+
+    # Breakdowns
+    assert set(metrics["by_ticker"]) == {"AAA", "BBB", "CCC"}
+    assert sum(g["n_rows"] for g in metrics["by_ticker"].values()) == len(df)
+    aaa = df[df["ticker"] == "AAA"]
+    assert metrics["by_ticker"]["AAA"]["regression"]["MAE"] == pytest.approx(
+        mean_absolute_error(aaa["target_return_next_day"], MODELS["regressor"].predict(aaa)))
+    assert "2023-01" in metrics["by_period"]
+
+def test_feature_store_matches_dataframe(tmp_path):
+    df = _frame()
+    store = FeatureStore(tmp_path / "test")
+    store.write_partition("shard_00000", df.iloc[:400])
+    store.write_partition("shard_00001", df.iloc[400:])
+
+    from_store = evaluate_models(MODELS, store, chunk_rows=128)
+    from_frame = evaluate_models(MODELS, df)
+    assert from_store["regression"]["RMSE"] == pytest.approx(from_frame["regression"]["RMSE"])
+    for ticker, group in from_frame["by_ticker"].items():
+        assert from_store["by_ticker"][ticker]["n_rows"] == group["n_rows"]
+        assert from_store["by_ticker"][ticker]["regression"]["R2"] == pytest.approx(group["regression"]["R2"])
+        assert from_store["by_ticker"][ticker]["classification"] == pytest.approx(group["classification"])
+
+def test_sink_is_explicit(tmp_path):
+    sink = JsonMetricsSink(tmp_path)
+    evaluate_models(MODELS, _frame(50))
+    assert not list(tmp_path.iterdir())
+
+    evaluate_models(MODELS, _frame(50), sink=sink)
+    assert sink.last_path.exists()
@@ -0,0 +1,70 @@
+import io
+from unittest.mock import MagicMock
+import numpy as np
+import pandas as pd
+import pytest
+from app.dependencies import get_models
+from app.main import app
+from ml.export import coalesce, export_schema, iter_encoded
+from ml.models import FEATURES
+from tests.test_api import client
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.parquet as pq
+
+def _bars(ticker, n=80, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    return pd.DataFrame({"ticker": ticker, "date": pd.bdate_range("2024-01-01", periods=n, tz="UTC"),
+                         "open": close, "high": close, "low": close, "close": close, "volume": 1.0})
+
+@pytest.fixture
+def export_models(mocker):
+    history = {"AAA": _bars("AAA"), "BBB": _bars("BBB", seed=1)}
+    mocker.patch("app.services.fetch_stock_data", side_effect=lambda tickers, **_: history.get(tickers[0], pd.DataFrame()))
+    models = {"regressor": MagicMock(), "classifier": MagicMock(), "features": list(FEATURES)}
+    models["regressor"].predict.side_effect = lambda X: np.full(len(X), 0.01)
+    models["classifier"].predict_proba.side_effect = lambda X: np.tile([0.1, 0.2, 0.7], (len(X), 1))
+    app.dependency_overrides[get_models] = lambda: models
+    yield models
+    app.dependency_overrides = {}
+
+def test_arrow_stream_export(export_models):
+    response = client.post("/export", json={"tickers": ["AAA", "BBB", "NONE"], "start": "2024-02-01", "end": "2024-03-29"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    table = pa.ipc.open_stream(response.content).read_all()
+    df = table.to_pandas()
+    assert sorted(df["ticker"].unique()) == ["AAA", "BBB"]
+    assert df["date"].min() >= pd.Timestamp("2024-02-01", tz="UTC") and df["date"].max() <= pd.Timestamp("2024-03-29", tz="UTC")
+    assert set(FEATURES) <= set(df.columns)
+    assert (df["risk_class"] == "High").all() and np.allclose(df["prob_high"], 0.7)
+    assert len(df) == 2 * len(pd.bdate_range("2024-02-01", "2024-03-29"))
+
+def test_parquet_export_without_predictions(export_models):
+    response = client.post("/export", json={"tickers": ["AAA"], "format": "parquet", "predictions": False})
+    table = pq.read_table(io.BytesIO(response.content))
+    assert "predicted_return" not in table.column_names and table.num_rows == 80 - 21 + 1
+    assert client.post("/export", json={"format": "csv"}).status_code == 400
+
+def test_export_is_admitted_through_the_miss_lane_and_capped(export_models, monkeypatch):
+    from app.admission import controller
+    admitted = controller.stats()["miss"]["admitted"]
+    assert client.post("/export", json={"tickers": ["AAA"]}).status_code == 200
+    assert controller.stats()["miss"]["admitted"] == admitted + 1
+    assert controller.stats()["miss"]["active"] == 0 # released once the file was sent
+    monkeypatch.setattr("app.main.EXPORT_MAX_TICKERS", 2)
+    assert client.post("/export", json={"tickers": ["AAA", "BBB", "CCC"]}).status_code == 400
+
+def test_export_defaults_to_the_configured_universe(export_models, monkeypatch):
+    monkeypatch.setattr("ml.universe.load_universe", lambda path=None: pd.DataFrame({"ticker": ["BBB"], "sector": ["Tech"]}))
+    df = pa.ipc.open_stream(client.post("/export", json={}).content).read_all().to_pandas()
+    assert df["ticker"].unique().tolist() == ["BBB"]
+
+def test_encoding_is_batched():
+    frames = [pd.DataFrame({"ticker": "A", "date": pd.date_range("2024-01-01", periods=10, tz="UTC"), "f1": 1.0})] * 5
+    batches = list(coalesce(frames, rows=20))
+    assert [len(b) for b in batches] == [20, 20, 10]
+    parts = list(iter_encoded(iter(batches), export_schema(["f1"], predictions=False), "arrow"))
+    assert len(parts) >= 3 # bytes leave after every batch, not at the end
+    assert [b.num_rows for b in pa.ipc.open_stream(b"".join(parts))] == [20, 20, 10]
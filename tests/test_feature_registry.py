@@ -0,0 +1,61 @@
+from unittest.mock import MagicMock
+import numpy as np
+import pandas as pd
+import pytest
+import app.services
+from app.services import PredictionService
+from ml.feature_engineering import create_features
+from ml.feature_registry import ALL_FEATURES, feature_plan, required_history, history_tail
+from ml.models import FEATURES
+
+def _bars(tickers=("A", "B"), n=300):
+    rng = np.random.default_rng(0)
+    frames = []
+    for t in tickers:
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+        frames.append(pd.DataFrame({"ticker": t, "date": pd.bdate_range("2023-01-02", periods=n, tz="UTC"),
+                                    "open": close, "high": close, "low": close, "close": close, "volume": 1.0}))
+    return pd.concat(frames, ignore_index=True)
+
+def test_plan_is_deduplicated_and_minimal():
+    plan = [spec.name for spec in feature_plan(FEATURES)]
+    assert plan.count("return") == 1 and plan.index("return") < plan.index("return_lag1")
+    assert plan.index("ma_20d") < plan.index("price_vs_ma20")
+    assert not {"rsi_14", "macd", "ma_5d"} & set(plan)
+    with pytest.raises(KeyError):
+        feature_plan(["sentiment"])
+
+def test_required_history():
+    assert required_history(["return_lag5"]) == 7
+    assert required_history(FEATURES) == 21 # volatility_20d: 20 returns from 21 closes
+    assert required_history(["macd"]) is None # EWMs need the whole history
+
+def test_tail_matches_full_history():
+    df = _bars()
+    full = create_features(df, inference=True).groupby("ticker").tail(3)
+    tail = history_tail(df, FEATURES, rows=3)
+    assert len(tail) == 2 * 23
+    partial = create_features(tail, inference=True, features=FEATURES)
+    assert len(partial) == 6 and "rsi_14" not in partial.columns
+    np.testing.assert_allclose(partial[FEATURES].to_numpy(), full[FEATURES].to_numpy(), rtol=1e-9, atol=1e-12)
+
+def test_feature_lists_are_compared_by_value():
+    df = _bars()
+    # A copy of the full list is the default plan, not a subset that needs every feature (the MACD warm-up)
+    pd.testing.assert_frame_equal(create_features(df, inference=True, features=list(ALL_FEATURES)),
+                                  create_features(df, inference=True))
+    # Training rows are cut on the warm-up columns even when the subset does not list them
+    labelled = create_features(df, features=["rsi_14"])
+    assert labelled[["return_lag5", "volatility_20d"]].notna().all().all()
+    assert "risk_class" in labelled.columns
+
+def test_service_featurizes_only_the_tail(mocker):
+    df = _bars(("A",))
+    mocker.patch("app.services.fetch_stock_data", return_value=df)
+    compute = mocker.spy(app.services, "create_features")
+    service = PredictionService({"regressor": MagicMock(), "classifier": MagicMock(), "features": list(FEATURES)})
+
+    latest = service._get_latest_features("A")
+    assert len(compute.call_args.args[0]) == 21
+    expected = create_features(df, inference=True).iloc[[-1]][FEATURES]
+    np.testing.assert_allclose(latest.to_numpy(), expected.to_numpy(), rtol=1e-9)
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+from ml.feature_store import FeatureStore
+
+def _frame(n, offset=0):
+    return pd.DataFrame({
+        "ticker": ["ABC"] * n,
+        "date": pd.date_range("2023-01-01", periods=n, tz="UTC"),
+        "x": np.arange(offset, offset + n, dtype=float),
+        "y": np.arange(offset, offset + n) % 3,
+    })
+
+def test_partition_roundtrip(tmp_path):
+    store = FeatureStore(tmp_path)
+    df = _frame(10)
+    store.write_partition("shard_00000", df)
+
+    out = store.read_partition("shard_00000")
+    assert out["ticker"].tolist() == df["ticker"].tolist()
+    assert (out["date"] == df["date"]).all()
+    assert isinstance(store.column("shard_00000", "x"), np.memmap)
+    assert store.num_rows() == 10
+
+def test_iter_batches_fixed_size_across_partitions(tmp_path):
+    store = FeatureStore(tmp_path)
+    store.write_partition("shard_00000", _frame(7))
+    store.write_partition("shard_00001", _frame(6, offset=7))
+
+    batches = list(store.iter_batches(["x", "y"], batch_size=5))
+    assert [len(b) for b in batches] == [5, 5, 3]
+    assert np.concatenate(batches)[:, 0].tolist() == list(range(13))
+
+def test_batch_size_respects_budget(tmp_path):
+    store = FeatureStore(tmp_path)
+    rows = store.batch_size_for(n_columns=8, memory_budget_mb=1)
+    assert rows * 8 * 8 <= 1024 * 1024
+
+def test_quantiles_match_pandas(tmp_path):
+    store = FeatureStore(tmp_path)
+    rng = np.random.default_rng(0)
+    values = []
+    for i in range(3):
+        v = rng.lognormal(size=2000)
+        v[::17] = np.nan
+        values.append(v)
+        store.write_partition(f"shard_{i:05d}", pd.DataFrame({"future_vol": v}))
+
+    expected = pd.Series(np.concatenate(values)).quantile([0.33, 0.66]).tolist()
+    # Tiny budget forces the multi-pass histogram selection
+    assert store.quantiles("future_vol", [0.33, 0.66], memory_budget_mb=0.01) == expected
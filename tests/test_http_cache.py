@@ -0,0 +1,58 @@
+from unittest.mock import MagicMock
+import pandas as pd
+import app.services
+from app.dependencies import get_registry
+from app.main import app as api
+from tests.test_api import client, mock_fetch
+
+def _last_bar(mocker, date="2024-03-01"):
+    return mocker.patch("app.http_cache.cached_last_bar", return_value=pd.Timestamp(date, tz="UTC"))
+
+def test_unchanged_prediction_is_revalidated_without_work(mock_fetch, mocker):
+    _last_bar(mocker)
+    first = client.post("/predict_risk", json={"ticker": "AAPL"})
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert "max-age" in first.headers["Cache-Control"]
+    assert first.headers["Last-Modified"].endswith("GMT")
+
+    app.services.fetch_stock_data.reset_mock()
+    second = client.post("/predict_risk", json={"ticker": "AAPL"}, headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.headers["ETag"] == etag
+    assert not second.content
+    app.services.fetch_stock_data.assert_not_called()
+
+    # Other parameters or a new bar are different representations
+    other = client.post("/predict_risk", json={"ticker": "MSFT"}, headers={"If-None-Match": etag})
+    assert other.status_code == 200 and other.headers["ETag"] != etag
+    _last_bar(mocker, "2024-03-04")
+    assert client.post("/predict_risk", json={"ticker": "AAPL"}, headers={"If-None-Match": etag}).status_code == 200
+
+def test_if_modified_since_and_uncached_tickers(mock_fetch, mocker):
+    _last_bar(mocker)
+    first = client.get("/recommend_similar", params={"ticker": "AAPL"})
+    since = first.headers["Last-Modified"]
+    assert client.get("/recommend_similar", params={"ticker": "AAPL"},
+                      headers={"If-Modified-Since": since}).status_code == 304
+
+    # No fresh cache: the request would fetch, so no validators are offered
+    _last_bar(mocker).return_value = None
+    response = client.post("/predict_return", json={"ticker": "AAPL"})
+    assert response.status_code == 200 and "ETag" not in response.headers
+
+def test_metrics_etag(mocker):
+    registry = MagicMock()
+    registry.latest_version.return_value = {"version": "version_20240301_120000", "created_at": "2024-03-01T12:00:00"}
+    registry.latest_metrics.return_value = {"regression": {"RMSE": 0.01}}
+    api.dependency_overrides[get_registry] = lambda: registry
+    experiments = mocker.patch("app.http_cache.EXPERIMENTS_DIR")
+
+    first = client.get("/metrics")
+    assert first.status_code == 200
+    assert first.headers["Last-Modified"] == "Fri, 01 Mar 2024 12:00:00 GMT"
+    assert client.get("/metrics", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+    registry.latest_version.return_value = {"version": "version_20240302_120000", "created_at": "2024-03-02T12:00:00"}
+    assert client.get("/metrics", headers={"If-None-Match": first.headers["ETag"]}).status_code == 200
+    assert not experiments.glob.called # legacy metrics files are only listed without a registry report
+    api.dependency_overrides = {}
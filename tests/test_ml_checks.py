@@ -1,8 +1,10 @@
+import json
 import pytest
 import pandas as pd
 import numpy as np
-from ml.models import train_models
-from ml.drift import check_data_integrity
+from ml.models import (train_models, train_horizon_models, update_models, choose_training_mode, fit_clustering,
+                       new_rows_mask, FEATURES)
+from ml.drift import check_data_integrity, run_drift_suite
 
 def test_data_integrity_check():
     df = pd.DataFrame({
@@ -47,3 +49,168 @@ def test_minimal_training_performance():
     assert acc > 0.7 # Should learn the simple rule easily
 
 
+
+def test_horizon_models_share_features():
+    np.random.seed(0)
+    n_samples = 200
+    df = pd.DataFrame({
+        name: np.random.normal(0, 0.01, n_samples)
+        for name in ["return_lag1", "return_lag2", "return_lag3", "return_lag5", "price_vs_ma20"]
+    })
+    df["volatility_5d"] = np.abs(np.random.normal(0.01, 0.005, n_samples))
+    df["volatility_20d"] = np.abs(np.random.normal(0.02, 0.005, n_samples))
+    for h in [1, 5, 20]:
+        df[f"target_return_{h}d"] = h * df["return_lag1"]
+        df[f"risk_class_{h}d"] = (df["volatility_20d"] > 0.02).astype(float)
+        df.loc[df.index[-h:], [f"target_return_{h}d", f"risk_class_{h}d"]] = np.nan
+
+    horizon_models = train_horizon_models(df, horizons=[1, 5, 20], n_jobs=2)
+    assert sorted(horizon_models) == [1, 5, 20]
+    X = df[FEATURES].iloc[:-20]
+    for h, pair in horizon_models.items():
+        assert pair["classifier"].score(X, df[f"risk_class_{h}d"].iloc[:-20].astype(int)) > 0.7
+        assert pair["regressor"].n_features_in_ == len(FEATURES)
+
+    # A regressor already fitted on the next-day target serves the 1-day horizon as is
+    shared = train_horizon_models(df, horizons=[1, 5], n_jobs=2, regressor=horizon_models[1]["regressor"])
+    assert shared[1]["regressor"] is horizon_models[1]["regressor"]
+    assert shared[5]["regressor"] is not horizon_models[5]["regressor"]
+
+def test_clustering_picks_k_over_chunks(monkeypatch):
+    # Four well separated behaviour regimes in feature space
+    rng = np.random.default_rng(0)
+    centers = rng.normal(0, 1, (4, len(FEATURES)))
+    X = pd.DataFrame(np.repeat(centers, 500, axis=0) + rng.normal(0, 0.05, (2000, len(FEATURES))), columns=FEATURES)
+    monkeypatch.setattr("ml.models.CLUSTER_CHUNK_ROWS", 300)
+
+    pca, kmeans, selection = fit_clustering(X, n_jobs=2)
+    assert pca.n_samples_seen_ == 2000 # partial_fit over seven chunks
+    assert selection["k"] == 4 and kmeans.n_clusters == 4
+    assert sorted(selection["silhouette"]) == list(range(2, 9))
+    labels = kmeans.predict(pca.transform(X))
+    assert all(len(np.unique(labels[i:i + 500])) == 1 for i in range(0, 2000, 500))
+
+    monkeypatch.setattr("ml.models.CLUSTERS_K_AUTO", False)
+    assert fit_clustering(X)[1].n_clusters == 3
+
+def _split_frames(shift=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for split, start, n, loc in [("train", "2022-01-03", 300, 0.0), ("test", "2023-03-06", 90, shift)]:
+        dates = pd.bdate_range(start, periods=n)
+        frame = pd.concat([
+            pd.DataFrame({"ticker": t, "date": dates, "return_lag1": rng.normal(loc, 0.01, n),
+                          "volatility_20d": np.abs(rng.normal(0.02, 0.005, n)),
+                          "target_return_next_day": rng.normal(0, 0.01, n),
+                          "risk_class": rng.integers(0, 3, n).astype(float)})
+            for t in ["AAA", "BBB"]
+        ], ignore_index=True)
+        frames.append(frame)
+    return frames
+
+def test_drift_suite_passes_on_same_distribution():
+    train, test = _split_frames()
+    report = run_drift_suite(train, test, features=["return_lag1", "volatility_20d"])
+    assert report["passed"], report["failures"]
+    assert report["features"]["return_lag1"]["psi"] < 0.1
+    assert report["integrity"]["train"]["rows_per_ticker"] == {"AAA": 300, "BBB": 300}
+    json.dumps(report) # saved with the model version
+
+def test_drift_suite_flags_shift_gaps_and_duplicates():
+    train, test = _split_frames(shift=0.02)
+    test = pd.concat([test, test.iloc[[0]]], ignore_index=True) # duplicate AAA bar
+    test = test[~test["date"].between("2023-04-03", "2023-04-14") | (test["ticker"] != "BBB")] # BBB gap
+    report = run_drift_suite(train, test, features=["return_lag1", "volatility_20d"])
+
+    assert not report["passed"]
+    assert report["features"]["return_lag1"]["drift_detected"]
+    assert not report["features"]["volatility_20d"]["drift_detected"]
+    assert report["integrity"]["test"]["duplicate_dates"] == {"AAA": 1}
+    assert report["integrity"]["test"]["gap_tickers"] == ["BBB"]
+
+def _training_frame(n_days, start="2022-01-03", shift=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start, periods=n_days)
+    df = pd.concat([pd.DataFrame({"ticker": t, "date": dates}) for t in ["AAA", "BBB"]], ignore_index=True)
+    n = len(df)
+    for name in ["return_lag1", "return_lag2", "return_lag3", "return_lag5", "price_vs_ma20"]:
+        df[name] = rng.normal(shift, 0.01, n)
+    df["volatility_5d"] = np.abs(rng.normal(0.01, 0.005, n))
+    df["volatility_20d"] = np.abs(rng.normal(0.02, 0.005, n))
+    df["target_return_next_day"] = 0.5 * df["return_lag1"] + rng.normal(0, 0.005, n)
+    df["risk_class"] = (df["volatility_20d"] > 0.02).astype(int)
+    return df.sort_values(["ticker", "date"], ignore_index=True)
+
+def test_incremental_update_extends_previous_models(monkeypatch):
+    monkeypatch.setattr("ml.models.INCREMENTAL_MIN_NEW_ROWS", 10)
+    history = _training_frame(300)
+    previous = train_models(history)
+    previous["risk_thresholds"] = {"low": 0.01, "high": 0.02}
+    assert previous["training_info"]["mode"] == "full"
+
+    df = pd.concat([history, _training_frame(10, start="2023-02-27", seed=1)], ignore_index=True)
+    mode, reason = choose_training_mode(previous, df)
+    assert mode == "incremental", reason
+
+    n_stages = previous["regressor"].n_estimators_
+    updated = update_models(previous, df, extra_estimators=5, parent_version="version_1")
+    assert updated["regressor"].n_estimators_ == n_stages + 5
+    assert previous["regressor"].n_estimators_ == n_stages # previous set untouched
+    assert updated["pca"].n_samples_seen_ == len(df)
+    assert updated["kmeans"].cluster_centers_.shape == previous["kmeans"].cluster_centers_.shape
+    assert updated["training_info"]["mode"] == "incremental"
+    assert updated["training_info"]["parent_version"] == "version_1"
+    assert updated["training_info"]["trained_through"] == pd.Timestamp("2023-03-10").isoformat()
+    acc = updated["classifier"].score(df[FEATURES], df["risk_class"])
+    assert acc > 0.7
+
+    assert choose_training_mode(updated, df)[0] == "skip"
+
+def test_incremental_update_falls_back_on_drift(monkeypatch):
+    monkeypatch.setattr("ml.models.INCREMENTAL_MIN_NEW_ROWS", 10)
+    history = _training_frame(300)
+    previous = train_models(history)
+    previous["risk_thresholds"] = {"low": 0.01, "high": 0.02}
+    df = pd.concat([history, _training_frame(20, start="2023-02-27", shift=0.05, seed=1)], ignore_index=True)
+    mode, reason = choose_training_mode(previous, df)
+    assert mode == "full" and "drift" in reason
+    assert choose_training_mode(previous, df, mode="full")[0] == "full"
+    assert choose_training_mode(None, df)[0] == "full"
+
+def test_incremental_update_needs_enough_rows_and_the_same_tickers(monkeypatch):
+    history = _training_frame(300)
+    previous = train_models(history)
+    previous["risk_thresholds"] = {"low": 0.01, "high": 0.02}
+    df = pd.concat([history, _training_frame(10, start="2023-02-27", seed=1)], ignore_index=True)
+    mode, reason = choose_training_mode(previous, df)
+    assert mode == "full" and "INCREMENTAL_MIN_NEW_ROWS" in reason
+
+    # A ticker added to the universe has only rows older than the watermark
+    monkeypatch.setattr("ml.models.INCREMENTAL_MIN_NEW_ROWS", 10)
+    added = _training_frame(310, seed=2).query("ticker == 'AAA'").assign(ticker="CCC")
+    mode, reason = choose_training_mode(previous, pd.concat([df, added], ignore_index=True))
+    assert mode == "full" and reason == "ticker set changed"
+
+def test_incremental_update_picks_up_rows_labelled_later(monkeypatch):
+    monkeypatch.setattr("ml.models.HORIZONS", [5])
+    monkeypatch.setattr("ml.models.INCREMENTAL_MIN_NEW_ROWS", 10)
+
+    def labelled(df):
+        # The 5-day label of a ticker's last 5 rows is not known yet
+        df["target_return_5d"] = df["target_return_next_day"] * 2
+        df["risk_class_5d"] = df["risk_class"]
+        last = df.groupby("ticker").cumcount(ascending=False) < 5
+        df.loc[last, ["target_return_5d", "risk_class_5d"]] = np.nan
+        return df
+
+    frame = _training_frame(310)
+    previous = train_models(labelled(frame.groupby("ticker").head(300).reset_index(drop=True)))
+    previous["risk_thresholds"] = {"low": 0.01, "high": 0.02}
+    df = labelled(frame)
+
+    # 5 rows per ticker labelled since the last run plus 5 of the new ones
+    assert new_rows_mask(previous, df, horizon=5).sum() == 20
+    n_stages = previous["horizon_models"][5]["regressor"].n_estimators_
+    updated = update_models(previous, df, extra_estimators=3)
+    assert updated["horizon_models"][5]["regressor"].n_estimators_ == n_stages + 3
+    assert updated["training_info"]["horizons_trained_through"]["5"]["AAA"] == df["date"].iloc[304].isoformat()
@@ -0,0 +1,67 @@
+import json
+from unittest.mock import MagicMock
+import pandas as pd
+import pytest
+from app.model_pool import ModelPool
+
+def _models(proba, ret):
+    models = {"regressor": MagicMock(), "classifier": MagicMock(), "features": ["f1"]}
+    models["regressor"].predict.return_value = [ret]
+    models["classifier"].predict_proba.return_value = [proba]
+    return models
+
+@pytest.fixture
+def features(mocker):
+    rows = pd.DataFrame([{"f1": 1.0, "return_lag1": 0.01, "volatility_20d": 0.02}])
+    return mocker.patch("app.services.PredictionService._get_latest_features", return_value=rows)
+
+def test_shadow_scores_shared_features_off_the_response_path(tmp_path, features):
+    primary, shadow = _models([0.8, 0.1, 0.1], 0.01), _models([0.5, 0.3, 0.2], 0.03)
+    pool = ModelPool(primary, "v1", shadows={"v2": shadow}, log_path=tmp_path / "shadow.jsonl")
+
+    result = pool.predict_risk("AAPL")
+    assert result["risk_class"] == "Low" # served by the primary
+    pred, date = pool.predict_return("AAPL")
+    assert pred == 0.01 and date is None
+    pool._executor.shutdown(wait=True)
+
+    assert features.call_count == 2 # once per request, not per version
+    records = {r["endpoint"]: r for r in map(json.loads, open(tmp_path / "shadow.jsonl"))}
+    assert sorted(records) == ["predict_return", "predict_risk"]
+    assert records["predict_risk"]["version"] == "v2" and records["predict_risk"]["served_version"] == "v1"
+    assert records["predict_risk"]["delta"] == pytest.approx(0.3)
+    assert records["predict_return"]["delta"] == pytest.approx(0.02)
+
+    summary = pool.summary()
+    assert summary["v1"]["served"] == 2
+    assert summary["v2"]["shadow_scored"] == 2 and summary["v2"]["served"] == 0
+    assert summary["v2"]["delta_max"] == pytest.approx(0.3)
+
+def test_canary_routing_is_sticky_and_split(tmp_path, features):
+    pool = ModelPool(_models([1, 0, 0], 0.0), "v1", canaries={"v2": (_models([0, 1, 0], 0.0), 0.25)},
+                     log_path=tmp_path / "shadow.jsonl")
+    tickers = [f"T{i}" for i in range(2000)]
+    routed = [pool.route(t) for t in tickers]
+    assert routed == [pool.route(t) for t in tickers]
+    assert 0.2 < routed.count("v2") / len(tickers) < 0.3
+
+    canary_ticker = tickers[routed.index("v2")]
+    assert pool.predict_risk(canary_ticker)["risk_class"] == "Medium"
+    pool._executor.shutdown(wait=True)
+    assert pool.summary()["v2"]["served"] == 1
+    assert pool.summary()["v1"]["shadow_scored"] == 1 # the primary shadows canary traffic
+
+def test_primary_only_pool_has_no_background_work(features):
+    pool = ModelPool(_models([1, 0, 0], 0.0))
+    assert not pool.active
+    assert pool.observe("predict_risk", "AAPL", "primary", None, None, 0.0) is None
+    with pytest.raises(ValueError):
+        ModelPool(_models([1, 0, 0], 0.0), canaries={"v2": (_models([1, 0, 0], 0.0), 1.5)})
+
+def test_canary_versions_are_validated():
+    from ml.config import _parse_canaries
+    assert _parse_canaries("version_a:0.1, version_b:1") == {"version_a": 0.1, "version_b": 1.0}
+    assert _parse_canaries("") == {}
+    for bad in ["version_x", "version_x:", "version_x:abc", "version_x:1.5", ":0.1"]:
+        with pytest.raises(ValueError, match="CANARY_VERSIONS"):
+            _parse_canaries(bad)
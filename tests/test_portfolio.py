@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+from ml.portfolio import EwmaCovariance, returns_matrix, portfolio_risk
+
+def _returns(n_days=120, tickers=("A", "B", "C"), seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2024-01-01", periods=n_days)
+    return pd.DataFrame(rng.normal(0, 0.02, (n_days, len(tickers))), index=dates, columns=list(tickers))
+
+def _expected(returns, decay=0.94):
+    values = returns.fillna(0).to_numpy()
+    w = (1 - decay) * decay ** np.arange(len(values) - 1, -1, -1)
+    return (values * w[:, None]).T @ values / w.sum()
+
+def test_incremental_updates_match_full_computation():
+    returns = _returns()
+    cov = EwmaCovariance(0.94)
+    for end in [60, 61, 90, 120]:
+        cov.update(returns.iloc[:end])
+    np.testing.assert_allclose(cov.covariance(), _expected(returns))
+    # Re-sending already seen days does not double count them
+    cov.update(returns)
+    np.testing.assert_allclose(cov.covariance(), _expected(returns))
+
+def test_new_tickers_use_retained_history():
+    returns = _returns(tickers=("A", "B", "C", "D"))
+    cov = EwmaCovariance(0.94)
+    cov.update(returns.iloc[:100][["A", "B"]])
+    cov.update(returns[["C", "B", "A", "D"]])
+    np.testing.assert_allclose(cov.covariance(["A", "B", "C", "D"]), _expected(returns), rtol=1e-6)
+
+def test_updates_with_different_ticker_sets():
+    returns = _returns(n_days=250)
+    cov = EwmaCovariance(0.94)
+    cov.update(returns.iloc[:200][["A", "B"]])
+    cov.update(returns[["C"]]) # moves the dates on without A and B
+    cov.update(returns[["A", "B"]]) # their days 200..250 are still applied
+    np.testing.assert_allclose(cov.covariance(["A", "B", "C"]), _expected(returns), rtol=1e-6)
+    assert cov.start_dates(["A", "C", "D"]) == {"A": returns.index[-1], "C": returns.index[-1], "D": returns.index[0]}
+
+def test_portfolio_risk_contributions():
+    cov = np.array([[0.04, 0.01], [0.01, 0.09]])
+    risk = portfolio_risk(cov, [0.5, 0.5], {"low": 0.1, "high": 0.2})
+    assert risk["volatility"] == pytest.approx(np.sqrt(0.0375))
+    assert risk["contributions"].sum() == pytest.approx(risk["volatility"])
+    assert risk["risk_class"] == 1
+
+def test_returns_matrix():
+    df = pd.DataFrame({
+        "ticker": ["A", "A", "A", "B", "B", "B"],
+        "date": list(pd.bdate_range("2024-01-01", periods=3)) * 2,
+        "close": [100.0, 110.0, 99.0, 50.0, 50.0, 55.0]
+    })
+    returns = returns_matrix(df)
+    np.testing.assert_allclose(returns.to_numpy(), [[0.1, 0.0], [-0.1, 0.1]])
@@ -0,0 +1,48 @@
+import pstats
+import pytest
+from app.profiling import profiler
+from tests.test_api import client, mock_fetch
+
+ADMIN = {"X-Admin-Token": "secret"}
+
+@pytest.fixture
+def admin(monkeypatch, tmp_path):
+    monkeypatch.setattr("app.profiling.ADMIN_TOKEN", "secret")
+    monkeypatch.setattr("app.profiling.PROFILE_DIR", tmp_path)
+    yield tmp_path
+    profiler.stop()
+
+def test_admin_endpoints_need_a_configured_token(monkeypatch):
+    monkeypatch.setattr("app.profiling.ADMIN_TOKEN", None)
+    assert client.post("/admin/profile", json={}, headers=ADMIN).status_code == 404
+    monkeypatch.setattr("app.profiling.ADMIN_TOKEN", "secret")
+    assert client.post("/admin/profile", json={}, headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.get("/admin/profile").status_code == 403
+    assert profiler.session is None
+
+def test_cpu_profile_of_the_next_requests(admin, mock_fetch):
+    started = client.post("/admin/profile", json={"mode": "cpu", "requests": 2}, headers=ADMIN)
+    assert started.status_code == 200
+    assert client.post("/admin/profile", json={"mode": "cpu"}, headers=ADMIN).status_code == 409
+
+    assert client.post("/predict_risk", json={"ticker": "AAPL"}).status_code == 200
+    assert client.post("/predict_return", json={"ticker": "AAPL"}).status_code == 200
+    assert profiler.session is None # ended after two requests
+
+    report = client.get("/admin/profile", headers=ADMIN).json()["last_report"]
+    assert report["requests"] == 2
+    functions = " ".join(row["function"] for row in report["top"])
+    assert "predict_risk" in functions and "predict_return" in functions
+    stats = pstats.Stats(report["files"][0])
+    assert any(name == "_get_latest_features" for _, _, name in stats.stats)
+
+def test_memory_profile_stopped_early(admin, mock_fetch):
+    client.post("/admin/profile", json={"mode": "memory", "requests": 50, "seconds": 60}, headers=ADMIN)
+    assert client.get("/admin/profile", headers=ADMIN).json()["active"]["mode"] == "memory"
+    client.post("/predict_risk", json={"ticker": "AAPL"})
+
+    report = client.delete("/admin/profile", headers=ADMIN).json()
+    assert report["requests"] == 1 and report["top"]
+    folded = open(report["files"][0]).read().splitlines()
+    assert folded and all(line.rsplit(" ", 1)[1].isdigit() for line in folded)
+    assert client.post("/admin/profile", json={"mode": "disk"}, headers=ADMIN).status_code == 400
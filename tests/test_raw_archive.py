@@ -0,0 +1,75 @@
+import os
+from datetime import datetime, timezone
+import pandas as pd
+from ml.raw_archive import (
+    archive_payload, list_payloads, load_payload, parse_alpha_vantage, rebuild_from_archive, yfinance_payload
+)
+
+def _av_payload(dates, close=100.0, split=1.0):
+    return {"Meta Data": {"2. Symbol": "AAPL"}, "Time Series (Daily)": {
+        d: {"1. open": str(close), "2. high": str(close + 1), "3. low": str(close - 1), "4. close": str(close),
+            "5. adjusted close": str(close), "6. volume": "1000", "7. dividend amount": "0.0000",
+            "8. split coefficient": str(split)}
+        for d in dates
+    }}
+
+def test_archive_is_append_only_and_lossless(tmp_path):
+    payload = _av_payload(["2024-01-03", "2024-01-02"])
+    when = datetime(2024, 1, 3, 22, 0, tzinfo=timezone.utc)
+    first = archive_payload("AAPL", "alpha_vantage", payload, when, tmp_path)
+    second = archive_payload("AAPL", "alpha_vantage", payload, when, tmp_path)
+    assert first != second and first.exists()
+    assert first.name == "alpha_vantage_20240103T220000Z_2024-01-02_2024-01-03.json.gz"
+    assert load_payload(first) == payload # adjusted close, dividends and splits included
+    assert [e["path"] for e in list_payloads("AAPL", tmp_path)] == [first, second]
+
+def test_rebuild_merges_payloads_offline(tmp_path):
+    archive, data, clean = tmp_path / "raw", tmp_path / "data", tmp_path / "clean"
+    archive_payload("AAPL", "alpha_vantage", _av_payload(["2024-01-02", "2024-01-03"], 100.0),
+                    datetime(2024, 1, 3, tzinfo=timezone.utc), archive)
+    # A later response restates 2024-01-03 and adds a bar with a split
+    archive_payload("AAPL", "alpha_vantage", _av_payload(["2024-01-03", "2024-01-04"], 50.0, split=2.0),
+                    datetime(2024, 1, 4, tzinfo=timezone.utc), archive)
+    dates = pd.date_range("2024-01-02", periods=2, name="Date", tz="America/New_York")
+    hist = pd.DataFrame({"Open": [10.0, 11.0], "High": 12.0, "Low": 9.0, "Close": [10.5, 11.5],
+                         "Volume": 500, "Dividends": 0.0, "Stock Splits": 0.0}, index=dates)
+    archive_payload("MSFT", "yfinance", yfinance_payload(hist), datetime(2024, 1, 5, tzinfo=timezone.utc), archive)
+    clean.mkdir()
+    (clean / "AAPL.json").write_text("{}")
+
+    results = rebuild_from_archive(workers=2, archive_dir=archive, data_dir=data, clean_dir=clean)
+    assert [(r["ticker"], r["rows"], r["payloads"]) for r in results] == [("AAPL", 3, 2), ("MSFT", 2, 1)]
+
+    aapl = pd.read_csv(data / "AAPL.csv")
+    assert aapl["close"].tolist() == [100.0, 50.0, 50.0]
+    assert aapl["split_coefficient"].tolist() == [1.0, 2.0, 2.0]
+    expected = parse_alpha_vantage(_av_payload(["2024-01-02"], 100.0), "AAPL")
+    assert aapl.columns.tolist() == expected.columns.tolist()
+    assert os.stat(data / "AAPL.csv").st_mtime == datetime(2024, 1, 4, tzinfo=timezone.utc).timestamp()
+    assert not (clean / "AAPL.json").exists()
+
+    msft = pd.read_csv(data / "MSFT.csv")
+    assert msft["close"].tolist() == [10.5, 11.5] and (msft["split_coefficient"] == 1.0).all()
+
+def test_rebuild_never_mixes_sources(tmp_path):
+    archive, data, clean = tmp_path / "raw", tmp_path / "data", tmp_path / "clean"
+    # Unadjusted Alpha Vantage bars with a 2:1 split, then an adjusted yfinance history
+    archive_payload("AAPL", "alpha_vantage", _av_payload(["2024-01-02", "2024-01-03"], 100.0, split=2.0),
+                    datetime(2024, 1, 3, tzinfo=timezone.utc), archive)
+    dates = pd.date_range("2024-01-03", periods=2, name="Date", tz="America/New_York")
+    hist = pd.DataFrame({"Open": 50.0, "High": 51.0, "Low": 49.0, "Close": [50.0, 51.0],
+                         "Volume": 500, "Dividends": 0.0, "Stock Splits": 0.0}, index=dates)
+    for day in [4, 5]:
+        archive_payload("AAPL", "yfinance", yfinance_payload(hist), datetime(2024, 1, day, tzinfo=timezone.utc), archive)
+
+    result = rebuild_from_archive(["AAPL"], workers=1, archive_dir=archive, data_dir=data, clean_dir=clean)[0]
+    assert (result["source"], result["payloads_used"], result["rows"]) == ("yfinance", 1, 2)
+    aapl = pd.read_csv(data / "AAPL.csv")
+    assert aapl["close"].tolist() == [50.0, 51.0] and (aapl["split_coefficient"] == 1.0).all()
+
+    # A newer Alpha Vantage response switches back; only Alpha Vantage bars are used
+    archive_payload("AAPL", "alpha_vantage", _av_payload(["2024-01-04"], 100.0),
+                    datetime(2024, 1, 6, tzinfo=timezone.utc), archive)
+    result = rebuild_from_archive(["AAPL"], workers=1, archive_dir=archive, data_dir=data, clean_dir=clean)[0]
+    assert (result["source"], result["payloads_used"], result["rows"]) == ("alpha_vantage", 2, 3)
+    assert pd.read_csv(data / "AAPL.csv")["split_coefficient"].tolist() == [2.0, 2.0, 1.0]
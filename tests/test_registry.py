@@ -0,0 +1,86 @@
+from ml.registry import ModelRegistry
+
+def _metrics(rmse, acc):
+    return {"regression": {"RMSE": rmse, "MAE": rmse, "R2": 0.0},
+            "classification": {"Accuracy": acc, "F1": acc, "Precision": acc, "Recall": acc},
+            "by_ticker": {"AAPL": {"n_rows": 1}}}
+
+def _registry(tmp_path):
+    models_dir = tmp_path / "models"
+    return ModelRegistry(models_dir / "registry.db", models_dir)
+
+def test_latest_best_and_history(tmp_path):
+    registry = _registry(tmp_path)
+    for day in range(1, 4):
+        (registry.models_dir / f"version_2024010{day}_000000").mkdir(parents=True)
+    registry.register_version("version_20240101_000000", metrics=_metrics(0.02, 0.60), timings={"training": 1.5})
+    registry.register_version("version_20240102_000000", metrics=_metrics(0.01, 0.55), config={"clusters_k": 3})
+    registry.register_version("version_20240103_000000")
+
+    assert registry.latest_version()["version"] == "version_20240103_000000"
+    # The newest version has no metrics yet, so /metrics serves the previous report
+    assert registry.latest_metrics()["classification"]["Accuracy"] == 0.55
+    assert registry.latest_metrics()["by_ticker"] == {"AAPL": {"n_rows": 1}}
+    assert registry.best_version("classification.Accuracy")["version"] == "version_20240101_000000"
+    assert registry.best_version("regression.RMSE", higher_is_better=False)["version"] == "version_20240102_000000"
+
+    history = registry.history(limit=2)
+    assert [r["version"] for r in history] == ["version_20240103_000000", "version_20240102_000000"]
+    assert history[1]["config"] == {"clusters_k": 3}
+
+def test_garbage_collect_keeps_recent_and_pinned(tmp_path):
+    registry = _registry(tmp_path)
+    for day in range(1, 5):
+        version = f"version_2024010{day}_000000"
+        (registry.models_dir / version).mkdir(parents=True)
+        registry.register_version(version)
+    registry.set_pinned("version_20240101_000000")
+
+    removed = registry.garbage_collect(keep_last=2)
+    assert removed == ["version_20240102_000000"]
+    assert not (registry.models_dir / "version_20240102_000000").exists()
+    assert (registry.models_dir / "version_20240101_000000").exists()
+    assert registry.get_version("version_20240102_000000")["deleted"]
+
+def test_sync_from_disk(tmp_path):
+    registry = _registry(tmp_path)
+    for version in ["version_20240101_000000", "version_20240105_000000"]:
+        (registry.models_dir / version).mkdir(parents=True)
+
+    assert registry.sync_from_disk() == 2
+    assert registry.latest_version()["version"] == "version_20240105_000000"
+    assert registry.sync_from_disk() == 0
+
+def test_new_directories_are_synced_and_missing_ones_skipped(tmp_path):
+    import shutil
+    registry = _registry(tmp_path)
+    (registry.models_dir / "version_20240101_000000").mkdir(parents=True)
+    registry.sync_from_disk()
+
+    # Synced although the registry is no longer empty
+    (registry.models_dir / "version_20240102_000000").mkdir()
+    assert registry.sync_from_disk() == 1
+    assert registry.latest_version()["version"] == "version_20240102_000000"
+
+    # Removed by hand: skipped and flagged, and registered again if it comes back
+    shutil.rmtree(registry.models_dir / "version_20240102_000000")
+    assert registry.latest_version()["version"] == "version_20240101_000000"
+    assert registry.get_version("version_20240102_000000")["deleted"]
+    (registry.models_dir / "version_20240102_000000").mkdir()
+    assert registry.sync_from_disk() == 1
+    assert registry.latest_version()["version"] == "version_20240102_000000"
+
+def test_unparseable_names_sort_by_directory_time(tmp_path):
+    import os
+    from datetime import datetime
+    registry = _registry(tmp_path)
+    copy = registry.models_dir / "version_prod_copy"
+    copy.mkdir(parents=True)
+    copied_at = datetime(2025, 6, 1).timestamp()
+    os.utime(copy, (copied_at, copied_at))
+    registry.sync_from_disk()
+    (registry.models_dir / "version_20260101_000000").mkdir()
+    registry.sync_from_disk()
+
+    assert registry.get_version("version_prod_copy")["created_at"] == "2025-06-01T00:00:00"
+    assert registry.latest_version()["version"] == "version_20260101_000000"
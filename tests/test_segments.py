@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+from ml.artifacts import ArtifactStore, write_version, read_version
+from ml.models import FEATURES
+from ml.segments import train_segment_models, attach_segments, SegmentModels
+from app.services import PredictionService
+
+def _frame(n_days=150, seed=0):
+    # Two sectors whose returns respond to return_lag1 with opposite signs
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2022-01-03", periods=n_days)
+    df = pd.concat([pd.DataFrame({"ticker": t, "date": dates}) for t in ["AAA", "BBB", "CCC", "DDD", "EEE"]],
+                   ignore_index=True)
+    n = len(df)
+    for name in FEATURES:
+        df[name] = rng.normal(0, 0.01, n)
+    sign = np.where(df["ticker"].isin(["AAA", "BBB"]), 1.0, -1.0)
+    df["target_return_next_day"] = sign * df["return_lag1"] + rng.normal(0, 0.001, n)
+    df["risk_class"] = (df["volatility_20d"] > 0).astype(int)
+    return df
+
+def _universe(monkeypatch):
+    universe = pd.DataFrame({"ticker": ["AAA", "BBB", "CCC", "DDD", "EEE"],
+                             "sector": ["Tech", "Tech", "Energy", "Energy", "Retail"]})
+    monkeypatch.setattr("ml.universe.load_universe", lambda path=None: universe)
+
+def test_segments_are_trained_in_parallel_and_loaded_on_demand(tmp_path, monkeypatch):
+    _universe(monkeypatch)
+    df = _frame()
+    models = {"regressor": "global-regressor", "classifier": "global-classifier", "features": list(FEATURES)}
+    # Retail has one ticker (150 rows) and falls back to the global models
+    models.update(train_segment_models(df, models, "sector", min_rows=200, workers=2))
+    table = models["segments"]
+    assert sorted(table["segments"]) == ["Energy", "Tech"]
+    assert table["routes"] == {"AAA": "Tech", "BBB": "Tech", "CCC": "Energy", "DDD": "Energy"}
+    assert table["segments"]["Tech"] == {"rows": 300, "tickers": 2}
+
+    store = ArtifactStore(tmp_path / "objects")
+    write_version(tmp_path / "version_1", models, store)
+    loaded = read_version(tmp_path / "version_1", store)
+    assert not [name for name in loaded if name.startswith("segment/")]
+    attach_segments(loaded, tmp_path / "version_1", store)
+
+    service = PredictionService(loaded)
+    assert service.segments.loaded == []
+    regressor, _ = service.models_for("CCC")
+    assert service.segments.loaded == ["Energy"]
+    assert service.models_for("EEE") == ("global-regressor", "global-classifier")
+    assert service.segments.loaded == ["Energy"]
+
+    # Each segment learned its own sign
+    X = pd.DataFrame({name: [0.0] * 2 for name in FEATURES})
+    X["return_lag1"] = [-0.02, 0.02]
+    energy = regressor.predict(X)
+    tech = service.models_for("AAA")[0].predict(X)
+    assert energy[1] < energy[0] and tech[1] > tech[0]
+
+def test_segment_cache_keeps_most_recently_used():
+    loads = []
+    table = {"key": "sector", "routes": {"AAA": "Tech", "CCC": "Energy"},
+             "segments": {"Tech": {"rows": 1, "tickers": 1}, "Energy": {"rows": 1, "tickers": 1}}}
+    segments = SegmentModels(table, lambda name: loads.append(name) or {"name": name}, cache_size=1)
+    assert segments.get("AAA") == {"name": "segment/Tech"}
+    segments.get("AAA")
+    segments.get("CCC")
+    assert segments.loaded == ["Energy"]
+    assert segments.get("ZZZ") is None
+    assert loads == ["segment/Tech", "segment/Energy"]
+
+def test_evaluation_scores_rows_with_their_segment_models(monkeypatch):
+    from ml.evaluation import evaluate_models
+    from ml.models import train_models
+    _universe(monkeypatch)
+    train, test = _frame(), _frame(n_days=40, seed=1)
+    models = train_models(train)
+    models.update(train_segment_models(train, models, "sector", min_rows=200, workers=1))
+
+    metrics = evaluate_models(models, test, n_jobs=2)
+    assert sorted(metrics["by_segment"]) == ["Energy", "Tech", "global"]
+    assert metrics["by_segment"]["global"]["n_rows"] == 40 # Retail is served by the global models
+    for segment in ["Energy", "Tech"]:
+        # The global models cannot fit both signs; each segment's own models can
+        served, baseline = metrics["by_segment"][segment], metrics["global_by_segment"][segment]
+        assert served["n_rows"] == baseline["n_rows"] == 80
+        assert served["regression"]["R2"] > baseline["regression"]["R2"] + 0.3
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+from ml.universe import load_universe, iter_shards
+from ml.feature_store import FeatureStore
+from ml.models import train_models_from_store, FEATURES
+
+def _synthetic_features(n_samples, seed):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({f: rng.normal(0, 0.01, n_samples) for f in FEATURES})
+    df["volatility_20d"] = np.abs(rng.normal(0.02, 0.005, n_samples))
+    df["target_return_next_day"] = 0.5 * df["return_lag1"] + rng.normal(0, 0.005, n_samples)
+    df["risk_class"] = (df["volatility_20d"] > 0.02).astype(int)
+    return df
+
+def test_load_universe_formats(tmp_path):
+    txt = tmp_path / "universe.txt"
+    txt.write_text("aapl\n# comment\nMSFT  # inline\n\naapl\n")
+    assert load_universe(txt)["ticker"].tolist() == ["AAPL", "MSFT"]
+
+    csv = tmp_path / "universe.csv"
+    csv.write_text("Ticker,Sector\nAAPL,Tech\nXOM,Energy\n")
+    universe = load_universe(csv)
+    assert universe["sector"].tolist() == ["Tech", "Energy"]
+
+def test_iter_shards():
+    shards = list(iter_shards([f"T{i}" for i in range(7)], shard_size=3))
+    assert [len(s) for s in shards] == [3, 3, 1]
+
+def test_train_models_from_store(tmp_path):
+    store = FeatureStore(tmp_path / "train")
+    for i in range(3):
+        store.write_partition(f"shard_{i:05d}", _synthetic_features(150, seed=i))
+
+    models = train_models_from_store(store)
+
+    df = _synthetic_features(200, seed=99)
+    assert models["regressor"].n_estimators_ > 0
+    assert models["classifier"].score(df[models["features"]], df["risk_class"]) > 0.7
+    assert models["kmeans"].predict(models["pca"].transform(df[models["features"]])).shape == (200,)
+
+def test_store_classifier_keeps_every_risk_class(tmp_path):
+    def three_classes(df):
+        df["risk_class"] = np.digitize(df["volatility_20d"], [0.017, 0.023])
+        return df
+
+    store = FeatureStore(tmp_path / "train")
+    # The first partition has no High rows; later ones do
+    first = three_classes(_synthetic_features(300, seed=0))
+    store.write_partition("shard_00000", first[first["risk_class"] < 2])
+    for i in range(1, 3):
+        store.write_partition(f"shard_{i:05d}", three_classes(_synthetic_features(300, seed=i)))
+
+    models = train_models_from_store(store, memory_budget_mb=0.01)
+    assert models["classifier"].classes_.tolist() == [0, 1, 2]
+    df = three_classes(_synthetic_features(300, seed=99))
+    assert models["classifier"].score(df[models["features"]], df["risk_class"]) > 0.7
+
+def test_store_training_includes_horizon_models(tmp_path, monkeypatch):
+    monkeypatch.setattr("ml.models.HORIZONS", [1, 5])
+    store = FeatureStore(tmp_path / "train")
+    for i in range(3):
+        df = _synthetic_features(300, seed=i)
+        for h in [1, 5]:
+            df[f"target_return_{h}d"] = h * df["return_lag1"]
+            df[f"risk_class_{h}d"] = df["risk_class"]
+            # The forward window runs past the partition's last rows
+            df.loc[df.index[-h:], [f"target_return_{h}d", f"risk_class_{h}d"]] = np.nan
+        store.write_partition(f"shard_{i:05d}", df)
+
+    models = train_models_from_store(store, memory_budget_mb=0.01)
+    assert sorted(models["horizon_models"]) == [1, 5]
+    assert models["horizon_models"][1]["regressor"] is models["regressor"]
+    df = _synthetic_features(300, seed=99)
+    X = df[models["features"]]
+    assert models["horizon_models"][5]["classifier"].score(X, df["risk_class"]) > 0.7
+    assert np.corrcoef(models["horizon_models"][5]["regressor"].predict(X), 5 * df["return_lag1"])[0, 1] > 0.8
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import PCA
+from sklearn.dummy import DummyClassifier
+from ml.models import FEATURES
+from ml.similarity import RandomProjectionForest, SimilarityIndex, build_similarity_index
+
+def test_forest_finds_nearest_neighbours():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(5000, 6))
+    forest = RandomProjectionForest(n_trees=16, leaf_size=32).fit(X)
+
+    recall = 0.0
+    for q in rng.normal(size=(50, 6)):
+        exact = np.argsort(((X - q) ** 2).sum(axis=1))[:10]
+        idx, dist = forest.query(q, 10)
+        assert (np.diff(dist) >= 0).all()
+        recall += len(set(exact) & set(idx)) / 10
+    assert recall / 50 > 0.9
+    # A stored point is its own nearest neighbour
+    assert forest.query(X[123], 1)[0][0] == 123
+
+def test_similarity_index_ranks_by_behaviour():
+    rng = np.random.default_rng(1)
+    frames = []
+    for i, ticker in enumerate(["CALM1", "CALM2", "WILD1", "WILD2", "MID"]):
+        scale = {"C": 0.005, "W": 0.05, "M": 0.02}[ticker[0]]
+        frame = pd.DataFrame(rng.normal(0, scale, (40, len(FEATURES))), columns=FEATURES)
+        frame["ticker"] = ticker
+        frame["date"] = pd.bdate_range("2024-01-01", periods=40)
+        frames.append(frame)
+    df = pd.concat(frames, ignore_index=True)
+    models = {
+        "features": FEATURES,
+        "pca": PCA(n_components=3).fit(df[FEATURES]),
+        "classifier": DummyClassifier(strategy="constant", constant=1).fit(df[FEATURES], np.ones(len(df)))
+    }
+
+    index = build_similarity_index(models, df)
+    assert "CALM1" in index and index.risk_classes["WILD1"] == 1
+    neighbours = index.query(index.vector("CALM1"), k=2, exclude="CALM1")
+    assert neighbours[0][0] == "CALM2"
+    assert len(neighbours) == 2 and neighbours[0][1] <= neighbours[1][1]
+
+    # The approximate path returns the same nearest neighbour
+    embeddings = pd.DataFrame(index.vectors * index.scale, index=index.tickers)
+    approx = SimilarityIndex(embeddings, exact_below=1)
+    assert approx.forest is not None
+    assert approx.query(approx.vector("WILD1"), k=1, exclude="WILD1")[0][0] == "WILD2"
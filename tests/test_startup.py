@@ -0,0 +1,42 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock
+import numpy as np
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parent.parent
+# Seconds allowed for a fresh interpreter to import the API (measured ~0.6s)
+IMPORT_BUDGET_S = 1.5
+HEAVY_MODULES = ["yfinance", "requests", "deepchecks", "sklearn"]
+
+def _import_app():
+    code = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "import app.main\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"print(json.dumps({{'elapsed': elapsed, 'loaded': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def test_app_import_is_lazy_and_within_budget():
+    # Best of three runs to smooth out a noisy machine
+    runs = [_import_app() for _ in range(3)]
+    assert runs[0]["loaded"] == []
+    assert min(run["elapsed"] for run in runs) < IMPORT_BUDGET_S
+
+def test_lifespan_loads_and_warms_models(mocker):
+    from app.main import app
+    models = {name: MagicMock() for name in ["regressor", "classifier", "pca", "kmeans"]}
+    models["features"] = ["f1", "f2"]
+    models["classifier"].predict_proba.return_value = np.array([[0.5, 0.3, 0.2]])
+    mocker.patch("app.main.get_models", return_value=models)
+
+    with TestClient(app):
+        X = models["regressor"].predict.call_args[0][0]
+        assert list(X.columns) == ["f1", "f2"] and len(X) == 1
+        models["classifier"].predict_proba.assert_called_once()
+        models["kmeans"].predict.assert_called_once()
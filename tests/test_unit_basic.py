@@ -1,6 +1,7 @@
 import pandas as pd
+import numpy as np
 import pytest
-from ml.feature_engineering import create_features, split_data
+from ml.feature_engineering import create_features, split_data, compute_risk_thresholds
 
 def test_feature_creation():
     # Create dummy data
@@ -41,4 +42,71 @@ def test_split_data():
     assert len(test) == 10
     assert len(train) == 90
 
+def test_split_data_cuts_every_ticker_on_the_same_date():
+    # create_features sorts by ticker; a row cut would leave the test split one ticker
+    dates = pd.date_range(start="2023-01-01", periods=100)
+    df = pd.concat([pd.DataFrame({"ticker": t, "date": dates, "target_return_next_day": 0.0, "risk_class": 1})
+                    for t in ["AAA", "BBB", "CCC"]], ignore_index=True)
+    train, test = split_data(df, test_size=20)
+    assert test.groupby("ticker").size().to_dict() == {"AAA": 20, "BBB": 20, "CCC": 20}
+    assert train["date"].max() < test["date"].min()
 
+
+
+def test_inference_mode_skips_targets():
+    data = {
+        "ticker": ["ABC"] * 50,
+        "date": pd.date_range(start="2023-01-01", periods=50),
+        "close": [100 + (i % 7) for i in range(50)]
+    }
+    df = pd.DataFrame(data)
+
+    df_train = create_features(df)
+    df_infer = create_features(df, inference=True)
+
+    for col in ["future_vol", "target_return_next_day", "risk_class"]:
+        assert col not in df_infer.columns
+    # Same feature rows, including the most recent bar
+    assert df_infer["date"].iloc[-1] == df_train["date"].iloc[-1]
+    pd.testing.assert_series_equal(df_infer["volatility_20d"], df_train["volatility_20d"])
+
+def test_persisted_risk_thresholds():
+    data = {
+        "ticker": ["ABC"] * 60,
+        "date": pd.date_range(start="2023-01-01", periods=60),
+        "close": [100 + (i % 7) * (1 + i / 30) for i in range(60)]
+    }
+    df_features = create_features(pd.DataFrame(data))
+    train, _ = split_data(df_features, test_size=0.2)
+
+    thresholds = compute_risk_thresholds(train)
+    assert thresholds["low"] <= thresholds["high"]
+
+    relabelled = create_features(pd.DataFrame(data), risk_thresholds=thresholds)
+    labelled = relabelled.dropna(subset=["future_vol"])
+    expected = (labelled["future_vol"] > thresholds["low"]).astype(int) + (labelled["future_vol"] > thresholds["high"]).astype(int)
+    assert (labelled["risk_class"] == expected).all()
+
+def test_horizon_targets():
+    close = [100 * (1.01 ** i) * (1 + 0.02 * (i % 3)) for i in range(80)]
+    data = {
+        "ticker": ["ABC"] * 80,
+        "date": pd.date_range(start="2023-01-01", periods=80),
+        "close": close
+    }
+    df_features = create_features(pd.DataFrame(data)).set_index("date")
+    raw = pd.Series(close, index=data["date"])
+    returns = raw.pct_change()
+
+    for h in [1, 5, 20]:
+        expected_return = raw.shift(-h) / raw - 1
+        pd.testing.assert_series_equal(df_features[f"target_return_{h}d"], expected_return.loc[df_features.index],
+                                       check_names=False)
+        expected_vol = np.sqrt((returns ** 2).rolling(h).mean().shift(-h))
+        pd.testing.assert_series_equal(df_features[f"future_vol_{h}d"], expected_vol.loc[df_features.index],
+                                       check_names=False, check_freq=False)
+        assert df_features[f"risk_class_{h}d"].dropna().isin([0, 1, 2]).all()
+    # The risk label is the 5-day horizon's volatility, so /predict_risk and the 5d horizon agree
+    pd.testing.assert_series_equal(df_features["future_vol"], df_features["future_vol_5d"], check_names=False)
+    # The forward window runs past the end of the data for the last h rows
+    assert df_features["target_return_20d"].iloc[-20:].isna().all()